@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Benchmark of the types of data serialization: bytes sent within the Kodi JSON-RPC call,
+    and the time to serialize and deserialize the data, with different payload sizes
+
+    Usage: PYTHONPATH=lib:tests python benchmarks/bench_codecs.py
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import json
+from timeit import repeat
+
+import helper
+
+SER_TYPES = [helper.SER_TYPE_PICKLE, helper.SER_TYPE_PICKLE_COMPACT, helper.SER_TYPE_JSON]
+PAYLOAD_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def make_payload(items_count):
+    """Return a list of dicts, similar to the data of a Kodi directory listing"""
+    return [{'label': 'Föóbàr item {}'.format(idx),
+             'path': 'plugin://plugin.video.foobar/?action=play&id={}'.format(idx),
+             'info': {'year': 2000 + idx % 20, 'rating': idx / 7, 'genre': ['Drama', 'Comedy']}}
+            for idx in range(items_count)]
+
+
+def best_time(func, number):
+    """Return the best time in ms of a single execution"""
+    return min(repeat(func, number=number, repeat=3)) / number * 1000
+
+
+def main():
+    # All the data must be sent within the Kodi JSON-RPC call
+    helper.set_large_payload_threshold(0)
+    print('{:>8} {:>14} {:>12} {:>12} {:>12}'.format('items', 'ser_type', 'wire bytes', 'encode ms', 'decode ms'))
+    for items_count in PAYLOAD_SIZES:
+        payload = make_payload(items_count)
+        number = max(1, 10000 // items_count)
+        for ser_type in SER_TYPES:
+            serialized = helper.serialize_data(ser_type, payload)
+            received = json.dumps(serialized)  # The data are received from the Kodi notification as JSON string
+            encode_time = best_time(lambda: helper.serialize_data(ser_type, payload), number)  # pylint: disable=cell-var-from-loop
+            decode_time = best_time(lambda: helper.deserialize_data(ser_type, received), number)  # pylint: disable=cell-var-from-loop
+            print('{:>8} {:>14} {:>12} {:>12.3f} {:>12.3f}'.format(items_count, ser_type, len(serialized),
+                                                                   encode_time, decode_time))
+
+
+if __name__ == '__main__':
+    main()
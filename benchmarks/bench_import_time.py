@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Benchmark of the import time of the addonconnector module, measured with 'python -X importtime'
+    on new interpreters (the Kodi plugins are executed on a new interpreter for each invocation)
+
+    Usage: PYTHONPATH=lib:tests python benchmarks/bench_import_time.py [runs_count]
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import os
+import subprocess
+import sys
+
+from benchutils import percentile
+
+# The Kodi modules are imported before the measurement, on Kodi they are built-in modules
+IMPORT_SCRIPT = 'import xbmc, xbmcaddon, addonconnector'
+
+
+def measure_import_times():
+    """Import the module on a new interpreter, return the cumulative import times in microseconds by module name"""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT], env=env, check=True,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    import_times = {}
+    collect = False
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, module_name = line.split('|')
+        if module_name.strip() == 'xbmcaddon':
+            # The next lines are the modules imported by addonconnector
+            collect = True
+            continue
+        if collect:
+            import_times[module_name.strip()] = int(cumulative)
+    return import_times
+
+
+def main():
+    runs_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    measure_import_times()  # Write the bytecode
+    runs = [measure_import_times() for _ in range(runs_count)]
+    print('Import time of addonconnector on {} runs (cumulative time in microseconds)'.format(runs_count))
+    for module_name in runs[-1]:
+        times = sorted(run[module_name] for run in runs if module_name in run)
+        print('{:<20} p50 {:>7}  p90 {:>7}'.format(module_name, percentile(times, 50), percentile(times, 90)))
+
+
+if __name__ == '__main__':
+    main()
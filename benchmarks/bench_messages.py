@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Benchmark of the building of the messages of the RPC calls (the Kodi JSON-RPC commands),
+    the messages built from the prebuilt MessageTemplate of the CallConfig are compared
+    to the old building, that formatted the whole JSON-RPC command on each call
+
+    Usage: PYTHONPATH=lib:tests python benchmarks/bench_messages.py [messages_count]
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+# pylint: disable=invalid-name,protected-access
+import sys
+from time import perf_counter
+
+from benchutils import load_connector_instances
+
+ac_sender, _ = load_connector_instances()
+
+
+def legacy_build(call_config, call_id, data):
+    """The old building, that formatted the whole JSON-RPC command"""
+    get_addon_id = ac_sender.get_addon_id
+    return ac_sender.JSONRPC_NOTIFYALL_STR.format(
+        callback_name=call_config.callback_name,
+        ser_type=call_config.ser_type,
+        ser_type_return=call_config.ser_type_return,
+        call_id=call_id,
+        sender_id='{}{}{}'.format(call_config.addon_id or get_addon_id(), ac_sender.CALLER_ID_SEPARATOR,
+                                  get_addon_id()),
+        sender_id_suffix=ac_sender.SENDER_ID_SUFFIX,
+        data=data
+    )
+
+
+def run(count):
+    call_cfg = ac_sender.CallConfig('callback_benchmark', addon_id='service.benchmark.id')
+    call_ids = [ac_sender.pack_call_id(ac_sender.new_call_id(), 1600000000.123) for _ in range(100)]
+    data = ac_sender.serialize_data(ac_sender.SER_TYPE_PICKLE, (({'id': 123, 'title': 'Foobar'},), {}))
+    assert call_cfg.message_template.build(call_ids[0], data) == legacy_build(call_cfg, call_ids[0], data)
+    start_time = perf_counter()
+    for index in range(count):
+        call_cfg.message_template.build(call_ids[index % 100], data)
+    template_elapsed = perf_counter() - start_time
+    start_time = perf_counter()
+    for index in range(count):
+        legacy_build(call_cfg, call_ids[index % 100], data)
+    legacy_elapsed = perf_counter() - start_time
+    # The whole sending of a signal call, without the Kodi JSON-RPC call
+    execute_jsonrpc = ac_sender.executeJSONRPC
+    ac_sender.executeJSONRPC = len
+    try:
+        start_time = perf_counter()
+        for _ in range(count):
+            ac_sender.make_signal_call(call_cfg, {'id': 123, 'title': 'Foobar'})
+        signal_elapsed = perf_counter() - start_time
+    finally:
+        ac_sender.executeJSONRPC = execute_jsonrpc
+    return {
+        'count': count,
+        'template_messages_per_sec': count / template_elapsed,
+        'legacy_messages_per_sec': count / legacy_elapsed,
+        'signal_calls_per_sec': count / signal_elapsed
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    results = run(count)
+    print('Building of {} messages'.format(count))
+    print('Message template: {:.0f} messages/sec'.format(results['template_messages_per_sec']))
+    print('Legacy format:    {:.0f} messages/sec'.format(results['legacy_messages_per_sec']))
+    print('Signal calls (serialization included): {:.0f} calls/sec'.format(results['signal_calls_per_sec']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Benchmark of the routing of the notifications received by the CallReceiver, with a mix of notifications
+    not addressed to the add-on connector, calls to the registered callbacks and calls to not registered callbacks.
+    The routing made with the cached routes is compared to the same routing that parse the route of each
+    notification, and to the routing of the baseline version (that had less features to parse)
+
+    Usage: PYTHONPATH=lib:tests python benchmarks/bench_routing.py [notifications_count]
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+# pylint: disable=invalid-name,protected-access
+import sys
+from functools import partial
+from time import perf_counter
+
+from benchutils import load_connector_instances
+
+_, ac_service = load_connector_instances()
+ADDON_ID = ac_service.get_addon_id()
+RETURN_CALL_PREFIX = ac_service.RETURN_CALL_PREFIX
+SER_TYPE_STRING = ac_service.SER_TYPE_STRING
+SER_TYPE_NONE = ac_service.SER_TYPE_NONE
+SENDER = ADDON_ID + ac_service.CALLER_ID_SEPARATOR + 'plugin.caller.id' + ac_service.SENDER_ID_SUFFIX
+
+
+def callback_noop(*args, **kwargs):
+    pass
+
+
+def baseline_on_notification(slots, sender, method, data):
+    """
+    The routing of the baseline version of CallReceiver.onNotification (without the logging of the internal errors),
+    that parsed each notification and looked up the nested dict of the slots. The methods of the baseline had not
+    the call ID, and the senders had not the caller ID
+    """
+    if not sender.endswith(ac_service.SENDER_ID_SUFFIX):
+        return
+    # Get the addon id
+    addon_id, _ = sender.rsplit('.', 1)
+    if addon_id not in slots:
+        return
+    # Get the callback name and type of data serializations
+    # 'method' have a value like: 'Other.theCallbackName.sertype.sertype_return'
+    _, callback_name, ser_type, ser_type_return = method.split('.')
+    if callback_name not in slots[addon_id]:
+        return
+    # Save the serialization type for a possible automatic RPC return call
+    slots[addon_id][callback_name]['ser_type_return'] = ser_type_return
+    # Get the add-on function, bound to the callback_name
+    func = slots[addon_id][callback_name]['callback_func']
+    # Deserialize the data according to the specified serialisation type
+    if callback_name.startswith(RETURN_CALL_PREFIX) or ser_type in [SER_TYPE_STRING, SER_TYPE_NONE]:
+        args = (ac_service.deserialize_data(ser_type, data),)
+        kwargs = {}
+    else:
+        args, kwargs = ac_service.deserialize_data(ser_type, data)
+    # Execute the function
+    if slots[addon_id][callback_name]['run_threaded']:
+        from threading import Thread
+        Thread(target=func, args=args, kwargs=kwargs).start()
+    else:
+        func(*args, **kwargs)
+
+
+class RoutesNotCached(dict):
+    """The cache of the routes always empty, so that the route of each notification is parsed again"""
+    def get(self, key, default=None):
+        return default
+
+
+def build_notifications(count, kind, is_baseline=False):
+    """
+    Build the notifications of a kind: Kodi events, calls to registered callbacks, calls to unknown callbacks,
+    or a mix of 80% Kodi events, 15% calls to registered callbacks and 5% calls to unknown callbacks
+    :param is_baseline: if True the calls have the format of the baseline version, without caller ID and call ID
+    """
+    kodi_events = [('xbmc', 'Player.OnPlay'), ('xbmc', 'Player.OnPause'), ('xbmc', 'VideoLibrary.OnUpdate'),
+                   ('xbmc', 'GUI.OnScreensaverActivated')]
+    sender = ADDON_ID + ac_service.SENDER_ID_SUFFIX if is_baseline else SENDER
+    method_format = 'Other.{}_{}.none.none' if is_baseline else 'Other.{}_{}.none.none.{}'
+    notifications = []
+    for index in range(count):
+        perc = {'kodi': 0, 'calls': 16, 'unknown': 19}.get(kind, index % 20)
+        if perc < 16:
+            notifications.append(kodi_events[index % len(kodi_events)])
+        elif perc < 19:
+            notifications.append((sender, method_format.format('callback', index % 10, index)))
+        else:
+            notifications.append((sender, method_format.format('unknown', index % 10, index)))
+    return notifications
+
+
+def measure(func, notifications, repeat=5):
+    """Return the notifications routed per second, the best of more repetitions"""
+    best_elapsed = None
+    for _ in range(repeat):
+        start_time = perf_counter()
+        for sender, method in notifications:
+            func(sender, method, '""')
+        elapsed = perf_counter() - start_time
+        best_elapsed = elapsed if best_elapsed is None else min(best_elapsed, elapsed)
+    return len(notifications) / best_elapsed
+
+
+def run(count, kind):
+    receiver = ac_service._receiver()
+    baseline_slots = {ADDON_ID: {}}
+    for index in range(10):
+        callback_name = 'callback_{}'.format(index)
+        receiver.router.register_slot(callback_name, callback_noop, ADDON_ID, use_thread=False)
+        baseline_slots[ADDON_ID][callback_name] = {'callback_func': callback_noop, 'run_threaded': False}
+    notifications = build_notifications(count, kind)
+    try:
+        cached_routes = measure(receiver.onNotification, notifications)
+        receiver.router._routes = RoutesNotCached()
+        not_cached_routes = measure(receiver.onNotification, notifications)
+    finally:
+        receiver.router.unregister_slots(ADDON_ID)
+    baseline_notifications = build_notifications(count, kind, is_baseline=True)
+    baseline_routing = measure(partial(baseline_on_notification, baseline_slots), baseline_notifications)
+    return {
+        'count': count,
+        'cached_routes_per_sec': cached_routes,
+        'not_cached_routes_per_sec': not_cached_routes,
+        'baseline_routing_per_sec': baseline_routing
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('Routing of {} notifications (notifications/sec)'.format(count))
+    print('{:>8} {:>14} {:>14} {:>14}'.format('kind', 'cached routes', 'not cached', 'baseline'))
+    for kind in ('kodi', 'calls', 'unknown', 'mix'):
+        results = run(count, kind)
+        print('{:>8} {:>14.0f} {:>14.0f} {:>14.0f}'.format(
+            kind, results['cached_routes_per_sec'], results['not_cached_routes_per_sec'],
+            results['baseline_routing_per_sec']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Benchmark of the make_call round-trip time, with the wait of the RPC return call based on the sleep polling
+    (the old implementation) compared to the wait based on the event signaled by the return callback
+
+    Usage: PYTHONPATH=lib:tests python benchmarks/bench_wait_latency.py [calls_count]
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+# pylint: disable=invalid-name,protected-access
+import sys
+from time import perf_counter, sleep
+
+from benchutils import load_connector_instances, percentile
+
+ac_sender, ac_service = load_connector_instances()
+
+
+class PollingCallHandler(ac_sender.CallHandler):
+    """The old implementation of the wait, that check the return call every 10 ms"""
+    def wait_rpc_return_call(self):
+        from xbmc import sleep as xbmc_sleep
+        receiver = ac_sender._receiver()
+        end_time = perf_counter() + self.call_config.timeout_secs
+        while not self._event_return_call.is_set():
+            if perf_counter() > end_time:
+                receiver.calls.remove_pending_call(self)
+                raise ac_sender.WaitTimeoutError
+            if receiver.abortRequested():
+                raise ac_sender.OperationAbortedError
+            xbmc_sleep(10)
+        receiver.calls.remove_pending_call(self)
+        return self._callback_data
+
+
+def callback_echo(value):
+    # Simulate a minimal work time of the callback, so the return call is never sent before the caller starts the wait
+    sleep(0.001)
+    return value
+
+
+def run(handler_class, calls_count):
+    """Make the calls and return the sorted list of the round-trip times in ms"""
+    call_cfg = ac_sender.CallConfig('callback_echo')
+    times = []
+    for idx in range(calls_count):
+        start_time = perf_counter()
+        handler_class(call_cfg, (idx,), {}).wait_rpc_return_call()
+        times.append((perf_counter() - start_time) * 1000)
+    return sorted(times)
+
+
+def main():
+    calls_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # The callbacks run in a thread, so the caller really needs to wait the RPC return call
+    ac_service.use_multithread(True)
+    ac_service.register_callback(callback_echo)
+    print('Round-trip time of {} calls to a threaded callback (ms):'.format(calls_count))
+    for name, handler_class in (('sleep polling', PollingCallHandler), ('event', ac_sender.CallHandler)):
+        times = run(handler_class, calls_count)
+        print('{:>14}: p50 {:8.3f}  p99 {:8.3f}  max {:8.3f}'.format(
+            name, percentile(times, 50), percentile(times, 99), times[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Common functions for the benchmarks
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import sys
+
+
+def load_connector_instances(addon_id='plugin.benchmark.id'):
+    """
+    Return two different instances of the addonconnector module, one for the sender and one for the service,
+    so the calls are received by the service instance like on the unit tests
+    """
+    import addonconnector as ac_sender
+    del sys.modules['addonconnector']
+    import addonconnector as ac_service
+    xbmcaddon = __import__('xbmcaddon')
+    xbmcaddon.ADDON_ID = addon_id
+    return ac_sender, ac_service
+
+
+def percentile(values, perc):
+    """Return the percentile (nearest-rank method) of a sorted list"""
+    index = max(0, int(round(perc / 100 * len(values))) - 1)
+    return values[index]
+
+
+def latency_stats(times):
+    """Return the statistics of a list of latencies in seconds, the values are converted to ms"""
+    times = sorted(times)
+    total_time = sum(times)
+    return {
+        'count': len(times),
+        'throughput_per_sec': len(times) / total_time if total_time else None,
+        'p50_ms': percentile(times, 50) * 1000,
+        'p90_ms': percentile(times, 90) * 1000,
+        'p99_ms': percentile(times, 99) * 1000,
+        'max_ms': times[-1] * 1000
+    }
+
+
+def measure_peak_memory(func):
+    """Return the peak of the memory allocated (in bytes) by executing the function"""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Load test of the make_call between add-ons running in separate processes, through a stand-in of the Kodi
+    notification bus with delivery latency and jitter (see tests/kodibus.py).
+    Report the throughput, the tail latency, the timeouts and the lost calls and returns
+    at different numbers of concurrent callers.
+
+    Usage: PYTHONPATH=lib:tests python benchmarks/load_test.py [--callers 1,10,100] [--calls N]
+                                                               [--latency MS] [--jitter MS] [--loss RATE]
+                                                               [--output results.json]
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import argparse
+import json
+
+from kodibus import run_load_test
+
+COLUMNS = ('callers', 'calls', 'completed', 'timeouts', 'errors', 'lost_calls', 'lost_returns', 'throughput_per_sec',
+           'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the addon connector calls between processes')
+    parser.add_argument('--callers', default='1,10,100', help='comma separated numbers of concurrent callers')
+    parser.add_argument('--calls', type=int, default=50, help='number of calls made by each caller')
+    parser.add_argument('--latency', type=float, default=2, help='delivery latency of the notifications in ms')
+    parser.add_argument('--jitter', type=float, default=1, help='maximum random variation of the latency in ms')
+    parser.add_argument('--loss', type=float, default=0, help='probability that a notification is lost')
+    parser.add_argument('--timeout', type=float, default=10, help='timeout of the calls in seconds')
+    parser.add_argument('--output', help='path of the JSON file where save the results')
+    args = parser.parse_args()
+    print(' '.join('{:>12}'.format(column) for column in COLUMNS))
+    results = []
+    for callers_count in [int(value) for value in args.callers.split(',')]:
+        stats = run_load_test(callers_count, args.calls, args.latency / 1000, args.jitter / 1000, args.loss,
+                              args.timeout)
+        results.append(stats)
+        print(' '.join('{:>12.1f}'.format(stats[column]) if isinstance(stats.get(column), float)
+                       else '{:>12}'.format(str(stats.get(column, '-'))) for column in COLUMNS))
+    if args.output:
+        with open(args.output, 'w') as file_handle:
+            json.dump(results, file_handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Benchmark suite of the data serialization and of the make_call round trips (through the xbmc stub),
+    with different types of data serialization and payload shapes.
+    The results are reported as JSON, to allow the comparison between the releases.
+
+    Usage: PYTHONPATH=lib:tests python benchmarks/suite.py [--iterations N] [--output results.json]
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import argparse
+import json
+import platform
+import sys
+from time import perf_counter, time
+
+from benchutils import latency_stats, load_connector_instances, measure_peak_memory
+
+ac_sender, ac_service = load_connector_instances()
+
+
+class Item:
+    """An object used for the nested objects payload"""
+    def __init__(self, name, children=None):
+        self.name = name
+        self.children = children or []
+
+
+def _nested_items(depth, width):
+    if not depth:
+        return Item('leaf')
+    return Item('node {}'.format(depth), [_nested_items(depth - 1, width) for _ in range(width)])
+
+
+# Payload shapes, with the types of data serialization that can serialize them
+PAYLOADS = {
+    'small_dict': (lambda: {'id': 123, 'title': 'Foobar', 'year': 2021, 'watched': False},
+                   [ac_sender.SER_TYPE_PICKLE, ac_sender.SER_TYPE_PICKLE_COMPACT, ac_sender.SER_TYPE_JSON]),
+    'large_list': (lambda: [{'label': 'Item {}'.format(idx), 'path': 'plugin://plugin.video.foobar/?id={}'.format(idx),
+                             'rating': idx / 7} for idx in range(5000)],
+                   [ac_sender.SER_TYPE_PICKLE, ac_sender.SER_TYPE_PICKLE_COMPACT, ac_sender.SER_TYPE_JSON]),
+    'nested_objects': (lambda: _nested_items(5, 4),
+                       [ac_sender.SER_TYPE_PICKLE, ac_sender.SER_TYPE_PICKLE_COMPACT]),
+    'unicode_string': (lambda: 'Föóbàr ԜՕȐŁǷ 日本語テキスト ' * 500,
+                       [ac_sender.SER_TYPE_PICKLE, ac_sender.SER_TYPE_PICKLE_COMPACT, ac_sender.SER_TYPE_JSON,
+                        ac_sender.SER_TYPE_STRING]),
+    'exception': (lambda: ValueError('Föóbàr error', 404),
+                  [ac_sender.SER_TYPE_PICKLE, ac_sender.SER_TYPE_PICKLE_COMPACT])
+}
+
+
+def callback_echo(data):
+    if isinstance(data, Exception):
+        raise data
+    return data
+
+
+def bench_serialization(payload, ser_type, iterations):
+    """Benchmark the serialization and deserialization of the data"""
+    serialized = ac_sender.serialize_data(ser_type, payload)
+    received = json.dumps(serialized)  # The data are received from the Kodi notification as JSON string
+    encode_times = []
+    decode_times = []
+    for _ in range(iterations):
+        start_time = perf_counter()
+        ac_sender.serialize_data(ser_type, payload)
+        encode_times.append(perf_counter() - start_time)
+        start_time = perf_counter()
+        ac_sender.deserialize_data(ser_type, received)
+        decode_times.append(perf_counter() - start_time)
+    return {
+        'wire_bytes': len(serialized),
+        'serialize': latency_stats(encode_times),
+        'deserialize': latency_stats(decode_times),
+        'peak_memory_bytes': measure_peak_memory(
+            lambda: ac_sender.deserialize_data(ser_type, ac_sender.serialize_data(ser_type, payload)))
+    }
+
+
+def bench_make_call(payload, ser_type, iterations):
+    """Benchmark the round trip of make_call"""
+    call_cfg = ac_sender.CallConfig('callback_echo', ser_type=ser_type, ser_type_return=ser_type)
+
+    def make_call():
+        try:
+            ac_sender.make_call(call_cfg, payload)
+        except ValueError:
+            pass
+
+    times = []
+    for _ in range(iterations):
+        start_time = perf_counter()
+        make_call()
+        times.append(perf_counter() - start_time)
+    return {
+        'round_trip': latency_stats(times),
+        'peak_memory_bytes': measure_peak_memory(make_call)
+    }
+
+
+def run(iterations):
+    """Run all benchmarks and return the results"""
+    # All the data must be sent within the Kodi JSON-RPC call
+    ac_sender.set_large_payload_threshold(0)
+    ac_service.register_callback(callback_echo)
+    results = []
+    for payload_name, (payload_factory, ser_types) in PAYLOADS.items():
+        payload = payload_factory()
+        for ser_type in ser_types:
+            results.append({
+                'payload': payload_name,
+                'ser_type': ser_type,
+                'serialization': bench_serialization(payload, ser_type, iterations),
+                'make_call': bench_make_call(payload, ser_type, iterations)
+            })
+            print('{} with {}: done'.format(payload_name, ser_type), file=sys.stderr)
+    return {
+        'timestamp': int(time()),
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': iterations,
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite of the addon connector')
+    parser.add_argument('--iterations', type=int, default=100, help='number of iterations of each benchmark')
+    parser.add_argument('--output', help='path of the JSON file where save the results (default: stdout)')
+    args = parser.parse_args()
+    results = json.dumps(run(args.iterations), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file_handle:
+            file_handle.write(results)
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
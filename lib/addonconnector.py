@@ -7,25 +7,164 @@
     SPDX-License-Identifier: LGPL-2.1-or-later
     See LICENSE.txt for more information.
 """
-__all__ = ['AddonConnectorException', 'CallConfig', 'deserialize_data', 'get_addon_id', 'JSONRPC_NOTIFYALL_STR',
-           'OperationAbortedError', 'RETURN_CALL_PREFIX', 'SER_TYPE_JSON', 'SER_TYPE_NONE', 'SER_TYPE_PICKLE',
-           'SER_TYPE_STRING', 'serialize_data', 'WaitTimeoutError']
+__all__ = ['AddonConnectorException', 'ADMISSION_DROP_OLDEST', 'ADMISSION_QUEUE', 'ADMISSION_REJECT',
+           'CallbackNotFoundError', 'CallCancelledError', 'CallConfig', 'CallRejectedError', 'CallThrottledError',
+           'CancelToken', 'Codec', 'deserialize_data', 'get_addon_id', 'get_cancel_token', 'JSONRPC_NOTIFYALL_STR',
+           'OperationAbortedError', 'register_codec', 'RETURN_CALL_PREFIX', 'SER_TYPE_BYTES', 'SER_TYPE_JSON',
+           'SER_TYPE_NONE', 'SER_TYPE_PICKLE', 'SER_TYPE_PICKLE_COMPACT', 'SER_TYPE_PICKLE_OOB', 'SER_TYPE_STRING',
+           'serialize_data', 'ServiceNotReadyError', 'set_large_payload_threshold', 'SignalBatcher', 'WaitTimeoutError']
 
-from typing import Tuple
+from xbmc import Monitor, log, LOGERROR
 
-from xbmc import executeJSONRPC, Monitor, sleep, log, LOGERROR
+import metrics
 
 from helper import (SER_TYPE_PICKLE, SER_TYPE_JSON, SER_TYPE_STRING, JSONRPC_NOTIFYALL_STR, serialize_data,
                     deserialize_data, CallConfig, RETURN_CALL_PREFIX, AddonConnectorException, WaitTimeoutError,
-                    OperationAbortedError, get_addon_id, SER_TYPE_NONE, SENDER_ID_SUFFIX)
+                    OperationAbortedError, get_addon_id, SER_TYPE_NONE, SENDER_ID_SUFFIX, new_call_id, BATCH_CALL_NAME,
+                    CallRejectedError, MAX_WORKERS, MAX_QUEUE_SIZE, set_large_payload_threshold, encode_data,
+                    decode_data, SER_TYPE_PICKLE_COMPACT, Codec, register_codec, CACHE_INVALIDATION_NAME,
+                    STREAM_CHUNK_SIZE, CANCEL_CALL_NAME, CancelToken, CallCancelledError, pack_call_id, unpack_call_id,
+                    get_cancel_token, get_running_loop, CALLER_ID_SEPARATOR, ADMISSION_REJECT, ADMISSION_QUEUE,
+                    ADMISSION_DROP_OLDEST, CallThrottledError, ANNOUNCE_SIGNAL_NAME, get_instance_id,
+                    ServiceNotReadyError, CallbackNotFoundError, SER_TYPE_BYTES, SER_TYPE_PICKLE_OOB, is_large_payload,
+                    delete_large_payload)
+from batch import SignalBatcher, receive_batch_call
+from calltable import CallTable, InflightCall
+from envelope import EnvelopeFuncCallback
+from localcall import can_make_local_call, make_local_call
+from router import (Router, ROUTE_CALL, ROUTE_RETURN_CALL, ROUTE_BATCH_CALL, ROUTE_CACHE_INVALIDATION,
+                    ROUTE_RETURN_STREAM, ROUTE_CANCEL_CALL, ROUTE_ANNOUNCE)
+from rpc import send_rpc_call, unpack_call_args
+
+
+def use_multithread(value=False, max_workers=MAX_WORKERS, max_queue_size=MAX_QUEUE_SIZE):
+    """
+    If set as True allow to receive multiple callbacks at same time, by executing the calls on a pool of threads.
+    Must be set only one time, before registering the callbacks
+    :param value: True to enable the multithread
+    :param max_workers: maximum number of threads used to execute the calls
+    :param max_queue_size: maximum number of calls waiting a free thread, when the limit is reached the next calls
+                           will be rejected and the caller will receive the CallRejectedError exception
+    """
+    receiver = _receiver()
+    receiver.router.use_multithread = value
+    receiver.lanes.max_workers = max_workers
+    receiver.lanes.max_queue_size = max_queue_size
 
 
-def use_multithread(value=False):
+def use_lane(lane, max_workers=MAX_WORKERS, max_queue_size=MAX_QUEUE_SIZE):
     """
-    If set as True allow to receive multiple callbacks at same time, by creating a thread for each call.
-    Must be set only one time, before registering the callbacks
+    Set the thread pool of a lane. Each lane has its own queue and worker threads, so the calls to the callbacks
+    of a lane (e.g. latency-sensitive calls) are not delayed by the calls queued in the others lanes (e.g. bulk work).
+    Must be set before registering the callbacks of the lane, the lanes not set use the values of 'use_multithread'
+    :param lane: the name of the lane
+    :param max_workers: maximum number of threads used to execute the calls of the lane
+    :param max_queue_size: maximum number of calls of the lane waiting a free thread
+    """
+    _receiver().lanes.config[lane] = (max_workers, max_queue_size)
+
+
+def get_lanes_stats():
+    """
+    Get the statistics of the lanes used to execute the threaded calls
+    :return: a dict {lane: stats}, where the stats is a dict with the keys 'queued' (the queue depth),
+             'executed', 'mean_wait_ms' and 'max_wait_ms' (the time waited by the calls in the queue)
+    """
+    return _receiver().lanes.get_stats()
+
+
+def set_admission_limit(callback_name=None, caller_id=None, rate=None, burst=None, max_inflight=None,
+                        policy=ADMISSION_REJECT, max_queue_size=MAX_QUEUE_SIZE):
+    """
+    Set the limits of the calls received, the limits are applied separately to each caller add-on.
+    For each call is applied only the most specific limit: the limit of the callback and caller add-on,
+    of the callback, of the caller add-on, and finally the limit for all the calls.
+    The calls rejected are notified to the caller with the CallThrottledError exception
+    :param callback_name: the name of the callback to limit, None for all the callbacks
+    :param caller_id: the ID of the caller add-on to limit, None for all the caller add-ons
+    :param rate: maximum number of calls per second, None for no limit
+    :param burst: maximum number of calls accepted at once when the rate limit has not been reached
+                  (by default equal to the rate)
+    :param max_inflight: maximum number of calls in execution at same time, None for no limit
+    :param policy: what to do with the calls over the limits, ADMISSION_REJECT to reject the calls,
+                   ADMISSION_QUEUE to queue the calls (when the queue is full the call is rejected),
+                   ADMISSION_DROP_OLDEST to queue the calls (when the queue is full the oldest call is rejected),
+                   the queued calls are executed on the thread pool of the lane of the callback
+    :param max_queue_size: maximum number of calls waiting to be admitted
+    """
+    from admission import AdmissionLimit
+    _receiver().router.set_admission_limit(callback_name, caller_id,
+                                           AdmissionLimit(rate, burst, max_inflight, policy, max_queue_size))
+
+
+def remove_admission_limits():
+    """Remove all the limits of the calls received"""
+    _receiver().router.remove_admission_limits()
+
+
+def use_socket_transport(value=False, listen=False):
+    """
+    If set as True the calls made with 'make_call' are sent through the Unix domain socket of the add-on to call,
+    when the add-on is not listening on its socket the calls are sent through Kodi JSON-RPC as usual.
+    Not supported by the platforms without Unix domain sockets.
+    :param value: True to enable the socket transport
+    :param listen: if True, listen the calls to the callbacks registered with the add-on ID of this add-on,
+                   should be enabled only by the add-on service
+    """
+    receiver = _receiver()
+    from transport import is_supported, SocketTransport
+    if value and is_supported():
+        if receiver.socket_transport is None:
+            receiver.socket_transport = SocketTransport(receiver)
+        if listen:
+            receiver.socket_transport.start_server(get_addon_id())
+        else:
+            receiver.socket_transport.stop_servers()
+    elif receiver.socket_transport is not None:
+        receiver.socket_transport.stop_servers()
+        receiver.socket_transport = None
+
+
+def use_instrumentation(value=False):
+    """
+    If set as True the stages of the calls are measured (serialization, sending, receiving, callback execution and
+    the whole make_call), the elapsed times are notified to the hooks and recorded in the metrics registry
+    :param value: True to enable the instrumentation
+    """
+    metrics.enabled = value
+
+
+def add_instrumentation_hook(hook):
+    """
+    Add a hook called on the start and the end of each measured stage of the calls
+    :param hook: function with arguments (event, stage, callback_name, timestamp, size), where event is 'start' or
+                 'end', the timestamp is a perf_counter value and size is the number of bytes of the data or None
+    """
+    metrics.add_hook(hook)
+
+
+def remove_instrumentation_hook(hook):
+    """Remove a hook added with add_instrumentation_hook"""
+    metrics.remove_hook(hook)
+
+
+def dump_metrics(reset=False):
+    """
+    Get the metrics recorded with the instrumentation enabled
+    :param reset: if True the recorded metrics will be deleted
+    :return: a dict {callback_name: {stage: histogram}}, where the histogram is a dict with the keys 'count',
+             'mean_ms', 'max_ms', 'total_bytes' and 'buckets' (the counts of the elapsed times by upper bound in ms)
+    """
+    return metrics.get_registry().dump(reset)
+
+
+def use_event_loop(loop):
     """
-    _receiver().use_multithread = value
+    Set the asyncio event loop where will be executed the callbacks that are coroutine functions.
+    Must be set before receiving the calls
+    :param loop: the asyncio event loop
+    """
+    _receiver().event_loop = loop
 
 
 def _receiver():
@@ -35,117 +174,373 @@ def _receiver():
     return _receiver.cached
 
 
+def _announcer():
+    """Return the Announcer instance, that announce the callbacks registered by this add-on instance"""
+    if not hasattr(_announcer, 'cached'):
+        from registry import Announcer
+        _announcer.cached = Announcer(_announce_callbacks)
+    return _announcer.cached
+
+
 class CallReceiver(Monitor):
     """Monitor to receive the RPC calls"""
     def __init__(self):
-        self.slots = {}
-        self.use_multithread = False
+        from dispatcher import Lanes
+        self.router = Router()
+        self.lanes = Lanes()
+        self.calls = CallTable()
+        self.socket_transport = None  # The SocketTransport, when the socket transport is enabled
+        self.event_loop = None
+        self._registry = None
+        # The handlers of the notifications by kind of route
+        self._route_handlers = {ROUTE_CALL: self._on_call,
+                                ROUTE_RETURN_CALL: self._on_return_call,
+                                ROUTE_BATCH_CALL: self._on_batch_call,
+                                ROUTE_CACHE_INVALIDATION: self._on_cache_invalidation,
+                                ROUTE_RETURN_STREAM: self._on_return_stream,
+                                ROUTE_CANCEL_CALL: self._on_cancel_call,
+                                ROUTE_ANNOUNCE: self._on_announce}
         super().__init__()
 
-    def register_slot(self, callback_name, callback, addon_id=None, ser_type_return=None, use_thread=None):
-        """Register a slot"""
-        if addon_id not in self.slots:
-            self.slots[addon_id] = {}
-        # Add the slot properties
-        self.slots[addon_id][callback_name] = {
-            'callback_func': callback,
-            'ser_type_return': ser_type_return,
-            'run_threaded': self.use_multithread if use_thread is None else use_thread
-        }
-
-    def unregister_slot(self, callback_name, addon_id):
-        """Unregister a slot"""
-        if addon_id not in self.slots:
-            return
-        if callback_name not in self.slots[addon_id]:
-            return
-        del self.slots[addon_id][callback_name]
-
-    def unregister_slots(self, addon_id=None):
-        """Unregister all slots or all slots of the specified add-on ID"""
-        if addon_id is None:
-            self.slots = {}
-        elif addon_id in self.slots:
-            del self.slots[addon_id]
+    @property
+    def registry(self):
+        """Return the ServiceRegistry, with the callbacks announced by the add-ons"""
+        if self._registry is None:
+            from registry import ServiceRegistry
+            self._registry = ServiceRegistry()
+        return self._registry
 
     def onNotification(self, sender, method, data):  # pylint: disable=invalid-name
         """The Kodi Monitor event handler for notifications"""
+        # Most of the notifications are not addressed to the add-on connector (e.g. player, library, GUI events)
+        if not sender.endswith(SENDER_ID_SUFFIX):
+            return
+        if metrics.enabled:
+            callback_name = method.split('.', 2)[1]
+            start_time = metrics.start(metrics.STAGE_RECEIVE, callback_name, len(data))
+            try:
+                self._on_notification(sender, method, data)
+            finally:
+                metrics.end(metrics.STAGE_RECEIVE, callback_name, start_time, len(data))
+        else:
+            self._on_notification(sender, method, data)
+
+    def _on_notification(self, sender, method, data):
         try:
-            if not sender.endswith(SENDER_ID_SUFFIX):
+            # 'method' have a value like: 'Other.theCallbackName.sertype.sertype_return.callid'
+            # all the notifications with same sender and method header (the method without call ID) have the same route
+            method_header, call_id = method.rsplit('.', 1)
+            route = self.router.get_route(sender, method_header)
+            if route is None:
+                if is_large_payload(data):
+                    self._drop_large_payload(sender, method_header, data)
                 return
-            # Get the addon id
-            addon_id, _ = sender.rsplit('.', 1)
-            if addon_id not in self.slots:
-                return
-            # Get the callback name and type of data serializations
-            # 'method' have a value like: 'Other.theCallbackName.sertype.sertype_return'
-            _, callback_name, ser_type, ser_type_return = method.split('.')
-            if callback_name not in self.slots[addon_id]:
-                return
-            # Save the serialization type for a possible automatic RPC return call
-            self.slots[addon_id][callback_name]['ser_type_return'] = ser_type_return
-            # Get the add-on function, bound to the callback_name
-            func = self.slots[addon_id][callback_name]['callback_func']
         except Exception as exc:  # pylint: disable=broad-except
             from traceback import format_exc
             log(format_exc(), LOGERROR)
             raise AddonConnectorException('Internal error see log details') from exc
+        self._route_handlers[route.kind](route, call_id, data)
+
+    def _on_call(self, route, call_id, data):
+        call_id, deadline = unpack_call_id(call_id)
+        if self._is_expired(deadline, data):
+            return
         # Deserialize the data according to the specified serialisation type
-        if callback_name.startswith(RETURN_CALL_PREFIX) or ser_type in [SER_TYPE_STRING, SER_TYPE_NONE]:
-            args = (deserialize_data(ser_type, data),)
+        args, kwargs = unpack_call_args(route.ser_type, deserialize_data(route.ser_type, data))
+        self.dispatch_call(route, call_id, deadline, args, kwargs)
+
+    def _on_batch_call(self, route, call_id, data):
+        call_id, deadline = unpack_call_id(call_id)
+        if not self._is_expired(deadline, data):
+            receive_batch_call(self, route, call_id, data)
+
+    def _on_return_call(self, route, call_id, data):
+        # The RPC return call is routed to the pending call that has the same call ID
+        call_handler = self.calls.get_pending_call(call_id, route.callback_name, route.addon_id)
+        if call_handler is not None:
+            call_handler.return_callback(deserialize_data(route.ser_type, data))
+        elif is_large_payload(data):
+            self._drop_late_large_payload(call_id, data)
+
+    def _on_return_stream(self, route, call_id, data):
+        call_handler = self.calls.get_pending_call(call_id, route.callback_name, route.addon_id)
+        if call_handler is not None:
+            call_handler.stream_callback(deserialize_data(route.ser_type, data))
+        elif is_large_payload(data):
+            self._drop_late_large_payload(call_id, data)
+
+    def _on_cache_invalidation(self, route, _call_id, data):
+        from cache import invalidate_result_caches
+        invalidate_result_caches(route.addon_id, deserialize_data(route.ser_type, data))
+
+    def _on_cancel_call(self, _route, call_id, _data):
+        self.calls.cancel_call(call_id)
+
+    def _on_announce(self, route, _call_id, data):
+        instance_id, callback_names = deserialize_data(route.ser_type, data)
+        self.registry.update(route.addon_id, instance_id, callback_names)
+
+    @staticmethod
+    def _is_expired(deadline, data):
+        """Return True if the caller is no longer waiting for the result, the file of a large payload is deleted"""
+        if deadline is None or not CancelToken(deadline).is_cancelled:
+            return False
+        if is_large_payload(data):
+            delete_large_payload(data)
+        return True
+
+    def _drop_large_payload(self, sender, method_header, data):
+        """
+        Delete the file of a large payload of a call without route, when the call is addressed to this add-on
+        but no add-on instance has registered the callback, so no one will read the file
+        """
+        addon_id = sender[:-len(SENDER_ID_SUFFIX)].partition(CALLER_ID_SEPARATOR)[0]
+        callback_name = method_header.split('.')[1]
+        if addon_id not in self.router.addon_ids or callback_name == BATCH_CALL_NAME:
+            # The calls addressed to another add-on are handled by the add-on itself
+            return
+        if callback_name not in (self.registry.get_callback_names(addon_id) or ()):
+            delete_large_payload(data)
+
+    def _drop_late_large_payload(self, call_id, data):
+        """Delete the file of a large payload of a return call received after that the call has been cancelled"""
+        # The return calls to the calls made by the other add-on instances are handled by the instances themselves
+        if self.calls.is_cancelled_call(call_id):
+            delete_large_payload(data)
+
+    def dispatch_call(self, route, call_id, deadline, args, kwargs):
+        """Execute a call to a callback, through the admission control when the callback has an admission limit"""
+        func = route.slot.callback_func
+        if isinstance(func, EnvelopeFuncCallback):
+            # The envelope need to know the call ID and the serialization type to make the RPC return call
+            cancel_token = self.calls.add_cancel_token(call_id, deadline) if call_id else None
+            args = (call_id, route.ser_type_return, args, kwargs, cancel_token)
             kwargs = {}
-        else:
-            args, kwargs = deserialize_data(ser_type, data)
+            func = func.call_func
         # Execute the function
-        if self.slots[addon_id][callback_name]['run_threaded']:
-            from threading import Thread
-            Thread(target=func, args=args, kwargs=kwargs).start()
+        if route.admission_limit is None:
+            self.execute_call(route, call_id, func, args, kwargs)
         else:
-            # NOTE: Executing the function is a blocking call (it is executed on the same thread of the add-on),
-            # then all the subsequents notifications will be queued to the current one, this means that the function of
-            # the next RPC call will be executed only when the current called function has finished its execution
-            func(*args, **kwargs)
+            from admission import admit_call
+            admit_call(self, route, call_id, func, args, kwargs)
+
+    def execute_call(self, route, call_id, func, args, kwargs, is_queued=False):
+        """Execute a call, return False if the call has been rejected by the dispatcher"""
+        slot = route.slot
+        if slot.run_threaded or is_queued:
+            return self.submit_call(route.addon_id, route.callback_name, call_id, slot.lane, slot,
+                                    slot.max_concurrency, func, args, kwargs)
+        # NOTE: Executing the function is a blocking call (it is executed on the same thread of the add-on),
+        # then all the subsequents notifications will be queued to the current one, this means that the function of
+        # the next RPC call will be executed only when the current called function has finished its execution
+        func(*args, **kwargs)
+        return True
+
+    def submit_call(self, addon_id, callback_name, call_id, lane, slot_key, max_concurrency, func, args, kwargs):
+        """
+        Submit the execution of a call to the dispatcher, if the call is rejected the caller will be notified
+        :return: False if the call has been rejected
+        """
+        try:
+            self.lanes.get_dispatcher(lane).submit(slot_key, max_concurrency, func, args, kwargs)
+            return True
+        except CallRejectedError as exc:
+            self.reject_call(addon_id, callback_name, call_id, exc)
+            return False
+
+    def reject_call(self, addon_id, callback_name, call_id, exc):
+        """Notify the rejection of a call to the caller"""
+        self.calls.remove_cancel_token(call_id)
+        if not call_id:
+            return
+        if self.socket_transport is not None and self.socket_transport.return_call(call_id, exc):
+            # The call has been received from the Unix domain socket, the exception is sent back by the socket server
+            return
+        send_rpc_call(RETURN_CALL_PREFIX + callback_name, exc, addon_id, SER_TYPE_PICKLE, call_id=call_id)
 
 
 class CallHandler:
     """Handle a RPC call and wait the RPC return call"""
+    has_deadline = True
+    """True if the whole result must be returned within the timeout, so the call is sent with the deadline"""
+
     def __init__(self, call_config: 'CallConfig', args, kwargs):
-        self._call_config = call_config
+        from threading import Event
+        self.call_config = call_config
+        self.call_id = new_call_id()
         self._callback_data = None
-        self._is_callback_received = False
-        # Temporary register the slot for waiting the RPC return call from an add-on
-        _receiver().register_slot(RETURN_CALL_PREFIX + call_config.callback_name,
-                                  self.return_callback,
-                                  call_config.addon_id,
-                                  call_config.ser_type_return,
-                                  False)
-        # Execute the RPC call to an add-on
-        _make_signal_call(call_config.callback_name, (args, kwargs), call_config.addon_id,
-                          call_config.ser_type, call_config.ser_type_return)
+        self._stream_items = []
+        self._is_aborted = False
+        self._event_return_call = Event()
+        receiver = _receiver()
+        if call_config.fail_fast:
+            receiver.registry.check_callback(call_config.addon_id, call_config.callback_name)
+        # Add the call to the pending calls table, to receive the RPC return call from an add-on
+        receiver.calls.add_pending_call(self)
+        try:
+            # Execute the RPC call to an add-on, the deadline allows the receiver to drop the call when the caller
+            # is no longer waiting for the result
+            call_id = self.call_id
+            if self.has_deadline:
+                from time import time
+                call_id = pack_call_id(call_id, time() + call_config.timeout_secs)
+            send_rpc_call(call_config.callback_name, (args, kwargs), call_config.addon_id,
+                          call_config.ser_type, call_config.ser_type_return, call_id,
+                          call_config.message_template)
+        except Exception:
+            receiver.calls.remove_pending_call(self)
+            raise
 
     def return_callback(self, data):
         """Callback done by make_return_call (manually or in automatic way)"""
         self._callback_data = data
-        self._is_callback_received = True
+        self._event_return_call.set()
+
+    def stream_callback(self, data):
+        """Callback done by the RPC return calls of a streamed result, the items are collected in a list"""
+        items, is_last = data
+        self._stream_items.extend(items)
+        if is_last:
+            self.return_callback(self._stream_items)
+
+    def abort(self):
+        """Wake up the waiting of the RPC return call due to Kodi abort request"""
+        self._is_aborted = True
+        self._event_return_call.set()
+
+    def cancel(self):
+        """Notify the receiver that the caller is no longer waiting for the result, so the call can be stopped"""
+        _receiver().calls.add_cancelled_call(self.call_id)
+        try:
+            send_rpc_call(CANCEL_CALL_NAME, None, self.call_config.addon_id, SER_TYPE_NONE, call_id=self.call_id)
+        except AddonConnectorException:
+            pass
 
     def wait_rpc_return_call(self):
         """Wait that RPC return call send the data"""
-        from time import perf_counter
-        end_time = perf_counter() + self._call_config.timeout_secs
-        while not self._is_callback_received:
-            if perf_counter() > end_time:
-                _receiver().unregister_slot(self._call_config.callback_name, self._call_config.addon_id)
-                raise WaitTimeoutError
-            if _receiver().abortRequested():
-                raise OperationAbortedError
-            sleep(10)
-        _receiver().unregister_slot(self._call_config.callback_name, self._call_config.addon_id)
+        receiver = _receiver()
+        try:
+            if not self._event_return_call.is_set():
+                if receiver.abortRequested():
+                    raise OperationAbortedError
+                receiver.calls.start_abort_watcher(receiver)
+                if not self._event_return_call.wait(self.call_config.timeout_secs):
+                    raise WaitTimeoutError
+                if self._is_aborted:
+                    raise OperationAbortedError
+        except (WaitTimeoutError, OperationAbortedError):
+            self.cancel()
+            raise
+        finally:
+            receiver.calls.remove_pending_call(self)
         if isinstance(self._callback_data, Exception):
             raise self._callback_data
         return self._callback_data
 
 
-def register_callbacks(list_callbacks_args: Tuple[str, ...]):
+class StreamCallHandler(CallHandler):
+    """Handle a RPC call and iterate the items of the result as soon as the chunks of a streamed result are received"""
+    # The timeout is applied to each chunk, so a stream can last longer than the timeout,
+    # the streaming is stopped by the cancellation sent when the caller stops to wait
+    has_deadline = False
+
+    def __init__(self, call_config: 'CallConfig', args, kwargs):
+        from queue import Queue
+        # Tuples (items, is_last, return_data), the items are None when the result has not been streamed
+        self._chunks = Queue()
+        super().__init__(call_config, args, kwargs)
+
+    def return_callback(self, data):
+        """Callback done by make_return_call (manually or in automatic way)"""
+        self._chunks.put((None, True, data))
+
+    def stream_callback(self, data):
+        """Callback done by the RPC return calls of a streamed result"""
+        items, is_last = data
+        self._chunks.put((items, is_last, None))
+
+    def abort(self):
+        """Wake up the waiting of the next chunk due to Kodi abort request"""
+        self._chunks.put((None, True, OperationAbortedError()))
+
+    def iterate(self):
+        """Yield the items of the result, the timeout is applied to the waiting of each chunk"""
+        from queue import Empty
+        receiver = _receiver()
+        is_completed = False
+        try:
+            if receiver.abortRequested():
+                raise OperationAbortedError
+            receiver.calls.start_abort_watcher(receiver)
+            while True:
+                try:
+                    items, is_last, ret_data = self._chunks.get(timeout=self.call_config.timeout_secs)
+                except Empty:
+                    raise WaitTimeoutError from None
+                if items is None:
+                    # The callback has raised an exception, or has not returned a generator
+                    is_completed = not isinstance(ret_data, OperationAbortedError)
+                    if isinstance(ret_data, Exception):
+                        raise ret_data
+                    if ret_data is not None:
+                        yield from ret_data
+                    return
+                is_completed = is_last
+                yield from items
+                if is_last:
+                    return
+        finally:
+            # The chunks received after that the iteration has been stopped will be ignored
+            receiver.calls.remove_pending_call(self)
+            if not is_completed:
+                # Timeout, Kodi abort request or iteration stopped, so the streaming of the items can be stopped
+                self.cancel()
+
+
+class AsyncCallHandler(CallHandler):
+    """Handle a RPC call and resolve an asyncio future with the RPC return call"""
+    def __init__(self, call_config: 'CallConfig', args, kwargs):
+        self._loop = get_running_loop()
+        self.future = self._loop.create_future()
+        self._timeout_handle = None
+        receiver = _receiver()
+        if receiver.abortRequested():
+            raise OperationAbortedError
+        super().__init__(call_config, args, kwargs)
+        # The future is resolved only on the event loop thread, so it can not be already resolved here
+        self._timeout_handle = self._loop.call_later(call_config.timeout_secs, self._resolve, WaitTimeoutError(), True)
+        self.future.add_done_callback(self._on_future_done)
+        receiver.calls.start_abort_watcher(receiver)
+
+    def return_callback(self, data):
+        """Callback done by make_return_call (manually or in automatic way)"""
+        self._loop.call_soon_threadsafe(self._resolve, data)
+
+    def abort(self):
+        """Resolve the future due to Kodi abort request"""
+        self._loop.call_soon_threadsafe(self._resolve, OperationAbortedError(), True)
+
+    def _on_future_done(self, future):
+        if future.cancelled():
+            # The future has been cancelled by the caller, so the call can be stopped
+            _receiver().calls.remove_pending_call(self)
+            self._timeout_handle.cancel()
+            self.cancel()
+
+    def _resolve(self, data, cancel_call=False):
+        _receiver().calls.remove_pending_call(self)
+        self._timeout_handle.cancel()
+        if self.future.done():  # Cancelled or already resolved
+            return
+        if cancel_call:
+            self.cancel()
+        if isinstance(data, Exception):
+            self.future.set_exception(data)
+        else:
+            self.future.set_result(data)
+
+
+def register_callbacks(list_callbacks_args: 'list'):
     """
     Register more slots for functions of callbacks
     :param list_callbacks_args: List of tuples, every tuple must have the arguments to be set to 'register_callback'
@@ -154,33 +549,69 @@ def register_callbacks(list_callbacks_args: Tuple[str, ...]):
         register_callback(*args)
 
 
-def register_callback(callback, callback_name=None, addon_id=None, handle_return_call=True):
+def register_callback(callback, callback_name=None, addon_id=None, handle_return_call=True, max_concurrency=None,
+                      chunk_size=STREAM_CHUNK_SIZE, lane=None):
     """
     Register a slot for a function of callback
     :param callback: the function to be called
     :param callback_name: custom name of the callback (if not specified will be used the function name)
     :param addon_id: the addon ID that receive the callbacks (specify only for custom actions)
     :param handle_return_call: if True will send automatically the callback to the caller add-on
-                               (so forward return data and exceptions)
+                               (so forward return data and exceptions), a coroutine function will be executed
+                               on the event loop set with 'use_event_loop'
+    :param max_concurrency: with multithread enabled, the maximum number of calls executed at same time,
+                            if set to 1 the calls are executed one at a time in the same order in which they are received
+    :param chunk_size: when the callback return a generator, the items are streamed to the caller
+                       with a RPC return call every 'chunk_size' items
+    :param lane: the name of the lane where execute the calls (see 'use_lane'), the calls are always executed
+                 on the thread pool of the lane, so they are not queued behind the calls of the others lanes
     """
     _callback_name = callback_name or callback.__name__
     _addon_id = addon_id or get_addon_id()
-    _receiver().register_slot(_callback_name,
-                              EnvelopeFuncCallback(callback,
-                                                   _callback_name,
-                                                   _addon_id).call_func
-                              if handle_return_call else callback,
-                              _addon_id)
+    receiver = _receiver()
+    receiver.router.register_slot(_callback_name,
+                                  EnvelopeFuncCallback(callback, _callback_name, _addon_id, receiver, chunk_size)
+                                  if handle_return_call else callback,
+                                  _addon_id,
+                                  max_concurrency=max_concurrency,
+                                  lane=lane)
+    _announcer().schedule(_addon_id)
 
 
 def unregister_callback(callback_name, addon_id=None):
     """Unregister a callback"""
-    _receiver().unregister_slot(callback_name, addon_id or get_addon_id())
+    _addon_id = addon_id or get_addon_id()
+    _receiver().router.unregister_slot(callback_name, _addon_id)
+    _announcer().schedule(_addon_id)
 
 
 def unregister_callbacks(addon_id=None):
     """Unregister all the callbacks bound to an add-on ID"""
-    _receiver().unregister_slots(addon_id or get_addon_id())
+    _addon_id = addon_id or get_addon_id()
+    _receiver().router.unregister_slots(_addon_id)
+    _announcer().schedule(_addon_id)
+
+
+def _announce_callbacks(addon_id, callback_names=None):
+    """
+    Announce to the add-ons the callbacks registered by this add-on instance for an add-on ID,
+    the changes of the registered callbacks are announced with a short delay (see 'Announcer.schedule')
+    """
+    if callback_names is None:
+        callback_names = _receiver().router.get_callback_names(addon_id)
+    if addon_id == _announcer().ready_addon_id:
+        from outbox import write_ready_marker
+        write_ready_marker(addon_id, callback_names)
+    send_rpc_call(ANNOUNCE_SIGNAL_NAME, [get_instance_id(), callback_names], addon_id, SER_TYPE_JSON)
+
+
+def get_services():
+    """
+    Return the callbacks served by the add-ons, known from their announcements and their readiness markers
+    (useful for diagnostics)
+    :return: a dict with the sorted list of the names of the registered callbacks by add-on ID
+    """
+    return _receiver().registry.get_services()
 
 
 def make_signal_call(__call_config__: 'CallConfig', *args, **kwargs):
@@ -188,28 +619,64 @@ def make_signal_call(__call_config__: 'CallConfig', *args, **kwargs):
     Make a call to an add-on or service without wait to get any return data
     :param __call_config__: The call configuration
     """
-    _make_signal_call(__call_config__.callback_name,
-                      (args, kwargs),
-                      __call_config__.addon_id,
-                      __call_config__.ser_type,
-                      __call_config__.ser_type_return)
-
-
-def _make_signal_call(callback_name, data=None, addon_id=None, ser_type=SER_TYPE_PICKLE, ser_type_return=SER_TYPE_NONE):
-    try:
-        # We avoid the slow JSON encoding then we directly build the JSON data in a string
-        executeJSONRPC(JSONRPC_NOTIFYALL_STR.format(
-            callback_name=callback_name,
-            ser_type=ser_type,
-            ser_type_return=ser_type_return,
-            sender_id=addon_id or get_addon_id(),
-            sender_id_suffix=SENDER_ID_SUFFIX,
-            data=serialize_data(ser_type, data)
-        ))
-    except Exception as exc:  # pylint: disable=broad-except
-        from traceback import format_exc
-        log(format_exc(), LOGERROR)
-        raise AddonConnectorException('Internal error see log details') from exc
+    if __call_config__.outbox_ttl:
+        from outbox import is_ready
+        if not is_ready(__call_config__.addon_id):
+            # The add-on service is not running, the signal will be delivered when the service will be ready
+            _append_to_outbox(__call_config__, args, kwargs)
+            return
+    send_rpc_call(__call_config__.callback_name,
+                  (args, kwargs),
+                  __call_config__.addon_id,
+                  __call_config__.ser_type,
+                  __call_config__.ser_type_return,
+                  message_template=__call_config__.message_template)
+
+
+def _append_to_outbox(call_config, args, kwargs):
+    from hashlib import sha1
+    from time import time
+    from outbox import get_outbox_writer
+    data = serialize_data(call_config.ser_type, (args, kwargs), allow_large_payload=False)
+    # The same signals (same callback and data) will be delivered only once
+    key = sha1('{} {}'.format(call_config.callback_name, data).encode('ascii')).hexdigest()[:16]
+    get_outbox_writer(call_config.addon_id).append(time() + call_config.outbox_ttl, call_config.callback_name,
+                                                   call_config.ser_type, key, data)
+
+
+def notify_ready():
+    """
+    Notify that the add-on service is ready to receive the calls, must be called by the add-on service after
+    registering the callbacks, and then periodically as heartbeat (at least every 60 seconds).
+    The signals queued in the outbox of the add-on (see CallConfig 'outbox_ttl') are delivered in bulk,
+    and the registered callbacks are announced to the add-ons (see CallConfig 'fail_fast')
+    """
+    from outbox import take_outbox_signals
+    addon_id = get_addon_id()
+    announcer = _announcer()
+    announcer.ready_addon_id = addon_id
+    announcer.cancel(addon_id)
+    _announce_callbacks(addon_id)
+    entries = []
+    for callback_name, ser_type, data in take_outbox_signals(addon_id):
+        args, kwargs = unpack_call_args(ser_type, deserialize_data(ser_type, data))
+        entries.append((callback_name, args, kwargs))
+    if entries:
+        # The caller add-ons of the signals are unknown, so only the admission limits for all the callers are applied
+        from batch import execute_calls
+        execute_calls(_receiver(), addon_id, '', entries)
+
+
+def notify_stopped():
+    """Notify that the add-on service is no longer running, must be called by the add-on service when it stops"""
+    from outbox import remove_ready_marker
+    addon_id = get_addon_id()
+    announcer = _announcer()
+    announcer.ready_addon_id = None
+    remove_ready_marker(addon_id)
+    # The callbacks are no longer received
+    announcer.cancel(addon_id)
+    _announce_callbacks(addon_id, [])
 
 
 def make_call(__call_config__: 'CallConfig', *args, **kwargs):
@@ -219,36 +686,171 @@ def make_call(__call_config__: 'CallConfig', *args, **kwargs):
     :raise WaitTimeoutError: if the waiting time exceed the timeout value
     :raise OperationAbortedError: if Kodi abort the operation (e.g. Kodi exit)
     """
-    return CallHandler(__call_config__, args, kwargs).wait_rpc_return_call()
+    if metrics.enabled:
+        start_time = metrics.start(metrics.STAGE_CALL, __call_config__.callback_name)
+        try:
+            return _make_cached_call(__call_config__, args, kwargs)
+        finally:
+            metrics.end(metrics.STAGE_CALL, __call_config__.callback_name, start_time)
+    return _make_cached_call(__call_config__, args, kwargs)
+
+
+def _make_cached_call(call_config, args, kwargs):
+    result_cache = call_config.result_cache
+    if result_cache is None:
+        return _make_single_flight_call(call_config, args, kwargs)
+    from cache import make_cache_key
+    key = (call_config.cache_key_func or make_cache_key)(args, kwargs)
+    is_cached, ret_data = result_cache.get(key)
+    if not is_cached:
+        # The exceptions raised by the callback are not cached
+        ret_data = _make_single_flight_call(call_config, args, kwargs)
+        result_cache.set(key, ret_data)
+    return ret_data
+
+
+def _make_single_flight_call(call_config, args, kwargs):
+    if not call_config.single_flight:
+        return _make_call(call_config, args, kwargs)
+    from cache import make_cache_key
+    key = (call_config.addon_id, call_config.callback_name,
+           (call_config.cache_key_func or make_cache_key)(args, kwargs))
+    receiver = _receiver()
+    inflight_call = InflightCall()
+    current_call = receiver.calls.join_inflight_call(key, inflight_call)
+    if current_call is not None:
+        # The same call is already in progress, wait its result
+        return current_call.wait(call_config.timeout_secs)
+    try:
+        inflight_call.ret_data = _make_call(call_config, args, kwargs)
+    except Exception as exc:  # pylint: disable=broad-except
+        # The exception is forwarded also to the other calls that are waiting
+        inflight_call.ret_data = exc
+    finally:
+        receiver.calls.remove_inflight_call(key)
+        inflight_call.event_done.set()
+    if isinstance(inflight_call.ret_data, Exception):
+        raise inflight_call.ret_data
+    return inflight_call.ret_data
+
+
+def _make_call(call_config, args, kwargs):
+    receiver = _receiver()
+    slot = receiver.router.slots.get((call_config.addon_id, call_config.callback_name))
+    if slot is not None and can_make_local_call(receiver, slot, call_config):
+        # The callback is registered in this interpreter, so it is called without the RPC call
+        return make_local_call(receiver, slot, call_config, args, kwargs)
+    if receiver.socket_transport is not None:
+        from transport import make_socket_call
+        response = make_socket_call(call_config.addon_id, call_config.callback_name,
+                                    call_config.ser_type, call_config.ser_type_return,
+                                    encode_data(call_config.ser_type, (args, kwargs)),
+                                    call_config.timeout_secs, receiver.abortRequested)
+        if response is not None:
+            ret_data = decode_data(*response)
+            if isinstance(ret_data, Exception):
+                raise ret_data
+            return ret_data
+    return CallHandler(call_config, args, kwargs).wait_rpc_return_call()
+
+
+def make_call_iter(__call_config__: 'CallConfig', *args, **kwargs):
+    """
+    Make a call to an add-on or service, and iterate the items returned by the callback.
+    When the callback return a generator the items are streamed, so they can be processed as soon as they arrive,
+    otherwise the returned iterable is iterated once received (the socket transport is not used)
+    :param __call_config__: The call configuration, the timeout is applied to the waiting of each chunk of items
+    :return: an iterator of the items
+    :raise WaitTimeoutError: (by the iterator) if the waiting time exceed the timeout value
+    :raise OperationAbortedError: (by the iterator) if Kodi abort the operation (e.g. Kodi exit)
+    """
+    return StreamCallHandler(__call_config__, args, kwargs).iterate()
+
+
+def invalidate_cache(*callback_names, addon_id=None):
+    """
+    Delete the results cached by the callers (see CallConfig 'cache_ttl'), the invalidation is sent as signal call
+    to all the add-ons, and so also the results cached by other add-ons will be deleted
+    :param callback_names: the names of the callbacks, if not specified will be deleted all the results
+    :param addon_id: the ID of the add-on that has the callbacks (specify only for the callbacks of others add-ons)
+    """
+    send_rpc_call(CACHE_INVALIDATION_NAME, list(callback_names) or None, addon_id)
+
+
+def make_call_async(__call_config__: 'CallConfig', *args, **kwargs):
+    """
+    Make a call to an add-on or service, without blocking the asyncio event loop running in the current thread
+    (the socket transport is not used), must be called from the event loop (e.g. within a coroutine)
+    :param __call_config__: The call configuration
+    :return: an asyncio future resolved with the returned data
+    :raise WaitTimeoutError: (by the future) if the waiting time exceed the timeout value
+    :raise OperationAbortedError: (by the future) if Kodi abort the operation (e.g. Kodi exit)
+    :raise RuntimeError: if there is no running event loop in the current thread
+    """
+    return AsyncCallHandler(__call_config__, args, kwargs).future
 
 
-def make_return_call(callback_name, data=None, addon_id=None, ser_type=SER_TYPE_PICKLE):
+def make_signal_call_async(__call_config__: 'CallConfig', *args, **kwargs):
+    """
+    Make a call to an add-on or service without wait to get any return data,
+    the call is made on the default executor of the asyncio event loop running in the current thread,
+    must be called from the event loop (e.g. within a coroutine)
+    :param __call_config__: The call configuration
+    :return: an asyncio future resolved when the call has been sent
+    :raise RuntimeError: if there is no running event loop in the current thread
+    """
+    from functools import partial
+    return get_running_loop().run_in_executor(None, partial(make_signal_call, __call_config__, *args, **kwargs))
+
+
+def make_batch_call(calls, return_exceptions=False):
+    """
+    Make multiple calls to add-ons or services, the calls to the same add-on are packed in a single RPC call,
+    and all their results are received with a single RPC return call.
+    The data of the calls are always serialized with pickle, regardless of the serialization types of the configs.
+    :param calls: list of tuples (CallConfig, args, kwargs), where args is a tuple and kwargs a dict
+    :param return_exceptions: if True the exceptions raised by the callbacks are returned within the results,
+                              otherwise the first exception (following the calls order) will be raised
+    :return: list of the returned data, in the same order of the calls
+    :raise WaitTimeoutError: if the waiting time exceed the highest timeout value of the configs of an add-on
+    :raise OperationAbortedError: if Kodi abort the operation (e.g. Kodi exit)
+    """
+    from batch import group_calls
+    # First we send all the batch calls, then we wait all the return calls
+    call_handlers = []
+    results = [None] * len(calls)
+    is_completed = False
+    try:
+        for addon_id, indexes, entries, timeout_secs in group_calls(calls):
+            batch_config = CallConfig(BATCH_CALL_NAME, addon_id, timeout_secs, SER_TYPE_PICKLE)
+            call_handlers.append((indexes, CallHandler(batch_config, (entries,), {})))
+        for indexes, call_handler in call_handlers:
+            for index, ret_data in zip(indexes, call_handler.wait_rpc_return_call()):
+                results[index] = ret_data
+        is_completed = True
+    finally:
+        if not is_completed:
+            # The calls still pending are no longer waited
+            receiver = _receiver()
+            for _, call_handler in call_handlers:
+                if call_handler.call_id in receiver.calls.pending_calls:
+                    receiver.calls.remove_pending_call(call_handler)
+                    call_handler.cancel()
+    if not return_exceptions:
+        for ret_data in results:
+            if isinstance(ret_data, Exception):
+                raise ret_data
+    return results
+
+
+def make_return_call(callback_name, data=None, addon_id=None, ser_type=SER_TYPE_PICKLE, call_id=''):
     """
     Make a return call to the caller add-on (that has executed the 'make_call')
     :param callback_name: the name of the function to call
     :param data: the data to return to the caller
     :param addon_id: the ID of the add-on which has executed the 'make_call' call (specify only for custom actions)
     :param ser_type: type of data serialization to be used
+    :param call_id: the ID of the call to answer, if not specified will be answered the oldest call
+                    made to the callback
     """
-    _make_signal_call(RETURN_CALL_PREFIX + callback_name, data, addon_id, ser_type)
-
-
-class EnvelopeFuncCallback:
-    """Envelope a function in order to handle a return call and catching, conversion, forwarding of exceptions"""
-    def __init__(self, func, callback_name, addon_id):
-        self._func = func
-        self._callback_name = callback_name
-        self._addon_id = addon_id
-
-    def call_func(self, *args, **kwargs):
-        """Forwards the call to the enveloped function"""
-        try:
-            ret_data = self._func(*args, **kwargs)
-            _ser_type_return = _receiver().slots[self._addon_id][self._callback_name]['ser_type_return']
-        except Exception as exc:  # pylint: disable=broad-except
-            ret_data = serialize_data(SER_TYPE_PICKLE, exc)
-            _ser_type_return = SER_TYPE_PICKLE
-        return _make_signal_call(RETURN_CALL_PREFIX + self._callback_name,
-                                 ret_data,
-                                 self._addon_id,
-                                 _ser_type_return)
+    send_rpc_call(RETURN_CALL_PREFIX + callback_name, data, addon_id, ser_type, call_id=call_id)
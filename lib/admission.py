@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Admission control of the RPC calls received, to limit the calls of each sender add-on
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from collections import deque
+from threading import Lock
+from time import monotonic
+
+from helper import ADMISSION_REJECT, ADMISSION_DROP_OLDEST, CallThrottledError
+
+
+class AdmissionLimit:
+    """The limits of the calls received, applied separately to each sender add-on"""
+    def __init__(self, rate, burst, max_inflight, policy, max_queue_size):
+        """
+        :param rate: maximum number of calls per second (token bucket), None for no limit
+        :param burst: maximum number of calls accepted at once when the rate limit has not been reached
+        :param max_inflight: maximum number of calls in execution at same time, None for no limit
+        :param policy: what to do with the calls over the limits, ADMISSION_REJECT, ADMISSION_QUEUE or
+                       ADMISSION_DROP_OLDEST
+        :param max_queue_size: maximum number of calls waiting to be admitted (with queue and drop oldest policies)
+        """
+        self.rate = rate
+        self.burst = burst or max(rate or 1, 1)
+        self.max_inflight = max_inflight
+        self.policy = policy
+        self.max_queue_size = max_queue_size
+        self._states = {}
+        self._lock = Lock()
+
+    def get_state(self, caller_id):
+        """Return the AdmissionState of a sender add-on"""
+        with self._lock:
+            state = self._states.get(caller_id)
+            if state is None:
+                state = self._states[caller_id] = AdmissionState(self)
+            return state
+
+
+class AdmissionState:
+    """The admission of the calls received from a sender add-on"""
+    def __init__(self, limit):
+        self._limit = limit
+        self._tokens = limit.burst
+        self._refill_time = monotonic()
+        self._inflight_count = 0
+        self._waiting_calls = deque()  # Tuples (execute, reject) of the calls waiting to be admitted
+        self._timer = None
+        self._lock = Lock()
+
+    def submit(self, execute, reject):
+        """
+        Submit a call to be admitted
+        :param execute: function to execute the call, with the argument 'is_queued' (True if the call has been
+                        admitted after waiting in the queue), the call must call 'release' when completed
+        :param reject: function to notify the rejection of the call
+        """
+        limit = self._limit
+        is_admitted = False
+        rejected_call = None
+        with self._lock:
+            is_queue_full = len(self._waiting_calls) >= limit.max_queue_size
+            can_drop = limit.policy == ADMISSION_DROP_OLDEST and bool(self._waiting_calls)
+            if not self._waiting_calls and self._try_acquire():
+                is_admitted = True
+            elif limit.policy == ADMISSION_REJECT or (is_queue_full and not can_drop):
+                rejected_call = reject
+            else:
+                if is_queue_full:
+                    # Drop the oldest waiting call to make room for the new call
+                    rejected_call = self._waiting_calls.popleft()[1]
+                self._waiting_calls.append((execute, reject))
+                self._schedule_admission()
+        if rejected_call is not None:
+            rejected_call()
+        if is_admitted:
+            execute(False)
+
+    def release(self):
+        """Notify that an admitted call has been completed"""
+        with self._lock:
+            self._inflight_count -= 1
+        self._admit_waiting_calls()
+
+    def _try_acquire(self):
+        limit = self._limit
+        if limit.max_inflight is not None and self._inflight_count >= limit.max_inflight:
+            return False
+        if limit.rate is not None:
+            now = monotonic()
+            self._tokens = min(limit.burst, self._tokens + (now - self._refill_time) * limit.rate)
+            self._refill_time = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        self._inflight_count += 1
+        return True
+
+    def _admit_waiting_calls(self):
+        admitted_calls = []
+        with self._lock:
+            self._timer = None
+            while self._waiting_calls and self._try_acquire():
+                admitted_calls.append(self._waiting_calls.popleft()[0])
+            self._schedule_admission()
+        for execute in admitted_calls:
+            execute(True)
+
+    def _schedule_admission(self):
+        """When the calls are waiting for the rate limit, schedule their admission when a token will be available"""
+        limit = self._limit
+        if not self._waiting_calls or self._timer is not None or limit.rate is None:
+            return
+        if limit.max_inflight is not None and self._inflight_count >= limit.max_inflight:
+            # The waiting calls will be admitted when an in-flight call will be released
+            return
+        from threading import Timer
+        self._timer = Timer(max((1 - self._tokens) / limit.rate, 0), self._admit_waiting_calls)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+def admit_call(receiver, route, call_id, func, args, kwargs):
+    """Execute a call to a callback when admitted by the admission control of the route"""
+    from envelope import EnvelopeFuncCallback
+    admission_state = route.admission_limit.get_state(route.caller_id)
+    is_envelope = isinstance(route.slot.callback_func, EnvelopeFuncCallback)
+    if is_envelope:
+        # A coroutine is still in execution when the call returns, the admission is released when it is done
+        kwargs = dict(kwargs, on_done=admission_state.release)
+
+    def admitted_func(*_args, **_kwargs):
+        is_running = False
+        try:
+            is_running = func(*_args, **_kwargs) is True and is_envelope
+        finally:
+            if not is_running:
+                admission_state.release()
+
+    def execute(is_queued):
+        if not receiver.execute_call(route, call_id, admitted_func, args, kwargs, is_queued):
+            admission_state.release()
+
+    def reject():
+        receiver.reject_call(route.addon_id, route.callback_name, call_id,
+                             CallThrottledError('The call has been rejected, too many calls from the add-on'))
+
+    admission_state.submit(execute, reject)
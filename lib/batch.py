@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Batch calls, multiple calls to the same add-on packed in a single RPC call
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from helper import (SER_TYPE_PICKLE, RETURN_CALL_PREFIX, BATCH_CALL_NAME, LANE_DEFAULT, AddonConnectorException,
+                    CallRejectedError, CallThrottledError, CallConfig, deserialize_data, is_large_payload,
+                    delete_large_payload)
+from rpc import send_rpc_call
+
+
+def group_calls(calls):
+    """
+    Group the calls by add-on ID
+    :param calls: list of tuples (CallConfig, args, kwargs)
+    :return: list of tuples (addon_id, indexes, entries, timeout_secs), where the indexes are the positions
+             of the entries in the list of the calls, and the timeout is the highest timeout of the configs
+    """
+    batches = {}
+    for index, (call_config, args, kwargs) in enumerate(calls):
+        batch = batches.setdefault(call_config.addon_id, ([], [], [0]))
+        batch[0].append(index)
+        batch[1].append((call_config.callback_name, tuple(args), dict(kwargs)))
+        batch[2][0] = max(batch[2][0], call_config.timeout_secs)
+    return [(addon_id, indexes, entries, timeout_secs[0])
+            for addon_id, (indexes, entries, timeout_secs) in batches.items()]
+
+
+def receive_batch_call(receiver, route, call_id, data):
+    """Execute a batch call received, that contains multiple calls packed in a single RPC call"""
+    # The file of a large payload is kept, because the batch call could be deserialized by more add-on instances
+    (entries,), _ = deserialize_data(route.ser_type, data, keep_large_payload=True)
+    if is_large_payload(data):
+        slots = receiver.router.slots
+        missing_names = {callback_name for callback_name, _, _ in entries
+                         if (route.addon_id, callback_name) not in slots}
+        if not missing_names.intersection(receiver.registry.get_callback_names(route.addon_id) or ()):
+            # No other add-on instance has registered the callbacks not registered by this instance
+            delete_large_payload(data)
+    execute_calls(receiver, route.addon_id, call_id, entries, route.caller_id)
+
+
+def execute_calls(receiver, addon_id, call_id, entries, caller_id=''):
+    """
+    Execute multiple calls, all the results are sent back with a single RPC return call.
+    Each call is subject to the admission control of its callback, as the calls received one by one
+    :param entries: list of tuples (callback_name, args, kwargs)
+    :param caller_id: the ID of the caller add-on, empty when unknown (the signals replayed from the outbox)
+    """
+    router = receiver.router
+    slots = {callback_name: router.slots[(addon_id, callback_name)] for callback_name, _, _ in entries
+             if (addon_id, callback_name) in router.slots}
+    if not slots:
+        # The calls are addressed to the callbacks registered on another add-on instance
+        return
+    admission_limits = {}
+    if router.admission_limits:
+        admission_limits = {callback_name: router.get_admission_limit(callback_name, caller_id)
+                            for callback_name in slots}
+    if any(admission_limits.values()):
+        batch_call = AdmittedBatchCall(receiver, slots, addon_id, call_id, len(entries))
+        func, args = batch_call.submit, (entries, admission_limits, caller_id)
+    else:
+        func, args = _execute_batch_call, (slots, addon_id, call_id, entries)
+    if any(slot.run_threaded for slot in slots.values()):
+        receiver.submit_call(addon_id, BATCH_CALL_NAME, call_id, LANE_DEFAULT, (addon_id, BATCH_CALL_NAME), None,
+                             func, args, {})
+    else:
+        func(*args)
+
+
+def _execute_batch_call(slots, addon_id, call_id, entries):
+    """Execute the calls of a batch call and send back all the results with a single RPC return call"""
+    results = [_execute_batch_entry(slots, callback_name, args, kwargs) for callback_name, args, kwargs in entries]
+    if call_id:
+        send_rpc_call(RETURN_CALL_PREFIX + BATCH_CALL_NAME, results, addon_id, SER_TYPE_PICKLE, call_id=call_id)
+
+
+def _execute_batch_entry(slots, callback_name, args, kwargs):
+    """Execute a call of a batch call, return the result"""
+    from envelope import EnvelopeFuncCallback
+    if callback_name not in slots:
+        return AddonConnectorException('The callback "{}" is not registered'.format(callback_name))
+    func = slots[callback_name].callback_func
+    if isinstance(func, EnvelopeFuncCallback):
+        return func.execute(args, kwargs)
+    # A custom action callback, that handle the RPC return call by itself
+    func(*args, **kwargs)
+    return None
+
+
+class AdmittedBatchCall:
+    """
+    The calls of a batch call subject to the admission control, each call is executed when admitted by the
+    admission control of its callback (the calls queued are executed on the thread pool of the default lane),
+    all the results are sent back with a single RPC return call when all the calls are executed or rejected
+    """
+    def __init__(self, receiver, slots, addon_id, call_id, entries_count):
+        from threading import Lock
+        self._dispatcher = receiver.lanes.get_dispatcher(LANE_DEFAULT)
+        self._slots = slots
+        self._addon_id = addon_id
+        self._call_id = call_id
+        self._results = [None] * entries_count
+        self._remaining_count = entries_count
+        self._lock = Lock()
+
+    def submit(self, entries, admission_limits, caller_id):
+        """Submit each call to the admission control of its callback"""
+        from functools import partial
+        for index, entry in enumerate(entries):
+            admission_limit = admission_limits.get(entry[0])
+            if admission_limit is None:
+                self._execute(index, entry, None, False)
+                continue
+            admission_state = admission_limit.get_state(caller_id)
+            admission_state.submit(partial(self._execute, index, entry, admission_state), partial(self._reject, index))
+
+    def _execute(self, index, entry, admission_state, is_queued):
+        if is_queued:
+            try:
+                self._dispatcher.submit((self._addon_id, BATCH_CALL_NAME), None,
+                                        self._execute, (index, entry, admission_state, False), {})
+            except CallRejectedError as exc:
+                admission_state.release()
+                self._set_result(index, exc)
+            return
+        try:
+            result = _execute_batch_entry(self._slots, *entry)
+        finally:
+            if admission_state is not None:
+                admission_state.release()
+        self._set_result(index, result)
+
+    def _reject(self, index):
+        self._set_result(index, CallThrottledError('The call has been rejected, too many calls from the add-on'))
+
+    def _set_result(self, index, result):
+        with self._lock:
+            self._results[index] = result
+            self._remaining_count -= 1
+            if self._remaining_count:
+                return
+        if self._call_id:
+            send_rpc_call(RETURN_CALL_PREFIX + BATCH_CALL_NAME, self._results, self._addon_id, SER_TYPE_PICKLE,
+                          call_id=self._call_id)
+
+
+class SignalBatcher:
+    """
+    Queue the signal calls and send them in batch, by packing the signals to the same add-on in a single RPC call.
+    The queued signals are sent when the flush interval is elapsed or the max batch size is reached,
+    the receiver unpack the batch and execute the callbacks as usual.
+    """
+    def __init__(self, flush_interval=0.1, max_batch_size=50, latest_wins=False):
+        """
+        :param flush_interval: maximum time in seconds that a signal can wait in the queue before being sent
+        :param max_batch_size: maximum number of signals packed in a single RPC call
+        :param latest_wins: if True, when a signal is queued, the previous queued signals to the same callback
+                            will be discarded (useful for progress or state updates)
+        """
+        from threading import Lock
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.latest_wins = latest_wins
+        self._queues = {}
+        self._lock = Lock()
+        self._timer = None
+
+    def make_signal_call(self, __call_config__: 'CallConfig', *args, **kwargs):
+        """
+        Queue a call to an add-on or service without wait to get any return data
+        :param __call_config__: The call configuration
+        """
+        entry = (__call_config__.callback_name, args, kwargs)
+        with self._lock:
+            queue = self._queues.setdefault(__call_config__.addon_id, [])
+            if self.latest_wins:
+                queue[:] = [_entry for _entry in queue if _entry[0] != entry[0]]
+            queue.append(entry)
+            if len(queue) >= self.max_batch_size:
+                entries = self._queues.pop(__call_config__.addon_id)
+            else:
+                entries = None
+                if self._timer is None:
+                    from threading import Timer
+                    self._timer = Timer(self.flush_interval, self.flush)
+                    self._timer.start()
+        if entries:
+            send_rpc_call(BATCH_CALL_NAME, ((entries,), {}), __call_config__.addon_id, SER_TYPE_PICKLE)
+
+    def flush(self):
+        """Send all the queued signals"""
+        with self._lock:
+            queues = self._queues
+            self._queues = {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for addon_id, entries in queues.items():
+            send_rpc_call(BATCH_CALL_NAME, ((entries,), {}), addon_id, SER_TYPE_PICKLE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Cache of the results of the RPC calls, to answer locally the calls to idempotent callbacks
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from time import monotonic
+
+
+class ResultCache:
+    """
+    LRU cache of the results of the calls to a callback, each entry expires after the TTL.
+    The results are copied when stored and returned, so the changes made by a caller are not seen by the others
+    """
+    def __init__(self, ttl, max_entries):
+        """
+        :param ttl: seconds after that an entry expires
+        :param max_entries: maximum number of entries, when exceeded the least recently used entry is discarded
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # Tuples (expiration time, result) by key
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return a tuple (is_cached, result)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, deepcopy(entry[1])
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, result):
+        """Add or replace an entry"""
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Delete all the entries"""
+        with self._lock:
+            self._entries.clear()
+
+
+def make_cache_key(args, kwargs):
+    """Return a stable key of the arguments of a call, made by the hash of the arguments serialized with pickle"""
+    from hashlib import sha1
+    from pickle import dumps
+    return sha1(dumps((args, tuple(sorted(kwargs.items()))), protocol=4)).digest()
+
+
+def _result_caches():
+    """Return the dict of the ResultCache instances by (addon_id, callback_name)"""
+    if not hasattr(_result_caches, 'cached'):
+        _result_caches.cached = {}
+    return _result_caches.cached
+
+
+def get_result_cache(addon_id, callback_name, ttl, max_entries):
+    """Return the ResultCache of a callback, the cache is shared by all the calls to the same callback"""
+    caches = _result_caches()
+    cache = caches.get((addon_id, callback_name))
+    if cache is None:
+        cache = caches.setdefault((addon_id, callback_name), ResultCache(ttl, max_entries))
+    else:
+        cache.ttl = ttl
+        cache.max_entries = max_entries
+    return cache
+
+
+def invalidate_result_caches(addon_id, callback_names=None):
+    """Delete the cached results of the callbacks of an add-on (callback_names None to delete all the results)"""
+    for (cache_addon_id, callback_name), cache in list(_result_caches().items()):
+        if cache_addon_id == addon_id and (callback_names is None or callback_name in callback_names):
+            cache.clear()
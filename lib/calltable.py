@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Table of the calls in progress of an add-on instance
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from helper import ABORT_WATCH_INTERVAL, CANCELLED_CALLS_SIZE, CancelToken, WaitTimeoutError
+
+
+class InflightCall:
+    """A call in progress, that share the result with the other calls waiting for it"""
+    def __init__(self):
+        from threading import Event
+        self.ret_data = None
+        self.event_done = Event()
+
+    def wait(self, timeout_secs):
+        """Wait the result of the call in progress"""
+        if not self.event_done.wait(timeout_secs):
+            raise WaitTimeoutError
+        if isinstance(self.ret_data, Exception):
+            raise self.ret_data
+        return self.ret_data
+
+
+class CallTable:
+    """
+    The calls in progress: the calls made that wait the RPC return call, the single-flight calls,
+    and the calls received that are in execution
+    """
+    def __init__(self):
+        from threading import Lock
+        self.pending_calls = {}
+        self._cancelled_call_ids = set()  # The IDs of the calls made by this instance and cancelled
+        self._inflight_calls = {}  # The single-flight calls in progress by key
+        self._cancel_tokens = {}  # The CancelToken of the received calls not yet completed, by call ID
+        self._lock = Lock()
+        self._abort_watcher = None
+
+    def add_pending_call(self, call_handler):
+        """Add a call that wait the RPC return call to the pending calls table"""
+        with self._lock:
+            self.pending_calls[call_handler.call_id] = call_handler
+
+    def remove_pending_call(self, call_handler):
+        """Remove a call that wait the RPC return call from the pending calls table"""
+        with self._lock:
+            self.pending_calls.pop(call_handler.call_id, None)
+
+    def get_pending_call(self, call_id, callback_name, addon_id):
+        """Get the pending call that is waiting the RPC return call"""
+        with self._lock:
+            if call_id:
+                return self.pending_calls.get(call_id)
+            # A return call made manually (by using 'make_return_call') can have no call ID,
+            # in this case we fall back to the oldest pending call made to the same callback
+            for call_handler in self.pending_calls.values():
+                call_config = call_handler.call_config
+                if call_config.callback_name == callback_name and call_config.addon_id == addon_id:
+                    return call_handler
+        return None
+
+    def add_cancelled_call(self, call_id):
+        """Add the ID of a call that is no longer waiting for the result"""
+        with self._lock:
+            if len(self._cancelled_call_ids) >= CANCELLED_CALLS_SIZE:
+                self._cancelled_call_ids.clear()
+            self._cancelled_call_ids.add(call_id)
+
+    def is_cancelled_call(self, call_id):
+        """Return True if a call made by this instance is no longer waiting for the result"""
+        with self._lock:
+            return call_id in self._cancelled_call_ids
+
+    def join_inflight_call(self, key, inflight_call):
+        """
+        Add a single-flight call in progress, if a call with the same key is already in progress return it
+        :return: None if the call has been added, otherwise the call in progress
+        """
+        with self._lock:
+            current_call = self._inflight_calls.get(key)
+            if current_call is None:
+                self._inflight_calls[key] = inflight_call
+            return current_call
+
+    def remove_inflight_call(self, key):
+        """Remove a single-flight call in progress"""
+        with self._lock:
+            self._inflight_calls.pop(key, None)
+
+    def add_cancel_token(self, call_id, deadline):
+        """Add the CancelToken of a received call"""
+        cancel_token = CancelToken(deadline)
+        with self._lock:
+            self._cancel_tokens[call_id] = cancel_token
+        return cancel_token
+
+    def remove_cancel_token(self, call_id):
+        """Remove the CancelToken of a received call, when the call is completed"""
+        with self._lock:
+            self._cancel_tokens.pop(call_id, None)
+
+    def cancel_call(self, call_id):
+        """Cancel a received call, when the caller is no longer waiting for the result"""
+        with self._lock:
+            cancel_token = self._cancel_tokens.pop(call_id, None)
+        if cancel_token is not None:
+            cancel_token.cancel()
+
+    def start_abort_watcher(self, monitor):
+        """Start the abort watcher, that will wake up the pending calls when Kodi request to abort"""
+        with self._lock:
+            if self._abort_watcher is None:
+                from threading import Thread
+                self._abort_watcher = Thread(target=self._watch_abort, args=(monitor,),
+                                             name='AddonConnectorAbortWatcher', daemon=True)
+                self._abort_watcher.start()
+
+    def _watch_abort(self, monitor):
+        """Shared watcher that wake up all pending calls when Kodi request to abort"""
+        # NOTE: A single thread is shared with all the pending calls, it stops itself when there are no more
+        #       pending calls, so it does not keep alive the add-on when the script execution is finished
+        while not monitor.waitForAbort(ABORT_WATCH_INTERVAL):
+            with self._lock:
+                if not self.pending_calls:
+                    self._abort_watcher = None
+                    return
+        with self._lock:
+            call_handlers = list(self.pending_calls.values())
+            self._abort_watcher = None
+        for call_handler in call_handlers:
+            call_handler.abort()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Dispatcher to execute the callbacks on a bounded pool of worker threads
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from collections import deque
+from threading import Condition, Thread
+from time import perf_counter
+
+from xbmc import log, LOGERROR
+
+from helper import CallRejectedError, LANE_DEFAULT, MAX_WORKERS, MAX_QUEUE_SIZE
+
+WORKER_IDLE_TIMEOUT = 5  # Seconds of inactivity after that a worker thread will be stopped
+
+
+class Lanes:
+    """The dispatchers of the lanes, each lane has its own queue and pool of worker threads"""
+    def __init__(self):
+        self.max_workers = MAX_WORKERS  # Default for the lanes not configured
+        self.max_queue_size = MAX_QUEUE_SIZE  # Default for the lanes not configured
+        self.config = {}  # Tuples (max_workers, max_queue_size) by lane
+        self.dispatchers = {}  # The dispatchers by lane
+
+    @property
+    def dispatcher(self):
+        """Return the dispatcher of the default lane"""
+        return self.get_dispatcher(LANE_DEFAULT)
+
+    def get_dispatcher(self, lane):
+        """Return the dispatcher used to execute the calls of a lane on a pool of threads"""
+        dispatcher = self.dispatchers.get(lane)
+        if dispatcher is None:
+            max_workers, max_queue_size = self.config.get(lane, (self.max_workers, self.max_queue_size))
+            dispatcher = self.dispatchers.setdefault(lane, CallDispatcher(max_workers, max_queue_size))
+        return dispatcher
+
+    def get_stats(self):
+        """Return the statistics of the dispatchers by lane"""
+        return {lane: dispatcher.get_stats() for lane, dispatcher in self.dispatchers.items()}
+
+
+class CallDispatcher:
+    """
+    Execute the callbacks on a bounded pool of worker threads.
+    The number of callbacks that are executed at same time can be limited for each slot,
+    when the limit is 1 the calls to the slot are executed one at a time in the same order in which they are received.
+    """
+    def __init__(self, max_workers, max_queue_size):
+        """
+        :param max_workers: maximum number of worker threads
+        :param max_queue_size: maximum number of calls waiting to be executed, when the limit is reached
+                               the new calls are rejected
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._cond = Condition()
+        self._ready_tasks = deque()  # Tasks ready to be executed by a worker
+        self._waiting_tasks = {}  # Tasks blocked by the concurrency limit of the slot, grouped by slot key
+        self._running_count = {}  # Number of tasks in execution (or ready to be executed), grouped by slot key
+        self._queued_count = 0
+        self._workers_count = 0
+        self._idle_workers_count = 0
+        self._executed_count = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    @property
+    def queued_count(self):
+        """Number of calls waiting to be executed"""
+        return self._queued_count
+
+    def get_stats(self):
+        """
+        Return the statistics of the dispatcher, a dict with the number of calls waiting to be executed ('queued'),
+        the number of executed calls ('executed'), and the mean and the max time waited by the calls before
+        the execution ('mean_wait_ms', 'max_wait_ms')
+        """
+        with self._cond:
+            return {
+                'queued': self._queued_count,
+                'executed': self._executed_count,
+                'mean_wait_ms': (self._total_wait_time / self._executed_count * 1000
+                                 if self._executed_count else None),
+                'max_wait_ms': self._max_wait_time * 1000
+            }
+
+    def submit(self, slot_key, max_concurrency, func, args=(), kwargs=None):
+        """
+        Submit a callback to be executed
+        :param slot_key: the key that identify the slot
+        :param max_concurrency: maximum number of calls of the slot executed at same time (None for no limit)
+        :param func: the function to execute
+        :raise CallRejectedError: if the queue is full
+        """
+        task = (slot_key, func, args, kwargs or {}, perf_counter())
+        with self._cond:
+            if self._queued_count >= self.max_queue_size:
+                raise CallRejectedError('The call has been rejected, too many calls in queue')
+            self._queued_count += 1
+            if max_concurrency and self._running_count.get(slot_key, 0) >= max_concurrency:
+                self._waiting_tasks.setdefault(slot_key, deque()).append(task)
+                return
+            self._running_count[slot_key] = self._running_count.get(slot_key, 0) + 1
+            self._ready_tasks.append(task)
+            self._wake_worker()
+
+    def _wake_worker(self):
+        if self._idle_workers_count:
+            self._cond.notify()
+        # The notified workers are still counted as idle until they wake up,
+        # so a new worker is started only when there are more tasks ready than idle workers
+        if len(self._ready_tasks) > self._idle_workers_count and self._workers_count < self.max_workers:
+            self._workers_count += 1
+            Thread(target=self._worker, name='AddonConnectorWorker', daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready_tasks:
+                    self._idle_workers_count += 1
+                    is_notified = self._cond.wait(WORKER_IDLE_TIMEOUT)
+                    self._idle_workers_count -= 1
+                    if not is_notified and not self._ready_tasks:
+                        self._workers_count -= 1
+                        return
+                slot_key, func, args, kwargs, submit_time = self._ready_tasks.popleft()
+                self._queued_count -= 1
+                wait_time = perf_counter() - submit_time
+                self._executed_count += 1
+                self._total_wait_time += wait_time
+                if wait_time > self._max_wait_time:
+                    self._max_wait_time = wait_time
+            try:
+                func(*args, **kwargs)
+            except Exception:  # pylint: disable=broad-except
+                from traceback import format_exc
+                log(format_exc(), LOGERROR)
+            finally:
+                self._task_done(slot_key)
+
+    def _task_done(self, slot_key):
+        with self._cond:
+            waiting_tasks = self._waiting_tasks.get(slot_key)
+            if waiting_tasks:
+                # The next call of the slot take the place of the finished one
+                self._ready_tasks.append(waiting_tasks.popleft())
+                if not waiting_tasks:
+                    del self._waiting_tasks[slot_key]
+            elif self._running_count[slot_key] > 1:
+                self._running_count[slot_key] -= 1
+            else:
+                del self._running_count[slot_key]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Envelope of the functions of the callbacks, that send the RPC return calls to the caller
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import metrics
+
+from helper import (SER_TYPE_PICKLE, SER_TYPE_STRING, SER_TYPE_NONE, SER_TYPE_BYTES, RETURN_CALL_PREFIX,
+                    RETURN_STREAM_PREFIX, STREAM_CHUNK_SIZE, AddonConnectorException, OperationAbortedError,
+                    set_cancel_token)
+from rpc import send_rpc_call
+
+
+class EnvelopeFuncCallback:
+    """Envelope a function in order to handle a return call and catching, conversion, forwarding of exceptions"""
+    def __init__(self, func, callback_name, addon_id, receiver, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        :param receiver: the CallReceiver that receive the calls to the callback
+        """
+        from inspect import iscoroutinefunction
+        self._func = func
+        self._callback_name = callback_name
+        self._addon_id = addon_id
+        self._receiver = receiver
+        self._chunk_size = chunk_size
+        self._is_coroutine = iscoroutinefunction(func)
+
+    @property
+    def callback_name(self):
+        """The name of the callback"""
+        return self._callback_name
+
+    @property
+    def is_coroutine(self):
+        """True if the enveloped function is a coroutine function"""
+        return self._is_coroutine
+
+    def execute(self, args, kwargs, consume_generator=True):
+        """
+        Execute the enveloped function and return the returned data or the raised exception
+        :param consume_generator: if True a returned generator is consumed and its items are returned in a list
+        """
+        from inspect import isgenerator
+        try:
+            if self._is_coroutine:
+                # NOTE: This blocks the current thread until the coroutine is completed on the event loop
+                return self._run_coroutine(args, kwargs).result()
+            ret_data = self._func(*args, **kwargs)
+            if consume_generator and isgenerator(ret_data):
+                return list(ret_data)
+            return ret_data
+        except Exception as exc:  # pylint: disable=broad-except
+            return exc
+
+    def call_func(self, call_id, ser_type_return, args, kwargs, cancel_token=None, on_done=None):
+        """
+        Forwards the call to the enveloped function
+        :param on_done: function called when a coroutine is done, only when the call returns True
+        :return: True if a coroutine has been scheduled on the event loop and is still in execution
+        """
+        if metrics.enabled:
+            start_time = metrics.start(metrics.STAGE_EXECUTE, self._callback_name)
+            try:
+                return self._call_func(call_id, ser_type_return, args, kwargs, cancel_token, on_done)
+            finally:
+                metrics.end(metrics.STAGE_EXECUTE, self._callback_name, start_time)
+        return self._call_func(call_id, ser_type_return, args, kwargs, cancel_token, on_done)
+
+    def _call_func(self, call_id, ser_type_return, args, kwargs, cancel_token, on_done):
+        calls = self._receiver.calls
+        if cancel_token is not None and cancel_token.is_cancelled:
+            # The caller is no longer waiting for the result (e.g. the call has waited too long in the queue)
+            calls.remove_cancel_token(call_id)
+            return None
+        if self._is_coroutine:
+            from functools import partial
+            try:
+                future = self._run_coroutine(args, kwargs)
+            except AddonConnectorException as exc:
+                calls.remove_cancel_token(call_id)
+                return self._make_return_call(call_id, ser_type_return, exc)
+            if cancel_token is not None:
+                cancel_token.add_cancel_callback(future.cancel)
+            future.add_done_callback(partial(self._on_coroutine_done, call_id, ser_type_return, cancel_token, on_done))
+            return True
+        from inspect import isgenerator
+        # The items of a generator are streamed, except to the calls received from the Unix domain socket
+        socket_transport = self._receiver.socket_transport
+        is_socket_call = socket_transport is not None and socket_transport.is_socket_call(call_id)
+        # The callback can get the token with 'get_cancel_token' to stop the work when the call is cancelled
+        set_cancel_token(cancel_token)
+        try:
+            ret_data = self.execute(args, kwargs, consume_generator=is_socket_call)
+            if isgenerator(ret_data):
+                return self._stream_items(call_id, ser_type_return, ret_data, cancel_token)
+        finally:
+            set_cancel_token(None)
+            if cancel_token is not None:
+                calls.remove_cancel_token(call_id)
+        if cancel_token is not None and cancel_token.is_cancelled:
+            return None
+        return self._make_return_call(call_id, ser_type_return, ret_data)
+
+    def _stream_items(self, call_id, ser_type_return, generator, cancel_token):
+        """Send the items of a generator to the caller in chunks, each one with a RPC return call"""
+        if ser_type_return in [SER_TYPE_STRING, SER_TYPE_NONE, SER_TYPE_BYTES]:
+            # The chunks are tuples (items, is_last) that can not be serialized with these types
+            ser_type_return = SER_TYPE_PICKLE
+        chunk = []
+        try:
+            for item in generator:
+                if not call_id:
+                    # The call has been made by 'make_signal_call', the items are only consumed
+                    continue
+                chunk.append(item)
+                if len(chunk) >= self._chunk_size:
+                    if cancel_token.is_cancelled:
+                        # The caller has stopped to iterate the items
+                        generator.close()
+                        return None
+                    send_rpc_call(RETURN_STREAM_PREFIX + self._callback_name, (chunk, False), self._addon_id,
+                                  ser_type_return, call_id=call_id)
+                    chunk = []
+        except Exception as exc:  # pylint: disable=broad-except
+            return self._make_return_call(call_id, ser_type_return, exc)
+        if not call_id or cancel_token.is_cancelled:
+            return None
+        return send_rpc_call(RETURN_STREAM_PREFIX + self._callback_name, (chunk, True), self._addon_id,
+                             ser_type_return, call_id=call_id)
+
+    def _run_coroutine(self, args, kwargs):
+        """Schedule the coroutine on the event loop, return a concurrent.futures.Future"""
+        from asyncio import run_coroutine_threadsafe
+        loop = self._receiver.event_loop
+        if loop is None:
+            raise AddonConnectorException('The callback "{}" is a coroutine function, but the event loop has not '
+                                          'been set with use_event_loop'.format(self._callback_name))
+        return run_coroutine_threadsafe(self._func(*args, **kwargs), loop)
+
+    def _on_coroutine_done(self, call_id, ser_type_return, cancel_token, on_done, future):
+        if on_done is not None:
+            on_done()
+        if cancel_token is not None:
+            self._receiver.calls.remove_cancel_token(call_id)
+            if cancel_token.is_cancelled:
+                return
+        if future.cancelled():
+            ret_data = OperationAbortedError()
+        else:
+            ret_data = future.exception() or future.result()
+        self._make_return_call(call_id, ser_type_return, ret_data)
+
+    def _make_return_call(self, call_id, ser_type_return, ret_data):
+        if not call_id:
+            # The call has been made by 'make_signal_call', no one is waiting for the RPC return call
+            return None
+        socket_transport = self._receiver.socket_transport
+        if socket_transport is not None and socket_transport.return_call(call_id, ret_data):
+            # The call has been received from the Unix domain socket, the data are sent back by the socket server
+            return None
+        return send_rpc_call(RETURN_CALL_PREFIX + self._callback_name,
+                             ret_data,
+                             self._addon_id,
+                             SER_TYPE_PICKLE if isinstance(ret_data, Exception) else ser_type_return,
+                             call_id=call_id)
@@ -8,21 +8,60 @@
     See LICENSE.txt for more information.
 """
 RETURN_CALL_PREFIX = '__returncall__'
+RETURN_STREAM_PREFIX = '__returnstream__'  # Return calls with a chunk of the items of a streamed result
+BATCH_CALL_NAME = '__batchcall__'
+CACHE_INVALIDATION_NAME = '__invalidatecache__'
+CANCEL_CALL_NAME = '__cancelcall__'
+# Signal sent by an add-on instance to announce its registered callbacks (also when the add-on service is ready)
+ANNOUNCE_SIGNAL_NAME = '__announce__'
+DEADLINE_SEPARATOR = '-'  # Separate the call ID from the deadline of the call, in the message of the RPC call
 SENDER_ID_SUFFIX = '.ADDONCONNECTOR'
+CALLER_ID_SEPARATOR = '/'  # Separate the ID of the add-on to call from the ID of the caller add-on, in the sender
+MAX_WORKERS = 8  # Default maximum number of worker threads used to execute the callbacks
+STREAM_CHUNK_SIZE = 100  # Default number of items of a streamed result sent with each RPC return call
+LANE_DEFAULT = 'default'  # The lane of the callbacks registered without a lane
+MAX_QUEUE_SIZE = 100  # Default maximum number of calls waiting a worker thread, the next calls will be rejected
+LARGE_PAYLOAD_THRESHOLD = 1048576  # Default size in bytes from which the data are transferred with a temporary file
+LARGE_PAYLOAD_EXPIRATION = 300  # Seconds after that the temporary files of large payloads never read are deleted
+# Markers placed before the data, they must not be used by base64 encoding
+LARGE_PAYLOAD_MARKER = ':'  # Identify the file name of a large payload in place of the data
+COMPRESSED_DATA_MARKER = ','  # Identify the data compressed with zlib
+ROUTES_CACHE_SIZE = 256  # Maximum number of routes of the notifications cached by the receiver
+CANCELLED_CALLS_SIZE = 256  # Maximum number of IDs of the cancelled calls, kept to delete the files of late results
+MESSAGE_TEMPLATES_CACHE_SIZE = 256  # Maximum number of templates of the messages of the RPC calls kept in cache
+READY_EXPIRATION = 120  # Seconds after that a service that has not refreshed its readiness is considered not running
+OUTBOX_FSYNC_INTERVAL = 1  # Minimum seconds between each sync to the disk of the outbox file
+ABORT_WATCH_INTERVAL = 0.1  # Seconds between each check of the Kodi abort request, made by the shared abort watcher
+ANNOUNCE_DELAY = 0.1  # Seconds the announcement of the callbacks is delayed, to announce together the callbacks registered
+
+# Policies of the admission control for the calls over the limits:
+ADMISSION_REJECT = 'reject'  # The call is rejected
+ADMISSION_QUEUE = 'queue'  # The call wait to be admitted, when the queue is full the call is rejected
+ADMISSION_DROP_OLDEST = 'dropoldest'  # The call wait to be admitted, when the queue is full the oldest call is rejected
 
 # Types of data serialization:
 SER_TYPE_PICKLE = 'pickle'
 """Pickle serialization: unlike JSON this is much faster and can serialize python objects"""
+SER_TYPE_PICKLE_COMPACT = 'picklecompact'
+"""Pickle serialization with zlib compression of the data larger than 1 KiB: the data sent to Kodi JSON-RPC
+of a Kodi directory listing are from 3 to 10 times smaller, at the cost of about 0.1 ms more to serialize the data,
+the small data are sent as with SER_TYPE_PICKLE"""
 SER_TYPE_JSON = 'json'
 """Json serialization: can serialize only JSON format type"""
 SER_TYPE_STRING = 'str'  # To the receiver the callback function should not have more than one mandatory arguments
 """String (utf-8): fastest method without serialization"""
 SER_TYPE_NONE = 'none'  # To the receiver the callback function should not have mandatory arguments
 """Force no serialization and no data will be sent"""
+SER_TYPE_BYTES = 'bytes'  # To the receiver the callback function should not have more than one mandatory arguments
+"""Binary data (any object that support the buffer protocol) sent without serialization and copies,
+the receiver get a bytes or memoryview object"""
+SER_TYPE_PICKLE_OOB = 'pickleoob'
+"""Pickle serialization with protocol 5 (Python 3.8 or later), the large buffers of the objects that support
+the out-of-band data (e.g. pickle.PickleBuffer, numpy arrays) are not copied into the pickle data"""
 
 JSONRPC_NOTIFYALL_STR = (
     '{{"id": 0, "jsonrpc": "2.0", "method": "JSONRPC.NotifyAll", "params": '
-    '{{"message": "{callback_name}.{ser_type}.{ser_type_return}",'
+    '{{"message": "{callback_name}.{ser_type}.{ser_type_return}.{call_id}",'
     ' "sender": "{sender_id}{sender_id_suffix}", "data": "{data}"}}'
     '}}')
 
@@ -39,6 +78,26 @@ class OperationAbortedError(AddonConnectorException):
     """Kodi has requested to abort the operation"""
 
 
+class CallRejectedError(AddonConnectorException):
+    """The call has been rejected by the receiver add-on"""
+
+
+class CallThrottledError(CallRejectedError):
+    """The call has been rejected by the admission control of the receiver add-on (too many calls)"""
+
+
+class CallCancelledError(AddonConnectorException):
+    """The call has been cancelled by the caller add-on (the caller is no longer waiting for the result)"""
+
+
+class ServiceNotReadyError(AddonConnectorException):
+    """The add-on to call has not announced any registered callback (e.g. the add-on service is not running)"""
+
+
+class CallbackNotFoundError(AddonConnectorException):
+    """The callback to call is not registered by the add-on to call"""
+
+
 def get_addon_id():
     """Return the Kodi add-on ID of the add-on that has loaded the module"""
     if not hasattr(get_addon_id, 'cached'):
@@ -47,81 +106,640 @@ def get_addon_id():
     return get_addon_id.cached
 
 
-def deserialize_data(ser_type, data):
-    """Deserialize the data according to the specified serialisation type"""
-    from base64 import b64decode
-    if ser_type == SER_TYPE_PICKLE:
+def get_instance_id():
+    """Return the ID that identify the add-on instance (the Python interpreter) that has loaded the module"""
+    if not hasattr(get_instance_id, 'cached'):
+        from uuid import uuid4
+        get_instance_id.cached = uuid4().hex[:12]
+    return get_instance_id.cached
+
+
+def new_call_id():
+    """
+    Return a new call ID, used to route the RPC return call to the call that is waiting for it.
+    The RPC calls are notified to all add-ons, so the ID must be unique also between the add-ons
+    """
+    if not hasattr(new_call_id, 'counter'):
+        from itertools import count
+        new_call_id.prefix = get_instance_id()
+        new_call_id.counter = count(1)
+    return '{}{:x}'.format(new_call_id.prefix, next(new_call_id.counter))
+
+
+def pack_call_id(call_id, deadline):
+    """Add the deadline (the epoch time after that the caller stops to wait) to the call ID sent with the call"""
+    return '{}{}{}'.format(call_id, DEADLINE_SEPARATOR, int(deadline * 1000))
+
+
+def unpack_call_id(value):
+    """Return a tuple (call_id, deadline) from the call ID received with the call, the deadline can be None"""
+    call_id, _, deadline = value.partition(DEADLINE_SEPARATOR)
+    return call_id, int(deadline) / 1000 if deadline else None
+
+
+class CancelToken:
+    """
+    Cooperative cancellation of a call, a callback can get the token of the call in execution with
+    'get_cancel_token' and check it to stop a long work when the caller is no longer waiting for the result
+    """
+    def __init__(self, deadline=None):
+        """
+        :param deadline: the epoch time after that the caller stops to wait the result, None for no deadline
+        """
+        self.deadline = deadline
+        self._is_cancelled = False
+        self._cancel_callbacks = []
+
+    @property
+    def is_cancelled(self):
+        """True if the call has been cancelled or the deadline has passed"""
+        if self._is_cancelled:
+            return True
+        if self.deadline is not None:
+            from time import time
+            return time() > self.deadline
+        return False
+
+    def cancel(self):
+        """Cancel the call"""
+        self._is_cancelled = True
+        for callback in self._cancel_callbacks:
+            callback()
+
+    def add_cancel_callback(self, callback):
+        """Add a function (without arguments) called when the call is cancelled"""
+        self._cancel_callbacks.append(callback)
+
+    def raise_if_cancelled(self):
+        """
+        Raise CallCancelledError if the call has been cancelled
+        :raise CallCancelledError: if the call has been cancelled or the deadline has passed
+        """
+        if self.is_cancelled:
+            raise CallCancelledError
+
+
+def get_running_loop():
+    """
+    Return the asyncio event loop running in the current thread
+    :raise RuntimeError: if there is no running event loop
+    """
+    import asyncio
+    if hasattr(asyncio, 'get_running_loop'):
+        return asyncio.get_running_loop()
+    # Python 3.6 and older
+    loop = asyncio._get_running_loop()  # pylint: disable=protected-access,no-member
+    if loop is None:
+        raise RuntimeError('no running event loop')
+    return loop
+
+
+def _cancel_tokens_local():
+    """Return the thread-local storage of the token of the call in execution"""
+    if not hasattr(_cancel_tokens_local, 'cached'):
+        from threading import local
+        _cancel_tokens_local.cached = local()
+    return _cancel_tokens_local.cached
+
+
+def get_cancel_token():
+    """
+    Return the CancelToken of the call in execution on the current thread,
+    if the callback has not been executed by an RPC call return a token never cancelled
+    (not supported by coroutine callbacks, that are cancelled on the event loop)
+    """
+    return getattr(_cancel_tokens_local(), 'token', None) or CancelToken()
+
+
+def set_cancel_token(token):
+    """Set the CancelToken of the call in execution on the current thread, return the previous token"""
+    tokens_local = _cancel_tokens_local()
+    previous_token = getattr(tokens_local, 'token', None)
+    tokens_local.token = token
+    return previous_token
+
+
+class Codec:
+    """
+    Base class of the codecs used to serialize the data of a type of data serialization.
+    A codec convert the data to bytes and vice versa, then the bytes are converted to an ASCII string with
+    base64 encoding, so that the data can be sent within the Kodi JSON-RPC call.
+    The built-in codecs import the modules on the first use, then keep the imported functions in private attributes
+    of the instance, so the next calls do not repeat the imports (a subclass that overrides __init__ must call it)
+    """
+    compression_threshold = 0
+    """The size in bytes from which the data are compressed with zlib, 0 to never compress the data"""
+    compression_level = 1
+    """The zlib compression level, the higher levels make the data a bit smaller but are much slower"""
+
+    def __init__(self):
+        # The functions of the base64 encoding, imported on the first use
+        self._b_encode = None
+        self._b_decode = None
+
+    def encode(self, data):
+        """Convert the data to bytes"""
+        raise NotImplementedError
+
+    def decode(self, data):
+        """Convert the bytes (or an object that support the buffer protocol) to the data"""
+        raise NotImplementedError
+
+    def to_text(self, data):
+        """Convert the bytes to an ASCII string"""
+        if self._b_encode is None:
+            from base64 import b64encode
+            self._b_encode = b64encode
+        return self._b_encode(data).decode('ascii')
+
+    def from_text(self, data):
+        """Convert an ASCII string to bytes"""
+        if self._b_decode is None:
+            from base64 import b64decode
+            # The data received from Kodi notification is a JSON string, the quotes are ignored by b64decode
+            self._b_decode = b64decode
+        return self._b_decode(data)
+
+
+class PickleCodec(Codec):
+    """Codec for pickle serialization"""
+    def __init__(self):
+        super().__init__()
+        self._dumps = None
+        self._loads = None
+
+    def encode(self, data):
+        if self._dumps is None:
+            from pickle import dumps, HIGHEST_PROTOCOL
+            self._dumps = lambda _data: dumps(_data, HIGHEST_PROTOCOL)
+        return self._dumps(data)
+
+    def decode(self, data):
+        if self._loads is None:
+            from pickle import loads
+            self._loads = loads
+        return self._loads(data)
+
+
+class CompactPickleCodec(PickleCodec):
+    """Codec for pickle serialization, with compression of the data larger than 1 KiB"""
+    compression_threshold = 1024
+
+
+class JsonCodec(Codec):
+    """Codec for JSON serialization"""
+    def __init__(self):
+        super().__init__()
+        self._dumps = None
+        self._loads = None
+
+    def encode(self, data):
+        if self._dumps is None:
+            # Here you could think to return the json.dumps directly,
+            # but Kodi performs others internal JSON conversions and this makes performance much worse
+            from json import dumps
+            self._dumps = dumps
+        return self._dumps(data).encode('utf-8')
+
+    def decode(self, data):
+        if self._loads is None:
+            from json import loads
+            self._loads = loads
+        # NOTE: With Python 3.5 and older json.loads() does not support bytes or bytearray,
+        #       and in any case it does not support the other objects with buffer protocol (like mmap)
+        return self._loads(str(data, 'utf-8'))
+
+
+def _get_single_argument(data, ser_type, default):
+    """Return the only argument of the call data (args, kwargs), used by the types without serialization"""
+    if not isinstance(data, tuple):
+        return data
+    if data[1]:
+        raise AddonConnectorException('With {} kwargs are not supported'.format(ser_type))
+    args_count = len(data[0])
+    if args_count > 1:
+        raise AddonConnectorException('With {} only until to one argument is supported'.format(ser_type))
+    return data[0][0] if args_count == 1 else default
+
+
+class StringCodec(Codec):
+    """Codec for string (utf-8), without serialization"""
+    def encode(self, data):
+        _data = _get_single_argument(data, 'SER_TYPE_STRING', '')
+        if not isinstance(_data, str):
+            raise AddonConnectorException('The data are not of string type')
+        return _data.encode('utf-8')
+
+    def decode(self, data):
+        return str(data, 'utf-8')
+
+
+class BytesCodec(Codec):
+    """Codec for binary data, without serialization"""
+    def encode(self, data):
+        _data = _get_single_argument(data, 'SER_TYPE_BYTES', b'')
+        try:
+            # The view allow to encode the data without copy them, whatever the type of the object
+            view = memoryview(_data)
+        except TypeError:
+            raise AddonConnectorException('The data do not support the buffer protocol') from None
+        if not view.c_contiguous:
+            view = memoryview(view.tobytes())
+        return view.cast('B')
+
+    def decode(self, data):
+        if isinstance(data, bytes):
+            return data
+        if isinstance(data, bytearray):
+            return memoryview(data)
+        # A memory-mapped file of a large payload, that will be closed after the decoding
+        return bytes(data)
+
+
+class OutOfBandPickleCodec(Codec):
+    """
+    Codec for pickle serialization with protocol 5, the out-of-band buffers are appended after the pickle data.
+    The data have the number of buffers and the size of each buffer, then the buffers and the pickle data
+    """
+    def __init__(self):
+        super().__init__()
+        self._encode = None
+        self._decode = None
+
+    def encode(self, data):
+        if self._encode is None:
+            self._encode = self._import_encode()
+        return self._encode(data)
+
+    def decode(self, data):
+        if self._decode is None:
+            self._decode = self._import_decode()
+        return self._decode(data)
+
+    @staticmethod
+    def _import_encode():
+        from pickle import dumps, HIGHEST_PROTOCOL
+        from struct import pack
+        if HIGHEST_PROTOCOL < 5:
+            raise AddonConnectorException('SER_TYPE_PICKLE_OOB requires Python 3.8 or later')
+
+        def encode(_data):
+            buffers = []
+            pickled_data = dumps(_data, 5, buffer_callback=buffers.append)
+            views = [buffer.raw() for buffer in buffers]
+            header = pack('>I{}Q'.format(len(views)), len(views), *(view.nbytes for view in views))
+            # The buffers are copied only once, when they are joined to the data
+            return b''.join([header] + views + [pickled_data])
+
+        return encode
+
+    @staticmethod
+    def _import_decode():
         from pickle import loads
-        data = b64decode(data)
-        return loads(data)
-    if ser_type == SER_TYPE_JSON:
-        from json import loads
-        from sys import version_info
-        _data = b64decode(data)
-        # NOTE: With Python 3.5 and older json.loads() does not support bytes or bytearray
-        return loads(_data if version_info > (3, 5) else _data.decode('utf-8'))
-    if ser_type == SER_TYPE_STRING:
-        return b64decode(data).decode('utf-8')
-    if ser_type == SER_TYPE_NONE:
+        from struct import unpack_from
+
+        def decode(_data):
+            if not isinstance(_data, (bytes, bytearray)):
+                # A memory-mapped file of a large payload, the objects could keep a reference to the buffers
+                # but the file will be closed after the decoding
+                _data = bytes(_data)
+            view = memoryview(_data)
+            buffers_count = unpack_from('>I', view)[0]
+            offset = 4 + 8 * buffers_count
+            buffers = []
+            for size in unpack_from('>{}Q'.format(buffers_count), view, 4):
+                buffers.append(view[offset:offset + size])
+                offset += size
+            return loads(view[offset:], buffers=buffers)
+
+        return decode
+
+
+class NoneCodec(Codec):
+    """Codec that force no serialization, no data will be sent"""
+    def encode(self, data):
+        return b''
+
+    def decode(self, data):
         return None
-    raise AddonConnectorException('The specified type of serialization "{}" is not supported'.format(ser_type))
 
 
-def serialize_data(ser_type, data):
-    """Serialize the data according to the specified serialisation type"""
+CODECS = {
+    SER_TYPE_PICKLE: PickleCodec(),
+    SER_TYPE_PICKLE_COMPACT: CompactPickleCodec(),
+    SER_TYPE_JSON: JsonCodec(),
+    SER_TYPE_STRING: StringCodec(),
+    SER_TYPE_NONE: NoneCodec(),
+    SER_TYPE_BYTES: BytesCodec(),
+    SER_TYPE_PICKLE_OOB: OutOfBandPickleCodec()
+}
+
+
+def register_codec(ser_type, codec):
+    """
+    Register a codec for a new type of data serialization, must be registered by the sender and receiver add-ons
+    :param ser_type: the name of the type of data serialization (only alphanumeric characters)
+    :param codec: the Codec object
+    """
+    if not ser_type.isalnum():
+        raise AddonConnectorException('The name of the type of serialization must have only alphanumeric characters')
+    CODECS[ser_type] = codec
+
+
+def get_codec(ser_type):
+    """Return the codec of the specified type of data serialization"""
+    try:
+        return CODECS[ser_type]
+    except KeyError:
+        raise AddonConnectorException('The specified type of serialization "{}" is not supported'
+                                      .format(ser_type)) from None
+
+
+def deserialize_data(ser_type, data, keep_large_payload=False):
+    """
+    Deserialize the data according to the specified serialisation type
+    :param keep_large_payload: if True the file of a large payload will not be deleted after reading,
+                               used when the data could be deserialized by more receivers
+    """
+    codec = get_codec(ser_type)
+    # The data received from Kodi notification is a JSON string (so the marker can be after the opening quote)
+    if is_large_payload(data):
+        return _read_large_payload(codec, data.strip('"')[1:], keep_large_payload)
+    if COMPRESSED_DATA_MARKER in data[:2]:
+        from zlib import decompress
+        return codec.decode(decompress(codec.from_text(data.strip('"')[1:])))
+    return codec.decode(codec.from_text(data))
+
+
+def decode_data(ser_type, data):
+    """Decode the data (an object that support the buffer protocol) according to the specified serialisation type"""
+    return get_codec(ser_type).decode(data)
+
+
+def serialize_data(ser_type, data, allow_large_payload=True):
+    """
+    Serialize the data according to the specified serialisation type
+    :param allow_large_payload: if False the large data are never transferred with a temporary file
+    """
     # NOTE: The return data must be always an ASCII string because we perform the Kodi JSON-RPC call
-    #       with a string (see _make_signal_call) this allow us to avoid to the slow JSON encoding, then we are
+    #       with a string (see rpc.send_rpc_call) this allow us to avoid to the slow JSON encoding, then we are
     #       forced to serialise the data with b64encode to have an ASCII string but is much faster than JSON
-    from base64 import b64encode
-    if ser_type == SER_TYPE_PICKLE:
-        from pickle import dumps, HIGHEST_PROTOCOL
-        _data = dumps(data, HIGHEST_PROTOCOL)
-        return b64encode(_data).decode('ascii')
-    if ser_type == SER_TYPE_JSON:
-        # Here you could think to return the json.dumps directly,
-        # but Kodi performs others internal JSON conversions and this makes performance much worse
-        from json import dumps
-        _data = dumps(data).encode('utf-8')
-        return b64encode(_data).decode('ascii')
-    if ser_type == SER_TYPE_STRING:
-        if isinstance(data, tuple):
-            if data[1]:
-                raise AddonConnectorException('With SER_TYPE_STRING kwargs are not supported')
-            args_count = len(data[0])
-            if args_count > 1:
-                raise AddonConnectorException('With SER_TYPE_STRING only until to one argument is supported')
-            if args_count == 1:
-                _data = data[0][0]
-            else:
-                _data = ''
-        else:
-            _data = data
-        if not isinstance(_data, str):
-            raise AddonConnectorException('The data are not of string type')
-        return b64encode(_data.encode('utf-8')).decode('ascii')
-    if ser_type == SER_TYPE_NONE:
+    codec = get_codec(ser_type)
+    _data = codec.encode(data)
+    if not _data:
         return ''
-    raise AddonConnectorException('The specified type of serialization "{}" is not supported'.format(ser_type))
+    threshold = serialize_data.large_payload_threshold
+    if threshold and allow_large_payload and len(_data) >= threshold:
+        # Large data are not sent with Kodi JSON-RPC but saved to a temporary file, then is sent only the file name
+        return LARGE_PAYLOAD_MARKER + _write_large_payload(_data)
+    if codec.compression_threshold and len(_data) >= codec.compression_threshold:
+        from zlib import compress
+        return COMPRESSED_DATA_MARKER + codec.to_text(compress(_data, codec.compression_level))
+    return codec.to_text(_data)
+
+
+serialize_data.large_payload_threshold = LARGE_PAYLOAD_THRESHOLD
+
+
+def encode_data(ser_type, data):
+    """Encode the data to bytes according to the specified serialisation type"""
+    return get_codec(ser_type).encode(data)
+
+
+def set_large_payload_threshold(threshold=LARGE_PAYLOAD_THRESHOLD):
+    """
+    Set the size from which the serialized data are transferred with a temporary file,
+    instead of being sent within the Kodi JSON-RPC call. Only the data sent by this add-on are affected,
+    the receiver add-ons recognize the large payloads by the data themselves, whatever threshold they have set
+    :param threshold: the size in bytes, 0 to always send the data within the Kodi JSON-RPC call
+    """
+    serialize_data.large_payload_threshold = threshold
+
+
+def get_temp_dir():
+    """
+    Return the path of the private temporary folder within the Kodi temp folder,
+    where are saved the files of the large payloads, the sockets and the readiness markers
+    :raise AddonConnectorException: if the folder is owned by another user or it is a symbolic link
+    """
+    if not hasattr(get_temp_dir, 'cached'):
+        from os import makedirs
+        from os.path import normpath
+        from xbmcvfs import translatePath
+        path = normpath(translatePath('special://temp/addonconnector/'))
+        # The files are loaded with pickle, so no one else must be able to write to the folder
+        makedirs(path, mode=0o700, exist_ok=True)
+        _check_private_dir(path)
+        get_temp_dir.cached = path
+    return get_temp_dir.cached
+
+
+def _check_private_dir(path):
+    """Check that a folder can be accessed only by the current user, the permissions are restricted if needed"""
+    import os
+    from stat import S_ISDIR, S_IMODE
+    dir_stat = os.lstat(path)
+    if not S_ISDIR(dir_stat.st_mode):
+        raise AddonConnectorException('The temporary folder "{}" is not a folder'.format(path))
+    if not hasattr(os, 'getuid'):  # Windows, the folder inherit the permissions of the user profile folder
+        return
+    if dir_stat.st_uid != os.getuid():
+        raise AddonConnectorException('The temporary folder "{}" is owned by another user'.format(path))
+    if S_IMODE(dir_stat.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+
+
+def _write_large_payload(data):
+    """Write the data to a new temporary file and return the file name"""
+    from os.path import join
+    from time import time
+    from uuid import uuid4
+    path = get_temp_dir()
+    if time() > _write_large_payload.cleanup_time:
+        _delete_expired_large_payloads(path)
+        _write_large_payload.cleanup_time = time() + LARGE_PAYLOAD_EXPIRATION
+    file_name = uuid4().hex
+    with open(join(path, file_name), 'wb') as file_handle:
+        file_handle.write(data)
+    return file_name
+
+
+_write_large_payload.cleanup_time = 0
+
+
+def _read_large_payload(codec, file_name, keep_file):
+    """Read the data from a temporary file, the data are decoded directly from the memory-mapped file"""
+    from mmap import mmap, ACCESS_READ
+    from os import remove
+    from os.path import join
+    if not file_name.isalnum():
+        raise AddonConnectorException('The file name of the large payload is not valid')
+    file_path = join(get_temp_dir(), file_name)
+    with open(file_path, 'rb') as file_handle, mmap(file_handle.fileno(), 0, access=ACCESS_READ) as mapped_file:
+        data = codec.decode(mapped_file)
+    if not keep_file:
+        remove(file_path)
+    return data
+
+
+def is_large_payload(data):
+    """Return True if the serialized data are the file name of a large payload"""
+    return LARGE_PAYLOAD_MARKER in data[:2]
+
+
+def delete_large_payload(data):
+    """Delete the file of a large payload that will not be deserialized (e.g. the call has been dropped)"""
+    from os import remove
+    from os.path import join
+    file_name = data.strip('"')[1:]
+    if not file_name.isalnum():
+        return
+    try:
+        remove(join(get_temp_dir(), file_name))
+    except OSError:  # Already deleted
+        pass
+
+
+def _delete_expired_large_payloads(path):
+    """Delete the files of the large payloads never read by a receiver"""
+    from os import listdir, remove
+    from os.path import getmtime, join
+    from time import time
+    expiration_time = time() - LARGE_PAYLOAD_EXPIRATION
+    for file_name in listdir(path):
+        if not file_name.isalnum():  # Not a large payload file
+            continue
+        file_path = join(path, file_name)
+        try:
+            if getmtime(file_path) < expiration_time:
+                remove(file_path)
+        except OSError:
+            pass
+
+
+class MessageTemplate:
+    """
+    The Kodi JSON-RPC command of a RPC call, prebuilt for a callback name, add-on ID and types of serialization,
+    so each call only have to concatenate the call ID and the serialized data
+    """
+    __slots__ = ('key', 'head', 'middle', 'tail')
+
+    def __init__(self, callback_name, addon_id, ser_type, ser_type_return):
+        """
+        :raise AddonConnectorException: if the names contain characters that would break the message
+        """
+        from re import fullmatch
+        # The message is built by hand without JSON encoding, and the receiver split it by dots
+        if not fullmatch(r'[\w-]+', callback_name):
+            raise AddonConnectorException('The callback name "{}" is not valid, only alphanumeric characters, '
+                                          'underscores and hyphens are allowed'.format(callback_name))
+        for _addon_id in (addon_id, get_addon_id()):
+            if not fullmatch(r'[\w.-]+', _addon_id):
+                raise AddonConnectorException('The add-on ID "{}" is not valid'.format(_addon_id))
+        for _ser_type in (ser_type, ser_type_return):
+            if not _ser_type.isalnum():
+                raise AddonConnectorException('The type of serialization "{}" is not valid'.format(_ser_type))
+        self.key = (callback_name, addon_id, ser_type, ser_type_return)
+        message = JSONRPC_NOTIFYALL_STR.format(
+            callback_name=callback_name,
+            ser_type=ser_type,
+            ser_type_return=ser_type_return,
+            call_id='{call_id}',
+            # The sender has the ID of the add-on to call followed by the ID of the caller add-on
+            sender_id='{}{}{}'.format(addon_id, CALLER_ID_SEPARATOR, get_addon_id()),
+            sender_id_suffix=SENDER_ID_SUFFIX,
+            data='{data}'
+        )
+        self.head, message = message.split('{call_id}')
+        self.middle, self.tail = message.split('{data}')
+
+    def build(self, call_id, data):
+        """Return the Kodi JSON-RPC command with the call ID and the serialized data"""
+        return ''.join((self.head, call_id, self.middle, data, self.tail))
+
+
+def get_message_template(callback_name, addon_id=None, ser_type=SER_TYPE_PICKLE, ser_type_return=SER_TYPE_NONE):
+    """Return the MessageTemplate of a RPC call, the templates are cached"""
+    key = (callback_name, addon_id or get_addon_id(), ser_type, ser_type_return)
+    template = get_message_template.cached.get(key)
+    if template is None:
+        template = MessageTemplate(*key)
+        if len(get_message_template.cached) >= MESSAGE_TEMPLATES_CACHE_SIZE:
+            get_message_template.cached = {}
+        get_message_template.cached[key] = template
+    return template
+
+
+get_message_template.cached = {}
 
 
 class CallConfig:
     """Call configuration"""
     def __init__(self, callback_name, addon_id=None, timeout_secs=10,
-                 ser_type=SER_TYPE_PICKLE, ser_type_return=None):
+                 ser_type=SER_TYPE_PICKLE, ser_type_return=None,
+                 cache_ttl=None, cache_max_entries=128, cache_key_func=None, single_flight=False,
+                 copy_args=False, outbox_ttl=None, fail_fast=False):
         """
         :param callback_name: the name bound to the function to call (usually the function name)
         :param addon_id: the ID of the add-on that will receive this call (specify only to call others add-ons)
         :param timeout_secs: maximum waiting time before raise timeout (not used on 'make_signal_call')
         :param ser_type: type of data serialization to be used to send the data
         :param ser_type_return: type of data serialization to be used to receive the data, if different from sending
+        :param cache_ttl: seconds to keep in cache the results of 'make_call' (only for idempotent callbacks),
+                          the calls with the same arguments are answered from the cache without send the RPC call,
+                          the cache is shared by all the configs with the same add-on ID and callback name
+        :param cache_max_entries: maximum number of results in cache, the least recently used are discarded
+        :param cache_key_func: function that return the cache key of the arguments, with arguments (args, kwargs),
+                               by default is used a hash of the arguments serialized with pickle
+        :param single_flight: if True the concurrent 'make_call' with the same add-on ID, callback name and arguments
+                              (compared with the cache key) share a single RPC call, and all receive its result
+                              or its exception (only for idempotent callbacks)
+        :param copy_args: when the callback is registered in the same interpreter, 'make_call' executes it directly
+                          without serialize the data, so the arguments are passed by reference,
+                          if True the arguments are passed as deep copy
+        :param outbox_ttl: seconds to keep the signals of 'make_signal_call' in the durable outbox of the add-on
+                           to call, when its service is not running (see 'notify_ready'), the signals are delivered
+                           when the service will be ready, None to not use the outbox (the signal could be lost)
+        :param fail_fast: if True 'make_call' raise ServiceNotReadyError when the add-on to call has not announced
+                          its callbacks (its service must use 'notify_ready'), or CallbackNotFoundError when
+                          the callback is not registered, without wait for the timeout
         """
         self.callback_name = callback_name
         self.addon_id = addon_id or get_addon_id()
         self.timeout_secs = timeout_secs
         self.ser_type = ser_type
         self.ser_type_return = ser_type_return or ser_type
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.cache_key_func = cache_key_func
+        self.single_flight = single_flight
+        self.copy_args = copy_args
+        self.outbox_ttl = outbox_ttl
+        self.fail_fast = fail_fast
+        self._message_template = get_message_template(self.callback_name, self.addon_id, self.ser_type,
+                                                      self.ser_type_return)
+
+    @property
+    def message_template(self):
+        """The MessageTemplate of the calls made with this configuration"""
+        template = self._message_template
+        if template.key != (self.callback_name, self.addon_id, self.ser_type, self.ser_type_return):
+            # An attribute has been changed after the creation
+            template = self._message_template = get_message_template(self.callback_name, self.addon_id,
+                                                                     self.ser_type, self.ser_type_return)
+        return template
+
+    @property
+    def result_cache(self):
+        """The ResultCache of the callback (has the 'hits' and 'misses' counters), None if the cache is not used"""
+        if not self.cache_ttl:
+            return None
+        from cache import get_result_cache
+        return get_result_cache(self.addon_id, self.callback_name, self.cache_ttl, self.cache_max_entries)
 
     def change_name(self, callback_name):
         """Change the name bound to the function to be called and return the updated class object"""
         self.callback_name = callback_name
+        self._message_template = get_message_template(callback_name, self.addon_id, self.ser_type,
+                                                      self.ser_type_return)
         return self
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Local calls, the calls to the callbacks registered in the same interpreter made without the RPC call
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import metrics
+
+from helper import CancelToken, OperationAbortedError, WaitTimeoutError, get_addon_id, set_cancel_token
+from calltable import InflightCall
+from envelope import EnvelopeFuncCallback
+
+
+def can_make_local_call(receiver, slot, call_config):
+    """
+    Return True if a callback registered in this interpreter can be called without the RPC call.
+    The coroutine callbacks (that must be executed on the event loop, also when called from the event loop thread)
+    and the callbacks with an admission limit are called with the RPC call, as from the other add-ons
+    """
+    func = slot.callback_func
+    if not isinstance(func, EnvelopeFuncCallback) or func.is_coroutine:
+        return False
+    router = receiver.router
+    return not router.admission_limits or router.get_admission_limit(call_config.callback_name,
+                                                                     get_addon_id()) is None
+
+
+def make_local_call(receiver, slot, call_config, args, kwargs):
+    """
+    Execute a callback registered in this interpreter, the data are not serialized.
+    As for the RPC calls, the callback can get the CancelToken with 'get_cancel_token', the token is cancelled
+    when the timeout expires, and a threaded callback is not executed when it has waited too long in the queue.
+    A callback not threaded is executed on the current thread, so it cannot be interrupted by the timeout,
+    but its result is discarded when returned too late
+    """
+    if receiver.abortRequested():
+        raise OperationAbortedError
+    if call_config.copy_args:
+        from copy import deepcopy
+        args, kwargs = deepcopy((args, kwargs))
+    from time import time
+    cancel_token = CancelToken(time() + call_config.timeout_secs)
+    if slot.run_threaded:
+        inflight_call = InflightCall()
+
+        def execute():
+            if cancel_token.is_cancelled:
+                # The caller is no longer waiting for the result
+                return
+            inflight_call.ret_data = execute_local_call(slot.callback_func, cancel_token, args, kwargs)
+            inflight_call.event_done.set()
+
+        receiver.lanes.get_dispatcher(slot.lane).submit(slot, slot.max_concurrency, execute)
+        try:
+            return inflight_call.wait(call_config.timeout_secs)
+        except WaitTimeoutError:
+            cancel_token.cancel()
+            raise
+    ret_data = execute_local_call(slot.callback_func, cancel_token, args, kwargs)
+    if cancel_token.is_cancelled:
+        raise WaitTimeoutError
+    if isinstance(ret_data, Exception):
+        raise ret_data
+    return ret_data
+
+
+def execute_local_call(func, cancel_token, args, kwargs):
+    """Execute the enveloped function of a local call with its CancelToken, return the returned data or exception"""
+    # The local call can be made by a callback in execution, that keep its own token
+    parent_cancel_token = set_cancel_token(cancel_token)
+    try:
+        if metrics.enabled:
+            start_time = metrics.start(metrics.STAGE_EXECUTE, func.callback_name)
+            try:
+                return func.execute(args, kwargs)
+            finally:
+                metrics.end(metrics.STAGE_EXECUTE, func.callback_name, start_time)
+        return func.execute(args, kwargs)
+    finally:
+        set_cancel_token(parent_cancel_token)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Instrumentation of the RPC calls, with pluggable hooks and a registry of metrics
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from time import perf_counter
+
+from xbmc import log, LOGERROR
+
+# Stages of a RPC call that are measured
+STAGE_CALL = 'call'  # The whole 'make_call' on the caller side, from the sending to the return data
+STAGE_SERIALIZE = 'serialize'  # The serialization of the data
+STAGE_SEND = 'send'  # The execution of the Kodi JSON-RPC request
+STAGE_RECEIVE = 'receive'  # The handling of a notification by the receiver Monitor
+STAGE_EXECUTE = 'execute'  # The execution of the callback (including the RPC return call)
+
+# Upper bounds (in milliseconds) of the buckets of the histograms
+HISTOGRAM_BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000, float('inf'))
+
+# The instrumentation is checked by the instrumented functions before doing anything else,
+# so when it is disabled the cost is a single attribute lookup
+enabled = False  # pylint: disable=invalid-name
+_hooks = []
+
+
+def add_hook(hook):
+    """
+    Add a hook called on the start and the end of each stage, with arguments (event, stage, callback_name,
+    timestamp, size), where event is 'start' or 'end', the timestamp is a perf_counter value
+    and the size is the number of bytes of the data (or None when is not known)
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Remove a hook"""
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def _call_hooks(event, stage, callback_name, timestamp, size):
+    for hook in list(_hooks):
+        try:
+            hook(event, stage, callback_name, timestamp, size)
+        except Exception:  # pylint: disable=broad-except
+            from traceback import format_exc
+            log(format_exc(), LOGERROR)
+
+
+def start(stage, callback_name, size=None):
+    """Notify the start of a stage, return the start time"""
+    start_time = perf_counter()
+    if _hooks:
+        _call_hooks('start', stage, callback_name, start_time, size)
+    return start_time
+
+
+def end(stage, callback_name, start_time, size=None):
+    """Notify the end of a stage, and record the elapsed time in the metrics registry"""
+    end_time = perf_counter()
+    get_registry().record(callback_name, stage, end_time - start_time, size)
+    if _hooks:
+        _call_hooks('end', stage, callback_name, end_time, size)
+
+
+class Histogram:
+    """Histogram of the elapsed times of a stage"""
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_size = 0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+
+    def record(self, elapsed, size):
+        """Add an elapsed time (in seconds)"""
+        self.count += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        if size:
+            self.total_size += size
+        elapsed_ms = elapsed * 1000
+        for index, upper_bound in enumerate(HISTOGRAM_BUCKETS):
+            if elapsed_ms <= upper_bound:
+                self.buckets[index] += 1
+                break
+
+    def to_dict(self):
+        """Return the values of the histogram as dict, the times are in milliseconds"""
+        return {
+            'count': self.count,
+            'mean_ms': self.total_time / self.count * 1000 if self.count else None,
+            'max_ms': self.max_time * 1000,
+            'total_bytes': self.total_size,
+            'buckets': {'le_{}'.format(upper_bound): count
+                        for upper_bound, count in zip(HISTOGRAM_BUCKETS, self.buckets)}
+        }
+
+
+class MetricsRegistry:
+    """Keep the histograms of the stages of the calls, grouped by callback name"""
+    def __init__(self):
+        from threading import Lock
+        self._histograms = {}  # Histograms by (callback_name, stage)
+        self._lock = Lock()
+
+    def record(self, callback_name, stage, elapsed, size=None):
+        """Add an elapsed time (in seconds) of a stage"""
+        with self._lock:
+            histogram = self._histograms.get((callback_name, stage))
+            if histogram is None:
+                histogram = self._histograms[(callback_name, stage)] = Histogram()
+            histogram.record(elapsed, size)
+
+    def dump(self, reset=False):
+        """Return the metrics as dict {callback_name: {stage: histogram dict}}"""
+        with self._lock:
+            metrics = {}
+            for (callback_name, stage), histogram in self._histograms.items():
+                metrics.setdefault(callback_name, {})[stage] = histogram.to_dict()
+            if reset:
+                self._histograms = {}
+        return metrics
+
+
+def get_registry():
+    """Return the MetricsRegistry instance"""
+    if not hasattr(get_registry, 'cached'):
+        get_registry.cached = MetricsRegistry()
+    return get_registry.cached
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Durable outbox of the signal calls to the add-on services not running,
+    and the readiness markers of the add-on services
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from helper import OUTBOX_FSYNC_INTERVAL, READY_EXPIRATION, get_temp_dir
+
+OUTBOX_FILE_NAME = 'addonconnector_outbox.log'
+
+
+def get_ready_marker_path(addon_id):
+    """Return the path of the readiness marker of an add-on service"""
+    from os.path import join
+    return join(get_temp_dir(), addon_id + '.ready')
+
+
+def write_ready_marker(addon_id, callback_names=()):
+    """Write (or refresh) the readiness marker of an add-on service, with the names of its registered callbacks"""
+    from json import dump
+    from os import replace
+    path = get_ready_marker_path(addon_id)
+    # The marker is replaced atomically, so it is never read partially written
+    with open(path + '.tmp', 'w', encoding='utf-8') as file_handle:
+        dump(sorted(callback_names), file_handle)
+    replace(path + '.tmp', path)
+
+
+def remove_ready_marker(addon_id):
+    """Remove the readiness marker of an add-on service"""
+    from os import remove
+    try:
+        remove(get_ready_marker_path(addon_id))
+    except OSError:
+        pass
+
+
+def is_ready(addon_id):
+    """Return True if the add-on service has refreshed its readiness marker within the expiration time"""
+    from os.path import getmtime
+    from time import time
+    try:
+        return getmtime(get_ready_marker_path(addon_id)) > time() - READY_EXPIRATION
+    except OSError:
+        return False
+
+
+def read_ready_marker(addon_id):
+    """
+    Return the names of the callbacks registered by the add-on service,
+    or None when the service has not refreshed its readiness marker within the expiration time.
+    The names are read again only when the marker has been written again
+    """
+    from json import load
+    from os import stat
+    from time import time
+    if not hasattr(read_ready_marker, 'cached'):
+        read_ready_marker.cached = {}  # Tuples (marker version, callback names) by add-on ID
+    path = get_ready_marker_path(addon_id)
+    try:
+        marker_stat = stat(path)
+    except OSError:
+        return None
+    if marker_stat.st_mtime <= time() - READY_EXPIRATION:
+        return None
+    # The marker is replaced when written (also by the heartbeat), so it is read at most once for each write
+    version = (marker_stat.st_mtime_ns, marker_stat.st_ino, marker_stat.st_size)
+    cached = read_ready_marker.cached.get(addon_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    try:
+        with open(path, 'r', encoding='utf-8') as file_handle:
+            callback_names = tuple(load(file_handle))
+    except (OSError, ValueError, TypeError):  # Removed in the meantime or marker of an old version
+        return None
+    read_ready_marker.cached[addon_id] = (version, callback_names)
+    return callback_names
+
+
+def get_ready_addon_ids():
+    """Return the IDs of the add-ons that have a readiness marker (also expired)"""
+    from os import listdir
+    return [name[:-len('.ready')] for name in listdir(get_temp_dir()) if name.endswith('.ready')]
+
+
+def get_outbox_path(addon_id):
+    """Return the path of the outbox of the signals to an add-on, within the add-on profile folder"""
+    from os.path import join
+    from xbmcvfs import translatePath
+    return join(translatePath('special://profile/addon_data/{}/'.format(addon_id)), OUTBOX_FILE_NAME)
+
+
+class OutboxLock:
+    """
+    Exclusive lock of an outbox between the add-on instances, held on a lock file,
+    so the outbox is never moved to be replayed while a signal is being appended
+    """
+    def __init__(self, path):
+        self.path = path + '.lock'
+        self._fd = None
+
+    def __enter__(self):
+        import os
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            from fcntl import flock, LOCK_EX
+            flock(self._fd, LOCK_EX)
+        except ImportError:  # Windows
+            from msvcrt import locking, LK_LOCK
+            locking(self._fd, LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *args):
+        import os
+        try:
+            from msvcrt import locking, LK_UNLCK
+            locking(self._fd, LK_UNLCK, 1)
+        except ImportError:  # The lock of flock is released by closing the file
+            pass
+        os.close(self._fd)
+        self._fd = None
+
+
+class OutboxWriter:
+    """
+    Append the signals to an outbox file, one line for each signal.
+    The file is opened for each signal, because it is moved when the signals are replayed (see take_outbox_signals).
+    The file is synced to the disk at most once for each fsync interval, and when the interpreter exits
+    """
+    def __init__(self, path):
+        self.path = path
+        self._sync_time = 0
+        self._is_synced = True
+
+    def append(self, expiration, callback_name, ser_type, key, data):
+        """Append a signal to the outbox"""
+        from os import fsync, makedirs
+        from os.path import dirname
+        from time import monotonic
+        makedirs(dirname(self.path), exist_ok=True)
+        with OutboxLock(self.path), open(self.path, 'a', encoding='ascii') as file_handle:
+            file_handle.write('{} {} {} {} {}\n'.format(int(expiration), callback_name, ser_type, key, data))
+            file_handle.flush()
+            if monotonic() > self._sync_time:
+                fsync(file_handle.fileno())
+                self._sync_time = monotonic() + OUTBOX_FSYNC_INTERVAL
+                self._is_synced = True
+            else:
+                self._is_synced = False
+
+    def close(self):
+        """Sync the file to the disk"""
+        from os import fsync
+        if self._is_synced:
+            return
+        try:
+            with OutboxLock(self.path), open(self.path, 'a', encoding='ascii') as file_handle:
+                fsync(file_handle.fileno())
+        except OSError:
+            pass
+        self._is_synced = True
+
+
+def get_outbox_writer(addon_id):
+    """Return the OutboxWriter of the outbox of an add-on, the writers are synced when the interpreter exits"""
+    if not hasattr(get_outbox_writer, 'cached'):
+        import atexit
+        get_outbox_writer.cached = {}
+        atexit.register(_close_outbox_writers)
+    writer = get_outbox_writer.cached.get(addon_id)
+    if writer is None:
+        writer = get_outbox_writer.cached[addon_id] = OutboxWriter(get_outbox_path(addon_id))
+    return writer
+
+
+def _close_outbox_writers():
+    for writer in get_outbox_writer.cached.values():
+        writer.close()
+
+
+def take_outbox_signals(addon_id):
+    """
+    Take all the signals from the outbox of an add-on, the expired signals are discarded and
+    the duplicated signals (same callback and data) are delivered only once, at the position of the latest one
+    :return: list of tuples (callback_name, ser_type, data)
+    """
+    from os import remove, replace
+    from os.path import exists
+    from time import time
+    path = get_outbox_path(addon_id)
+    replay_path = path + '.replay'
+    if not exists(path):  # No signals
+        return []
+    with OutboxLock(path):
+        try:
+            # The file is moved, so the signals appended from now on will be written to a new file
+            replace(path, replay_path)
+        except OSError:  # No signals
+            return []
+    signals = {}
+    now = time()
+    with open(replay_path, 'r', encoding='ascii') as file_handle:
+        for line in file_handle:
+            try:
+                expiration, callback_name, ser_type, key, data = line.rstrip('\n').split(' ', 4)
+                if int(expiration) < now:
+                    continue
+            except ValueError:  # Truncated line
+                continue
+            signals.pop(key, None)
+            signals[key] = (callback_name, ser_type, data)
+    remove(replay_path)
+    return list(signals.values())
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Registry of the callbacks served by the add-ons, to fail fast the calls that cannot be received,
+    and announcement of the callbacks registered by this add-on instance
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from threading import Lock
+
+from helper import ServiceNotReadyError, CallbackNotFoundError, ANNOUNCE_DELAY
+
+
+class ServiceRegistry:
+    """
+    Keep the names of the callbacks registered by the add-ons.
+    The add-on instances running announce their callbacks each time they are registered or unregistered,
+    the callbacks of the add-on services started before this instance are read from their readiness markers
+    """
+    def __init__(self):
+        # The names of the callbacks by add-on ID and by add-on instance ID,
+        # the dicts are replaced (never changed) so they can be read without a lock
+        self._services = {}
+
+    def update(self, addon_id, instance_id, callback_names):
+        """Update the callbacks registered by an add-on instance, from its announcement"""
+        instances = dict(self._services.get(addon_id, {}))
+        if callback_names:
+            instances[instance_id] = frozenset(callback_names)
+        else:
+            instances.pop(instance_id, None)
+        services = dict(self._services)
+        if instances:
+            services[addon_id] = instances
+        else:
+            services.pop(addon_id, None)
+        self._services = services
+
+    def get_callback_names(self, addon_id):
+        """Return the set of the names of the callbacks registered by an add-on, None if the add-on is unknown"""
+        from outbox import read_ready_marker
+        instances = self._services.get(addon_id)
+        marker_names = read_ready_marker(addon_id)
+        if not instances and marker_names is None:
+            return None
+        return frozenset(marker_names or ()).union(*(instances or {}).values())
+
+    def check_callback(self, addon_id, callback_name):
+        """
+        Check that a callback can be received by an add-on
+        :raise ServiceNotReadyError: if the add-on has not announced any callback
+        :raise CallbackNotFoundError: if the callback is not registered by the add-on
+        """
+        callback_names = self.get_callback_names(addon_id)
+        if callback_names is None:
+            raise ServiceNotReadyError('The add-on "{}" has not announced any callback'.format(addon_id))
+        if callback_name not in callback_names:
+            raise CallbackNotFoundError('The callback "{}" is not registered by the add-on "{}"'.format(
+                callback_name, addon_id))
+
+    def get_services(self):
+        """Return a dict with the sorted list of the names of the registered callbacks by add-on ID"""
+        from outbox import get_ready_addon_ids
+        addon_ids = set(self._services).union(get_ready_addon_ids())
+        services = {}
+        for addon_id in addon_ids:
+            callback_names = self.get_callback_names(addon_id)
+            if callback_names is not None:
+                services[addon_id] = sorted(callback_names)
+        return services
+
+
+class Announcer:
+    """
+    Schedule the announcements of the callbacks registered by this add-on instance,
+    so that all the callbacks registered (or unregistered) within the announce delay are announced once
+    """
+    def __init__(self, announce):
+        """
+        :param announce: function with argument (addon_id) that announce the callbacks registered for an add-on ID
+        """
+        self.ready_addon_id = None  # The add-on ID of the service, when the service has notified that is ready
+        self._announce = announce
+        self._addon_ids = set()  # The add-on IDs with changed callbacks, waiting to be announced
+        self._timer = None
+        self._lock = Lock()
+        self._is_flush_at_exit = False
+
+    def schedule(self, addon_id):
+        """Schedule the announcement of the callbacks registered for an add-on ID"""
+        with self._lock:
+            self._addon_ids.add(addon_id)
+            if self._timer is not None:
+                return
+            from threading import Timer
+            if not self._is_flush_at_exit:
+                import atexit
+                # The callbacks changed just before the interpreter exits are announced anyway
+                atexit.register(self.flush)
+                self._is_flush_at_exit = True
+            self._timer = Timer(ANNOUNCE_DELAY, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self, addon_id):
+        """Cancel the scheduled announcement of an add-on ID, because the callbacks are announced now"""
+        with self._lock:
+            self._addon_ids.discard(addon_id)
+
+    def flush(self):
+        """Announce now the callbacks of all the scheduled announcements"""
+        with self._lock:
+            addon_ids = self._addon_ids
+            self._addon_ids = set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for addon_id in addon_ids:
+            self._announce(addon_id)
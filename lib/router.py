@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Routing of the notifications received to the slots of the registered callbacks
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from helper import (LANE_DEFAULT, SENDER_ID_SUFFIX, CALLER_ID_SEPARATOR, BATCH_CALL_NAME, CANCEL_CALL_NAME,
+                    ANNOUNCE_SIGNAL_NAME, CACHE_INVALIDATION_NAME, RETURN_STREAM_PREFIX, RETURN_CALL_PREFIX,
+                    ROUTES_CACHE_SIZE)
+
+# Kinds of routes of the notifications
+ROUTE_CALL = 0
+ROUTE_RETURN_CALL = 1
+ROUTE_BATCH_CALL = 2
+ROUTE_CACHE_INVALIDATION = 3
+ROUTE_RETURN_STREAM = 4
+ROUTE_CANCEL_CALL = 5
+ROUTE_ANNOUNCE = 6
+
+_ROUTE_NOT_CACHED = object()
+
+
+class Slot:
+    """A slot registered to receive the RPC calls to a callback"""
+    __slots__ = ('callback_func', 'run_threaded', 'max_concurrency', 'lane')
+
+    def __init__(self, callback_func, run_threaded, max_concurrency, lane=LANE_DEFAULT):
+        self.callback_func = callback_func
+        self.run_threaded = run_threaded
+        self.max_concurrency = max_concurrency
+        self.lane = lane
+
+
+class Route:
+    """The route of the notifications that have the same sender and method header"""
+    __slots__ = ('kind', 'addon_id', 'callback_name', 'ser_type', 'ser_type_return', 'slot', 'caller_id',
+                 'admission_limit')
+
+    def __init__(self, kind, addon_id, callback_name, ser_type, ser_type_return, slot=None, caller_id='',
+                 admission_limit=None):
+        self.kind = kind
+        self.addon_id = addon_id
+        self.callback_name = callback_name
+        self.ser_type = ser_type
+        self.ser_type_return = ser_type_return
+        self.slot = slot
+        self.caller_id = caller_id
+        self.admission_limit = admission_limit
+
+
+class Router:
+    """The slots of the registered callbacks and the admission limits, used to route the notifications received"""
+    def __init__(self):
+        self.slots = {}  # Slots by (addon_id, callback_name)
+        self.addon_ids = set()  # The add-on IDs of the slots
+        self.use_multithread = False  # If True the calls to the slots are executed on the thread pool by default
+        self.admission_limits = {}  # The AdmissionLimit by (callback_name, caller_id)
+        self._routes = {}  # Cache of the routes by (sender, method header), None when the notification is discarded
+
+    def register_slot(self, callback_name, callback, addon_id=None, use_thread=None, max_concurrency=None,
+                      lane=None):
+        """Register a slot, the calls to a slot with a lane are always executed on the thread pool of the lane"""
+        if lane is not None:
+            use_thread = True
+        self.slots[(addon_id, callback_name)] = Slot(callback,
+                                                     self.use_multithread if use_thread is None else use_thread,
+                                                     max_concurrency,
+                                                     lane or LANE_DEFAULT)
+        self._slots_changed()
+
+    def unregister_slot(self, callback_name, addon_id):
+        """Unregister a slot"""
+        if self.slots.pop((addon_id, callback_name), None) is not None:
+            self._slots_changed()
+
+    def unregister_slots(self, addon_id=None):
+        """Unregister all slots or all slots of the specified add-on ID"""
+        if addon_id is None:
+            self.slots = {}
+        else:
+            self.slots = {key: slot for key, slot in self.slots.items() if key[0] != addon_id}
+        self._slots_changed()
+
+    def get_callback_names(self, addon_id):
+        """Return the sorted list of the names of the callbacks registered for an add-on ID"""
+        return sorted(callback_name for _addon_id, callback_name in self.slots if _addon_id == addon_id)
+
+    def _slots_changed(self):
+        self.addon_ids = {addon_id for addon_id, _ in self.slots}
+        self._routes = {}
+
+    def set_admission_limit(self, callback_name, caller_id, admission_limit):
+        """Set the limits of the calls received"""
+        self.admission_limits[(callback_name, caller_id)] = admission_limit
+        self._routes = {}
+
+    def remove_admission_limits(self):
+        """Remove all the limits of the calls received"""
+        self.admission_limits = {}
+        self._routes = {}
+
+    def get_admission_limit(self, callback_name, caller_id):
+        """Return the most specific AdmissionLimit for the calls to a callback"""
+        for key in ((callback_name, caller_id), (callback_name, None), (None, caller_id), (None, None)):
+            admission_limit = self.admission_limits.get(key)
+            if admission_limit is not None:
+                return admission_limit
+        return None
+
+    def get_route(self, sender, method_header):
+        """Return the route of the notifications with the same sender and method header, None to discard them"""
+        route = self._routes.get((sender, method_header), _ROUTE_NOT_CACHED)
+        if route is _ROUTE_NOT_CACHED:
+            route = self._add_route(sender, method_header)
+        return route
+
+    def _add_route(self, sender, method_header):
+        """Parse the notification sender and method header, and add the route to the cache"""
+        addon_id, _, caller_id = sender[:-len(SENDER_ID_SUFFIX)].partition(CALLER_ID_SEPARATOR)
+        _, callback_name, ser_type, ser_type_return = method_header.split('.')
+        if callback_name == BATCH_CALL_NAME:
+            route = (Route(ROUTE_BATCH_CALL, addon_id, callback_name, ser_type, ser_type_return, caller_id=caller_id)
+                     if addon_id in self.addon_ids else None)
+        elif callback_name == CANCEL_CALL_NAME:
+            route = Route(ROUTE_CANCEL_CALL, addon_id, callback_name, ser_type, ser_type_return)
+        elif callback_name == ANNOUNCE_SIGNAL_NAME:
+            route = Route(ROUTE_ANNOUNCE, addon_id, callback_name, ser_type, ser_type_return)
+        elif callback_name == CACHE_INVALIDATION_NAME:
+            route = Route(ROUTE_CACHE_INVALIDATION, addon_id, callback_name, ser_type, ser_type_return)
+        elif callback_name.startswith(RETURN_STREAM_PREFIX):
+            route = Route(ROUTE_RETURN_STREAM, addon_id, callback_name[len(RETURN_STREAM_PREFIX):], ser_type,
+                          ser_type_return)
+        elif callback_name.startswith(RETURN_CALL_PREFIX):
+            route = Route(ROUTE_RETURN_CALL, addon_id, callback_name[len(RETURN_CALL_PREFIX):], ser_type,
+                          ser_type_return)
+        else:
+            slot = self.slots.get((addon_id, callback_name))
+            route = (Route(ROUTE_CALL, addon_id, callback_name, ser_type, ser_type_return, slot, caller_id,
+                           self.get_admission_limit(callback_name, caller_id))
+                     if slot else None)
+        routes = self._routes
+        if len(routes) >= ROUTES_CACHE_SIZE:
+            routes = self._routes = {}
+        routes[(sender, method_header)] = route
+        return route
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Sending of the RPC calls as Kodi JSON-RPC notifications
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+from xbmc import executeJSONRPC, log, LOGERROR
+
+import metrics
+
+from helper import (SER_TYPE_PICKLE, SER_TYPE_NONE, SER_TYPE_STRING, SER_TYPE_BYTES, AddonConnectorException,
+                    serialize_data, get_message_template)
+
+
+def send_rpc_call(callback_name, data=None, addon_id=None, ser_type=SER_TYPE_PICKLE, ser_type_return=SER_TYPE_NONE,
+                  call_id='', message_template=None):
+    """Send a RPC call (a call, a return call or a signal) to the add-ons with a Kodi JSON-RPC notification"""
+    if message_template is None:
+        message_template = get_message_template(callback_name, addon_id, ser_type, ser_type_return)
+    try:
+        is_instrumented = metrics.enabled
+        if is_instrumented:
+            start_time = metrics.start(metrics.STAGE_SERIALIZE, callback_name)
+        ser_data = serialize_data(ser_type, data)
+        if is_instrumented:
+            metrics.end(metrics.STAGE_SERIALIZE, callback_name, start_time, len(ser_data))
+            start_time = metrics.start(metrics.STAGE_SEND, callback_name, len(ser_data))
+        # We avoid the slow JSON encoding then we directly build the JSON data in a string,
+        # from the template that already has all the constant parts of the message
+        executeJSONRPC(message_template.build(call_id, ser_data))
+        if is_instrumented:
+            metrics.end(metrics.STAGE_SEND, callback_name, start_time, len(ser_data))
+    except Exception as exc:  # pylint: disable=broad-except
+        from traceback import format_exc
+        log(format_exc(), LOGERROR)
+        raise AddonConnectorException('Internal error see log details') from exc
+
+
+def unpack_call_args(ser_type, data):
+    """Return the args and kwargs of a call from the deserialized data"""
+    if ser_type in [SER_TYPE_STRING, SER_TYPE_NONE, SER_TYPE_BYTES]:
+        return (data,), {}
+    return data
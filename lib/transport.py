@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2021 Stefano Gottardo @CastagnaIT (script.module.addon.connector)
+    Transport of the RPC calls through Unix domain sockets, that bypass the Kodi JSON-RPC
+
+    SPDX-License-Identifier: LGPL-2.1-or-later
+    See LICENSE.txt for more information.
+"""
+import socket
+from struct import Struct
+from threading import Lock, Thread
+
+from xbmc import log, LOGERROR
+
+from helper import (AddonConnectorException, WaitTimeoutError, OperationAbortedError, SER_TYPE_PICKLE,
+                    ABORT_WATCH_INTERVAL, CALLER_ID_SEPARATOR, SENDER_ID_SUFFIX, encode_data, decode_data,
+                    get_temp_dir, get_addon_id, new_call_id)
+from calltable import InflightCall
+from envelope import EnvelopeFuncCallback
+from router import ROUTE_CALL
+from rpc import unpack_call_args
+
+# Each frame starts with the length of the header and the length of the data
+FRAME_PREFIX = Struct('>II')
+# The response header is 'ok.sertype' when the call has been executed,
+# or 'fallback' when the call must be sent through Kodi JSON-RPC (e.g. callback not registered on the socket server)
+RESPONSE_FALLBACK = b'fallback'
+MAX_IDLE_CONNECTIONS = 4  # Maximum number of connections kept open in the pool for each add-on
+MAX_SERVED_CONNECTIONS = 32  # Maximum number of connections served at same time by a socket server
+
+
+def is_supported():
+    """Return True if the Unix domain sockets are supported by the platform"""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def get_socket_path(addon_id):
+    """
+    Return the path of the socket of an add-on, within the private temporary folder,
+    so the socket cannot be bound by another user to impersonate the add-on service
+    """
+    from os.path import join
+    return join(get_temp_dir(), addon_id + '.sock')
+
+
+def _send_frame(sock, header, data):
+    sock.sendall(FRAME_PREFIX.pack(len(header), len(data)) + header)
+    if data:
+        sock.sendall(data)
+
+
+def _recv_exact(sock, size, end_time=None, is_abort_requested=None):
+    """Receive the specified number of bytes, return None if the connection has been closed"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        try:
+            count = sock.recv_into(view[received:])
+        except socket.timeout:
+            from time import perf_counter
+            if end_time is not None and perf_counter() > end_time:
+                raise WaitTimeoutError from None
+            if is_abort_requested is not None and is_abort_requested():
+                raise OperationAbortedError from None
+            continue
+        if not count:
+            return None
+        received += count
+    return buffer
+
+
+def _recv_frame(sock, end_time=None, is_abort_requested=None):
+    """Receive a frame, return a tuple (header, data) or None if the connection has been closed"""
+    prefix = _recv_exact(sock, FRAME_PREFIX.size, end_time, is_abort_requested)
+    if prefix is None:
+        return None
+    header_size, data_size = FRAME_PREFIX.unpack(prefix)
+    header = _recv_exact(sock, header_size, end_time, is_abort_requested) if header_size else bytearray()
+    data = _recv_exact(sock, data_size, end_time, is_abort_requested) if data_size else bytearray()
+    if header is None or data is None:
+        return None
+    return bytes(header), data
+
+
+class SocketServer:
+    """Listen the RPC calls to an add-on on a Unix domain socket"""
+    def __init__(self, addon_id, handle_call):
+        """
+        :param addon_id: the add-on ID that receive the calls
+        :param handle_call: function to execute the call, with arguments (addon_id, caller_id, callback_name,
+                            ser_type, ser_type_return, deadline, data) must return a tuple (ser_type, data)
+                            or None for a fallback
+        """
+        self.addon_id = addon_id
+        self.path = get_socket_path(addon_id)
+        self._handle_call = handle_call
+        self._socket = None
+        self._connections_count = 0
+        self._connections_lock = Lock()
+
+    def start(self):
+        """Start to listen the calls"""
+        from os import remove
+        try:
+            # Delete the socket file left by a previous instance
+            remove(self.path)
+        except OSError:
+            pass
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._socket.listen()
+        Thread(target=self._accept_connections, name='AddonConnectorSocketServer', daemon=True).start()
+
+    def stop(self):
+        """Stop to listen the calls"""
+        from os import remove
+        if self._socket is None:
+            return
+        self._socket.close()
+        self._socket = None
+        try:
+            remove(self.path)
+        except OSError:
+            pass
+
+    def _accept_connections(self):
+        listener = self._socket
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:  # The socket has been closed
+                return
+            with self._connections_lock:
+                is_accepted = self._connections_count < MAX_SERVED_CONNECTIONS
+                if is_accepted:
+                    self._connections_count += 1
+            if not is_accepted:
+                # Too many connections, the caller must send the call through Kodi JSON-RPC
+                with conn:
+                    try:
+                        _send_frame(conn, RESPONSE_FALLBACK, b'')
+                    except OSError:
+                        pass
+                continue
+            Thread(target=self._serve_connection, args=(conn,), name='AddonConnectorSocketConnection',
+                   daemon=True).start()
+
+    def _serve_connection(self, conn):
+        try:
+            self._serve_calls(conn)
+        finally:
+            with self._connections_lock:
+                self._connections_count -= 1
+
+    def _serve_calls(self, conn):
+        with conn:
+            while True:
+                try:
+                    frame = _recv_frame(conn)
+                except OSError:
+                    return
+                if frame is None:
+                    return
+                header, data = frame
+                try:
+                    fields = header.decode('utf-8').split('.', 4)
+                    if len(fields) == 5:
+                        callback_name, ser_type, ser_type_return, deadline, caller_id = fields
+                        response = self._handle_call(self.addon_id, caller_id, callback_name, ser_type,
+                                                     ser_type_return, int(deadline) / 1000, data)
+                    else:  # Header of another version of the add-on
+                        response = None
+                    if response is None:
+                        response_header, response_data = RESPONSE_FALLBACK, b''
+                    else:
+                        response_header = 'ok.{}'.format(response[0]).encode('utf-8')
+                        response_data = response[1]
+                except Exception:  # pylint: disable=broad-except
+                    from traceback import format_exc
+                    log(format_exc(), LOGERROR)
+                    response_header = 'ok.{}'.format(SER_TYPE_PICKLE).encode('utf-8')
+                    response_data = encode_data(SER_TYPE_PICKLE,
+                                                AddonConnectorException('Internal error see log details'))
+                try:
+                    _send_frame(conn, response_header, response_data)
+                except OSError:
+                    return
+
+
+class SocketTransport:
+    """
+    The socket servers of the add-ons and the calls received in execution, the calls received are executed
+    by the CallReceiver as the calls received from the notifications (admission control, deadline, lanes)
+    """
+    def __init__(self, receiver):
+        self._receiver = receiver
+        self._servers = {}
+        self._calls = {}  # The InflightCall of the calls received and in execution, by call ID
+        self._lock = Lock()
+
+    def start_server(self, addon_id):
+        """Start to listen the calls to the callbacks of an add-on on its Unix domain socket"""
+        if addon_id in self._servers:
+            return
+        self._servers[addon_id] = SocketServer(addon_id, self.handle_call)
+        self._servers[addon_id].start()
+
+    def stop_servers(self):
+        """Stop to listen the calls on the Unix domain sockets"""
+        for socket_server in self._servers.values():
+            socket_server.stop()
+        self._servers = {}
+
+    def handle_call(self, addon_id, caller_id, callback_name, ser_type, ser_type_return, deadline, data):
+        """Execute a call received from the Unix domain socket, return the data to be sent to the caller or None"""
+        route = self._receiver.router.get_route(
+            '{}{}{}{}'.format(addon_id, CALLER_ID_SEPARATOR, caller_id, SENDER_ID_SUFFIX),
+            'Other.{}.{}.{}'.format(callback_name, ser_type, ser_type_return))
+        if route is None or route.kind != ROUTE_CALL:
+            # The callback could be registered by another add-on instance
+            return None
+        if not route.slot.run_threaded or not isinstance(route.slot.callback_func, EnvelopeFuncCallback):
+            # The callbacks not threaded must be executed one at a time on the Monitor thread,
+            # the other callbacks handle the return call by itself
+            return None
+        call_id = new_call_id()
+        socket_call = InflightCall()
+        with self._lock:
+            self._calls[call_id] = socket_call
+        args, kwargs = unpack_call_args(ser_type, decode_data(ser_type, data))
+        self._receiver.dispatch_call(route, call_id, deadline, args, kwargs)
+        ret_data = self._wait_result(call_id, socket_call, deadline)
+        ser_type_return = SER_TYPE_PICKLE if isinstance(ret_data, Exception) else ser_type_return
+        return ser_type_return, encode_data(ser_type_return, ret_data)
+
+    def _wait_result(self, call_id, socket_call, deadline):
+        from time import time
+        socket_call.event_done.wait(max(deadline - time(), 0) + ABORT_WATCH_INTERVAL)
+        # The call not executed in time (e.g. it has waited too long in the queue) is answered with the timeout
+        self.return_call(call_id, WaitTimeoutError())
+        return socket_call.ret_data
+
+    def is_socket_call(self, call_id):
+        """Return True if a call in execution has been received from the Unix domain socket"""
+        return call_id in self._calls
+
+    def return_call(self, call_id, ret_data):
+        """Set the return data of a call received from the Unix domain socket, return False if it is not such a call"""
+        with self._lock:
+            socket_call = self._calls.pop(call_id, None)
+        if socket_call is None:
+            return False
+        socket_call.ret_data = ret_data
+        socket_call.event_done.set()
+        return True
+
+
+class ConnectionPool:
+    """Keep open the connections to the socket servers of the add-ons, to reuse them for the next calls"""
+    def __init__(self):
+        self._idle_connections = {}
+        self._lock = Lock()
+
+    def get(self, addon_id):
+        """Get a connection to the socket server of an add-on, return the socket or None"""
+        while True:
+            with self._lock:
+                connections = self._idle_connections.get(addon_id)
+                if not connections:
+                    break
+                sock = connections.pop()
+            if not _is_connection_closed(sock):
+                return sock
+            # The connection was closed by the socket server (e.g. the service has been restarted)
+            sock.close()
+        from os.path import exists
+        path = get_socket_path(addon_id)
+        if not exists(path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:  # The socket file has been left by an add-on service no longer running
+            sock.close()
+            return None
+        return sock
+
+    def release(self, addon_id, sock):
+        """Put back a connection in the pool"""
+        with self._lock:
+            connections = self._idle_connections.setdefault(addon_id, [])
+            if len(connections) < MAX_IDLE_CONNECTIONS:
+                connections.append(sock)
+                return
+        sock.close()
+
+
+def _is_connection_closed(sock):
+    """Return True if an idle connection has been closed by the socket server"""
+    sock.settimeout(0)
+    try:
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except BlockingIOError:  # No data, the connection is open
+        return False
+    except OSError:
+        return True
+
+
+def _connection_pool():
+    """Return the ConnectionPool instance"""
+    if not hasattr(_connection_pool, 'cached'):
+        _connection_pool.cached = ConnectionPool()
+    return _connection_pool.cached
+
+
+def make_socket_call(addon_id, callback_name, ser_type, ser_type_return, data, timeout_secs, is_abort_requested):
+    """
+    Make a RPC call through the socket server of an add-on
+    :return: a tuple (ser_type, data) of the returned data, or None if the call must be sent through Kodi JSON-RPC
+    :raise WaitTimeoutError: if the waiting time exceed the timeout value
+    :raise OperationAbortedError: if Kodi abort the operation (e.g. Kodi exit)
+    :raise AddonConnectorException: if the connection has been lost after sending the call
+    """
+    from time import perf_counter, time
+    # The header contains the deadline (the epoch time after that the caller stops to wait) and the caller ID
+    header = '{}.{}.{}.{}.{}'.format(callback_name, ser_type, ser_type_return, int((time() + timeout_secs) * 1000),
+                                     get_addon_id()).encode('utf-8')
+    end_time = perf_counter() + timeout_secs
+    pool = _connection_pool()
+    sock = pool.get(addon_id)
+    if sock is None:
+        return None
+    try:
+        sock.settimeout(max(end_time - perf_counter(), 0))
+        _send_frame(sock, header, data)
+    except socket.timeout:
+        # The socket server has not read the data in time
+        sock.close()
+        raise WaitTimeoutError from None
+    except OSError:
+        # The call has not been received (e.g. the service has been stopped), it can be sent through Kodi JSON-RPC
+        sock.close()
+        return None
+    try:
+        # To check the Kodi abort request, the waiting of the response is split in short time intervals
+        sock.settimeout(ABORT_WATCH_INTERVAL)
+        frame = _recv_frame(sock, end_time, is_abort_requested)
+    except (WaitTimeoutError, OperationAbortedError):
+        # The connection cannot be reused, the response could be received later
+        sock.close()
+        raise
+    except OSError:
+        frame = None
+    if frame is None:
+        # The call could have been already executed, so it cannot be sent again through Kodi JSON-RPC
+        sock.close()
+        raise AddonConnectorException('The connection to the socket server of the add-on "{}" has been lost'
+                                      .format(addon_id))
+    pool.release(addon_id, sock)
+    if frame[0] == RESPONSE_FALLBACK:
+        return None
+    # The response header is 'ok.sertype'
+    return frame[0].decode('utf-8').split('.', 1)[1], frame[1]
@@ -19,7 +19,8 @@ setup(
     long_description='A Kodi module to provide the communication between add-ons and add-ons services',
     keywords='Kodi, plugin, addon, connector',
     license='LGPL-2.1-only',
-    py_modules=['addonconnector', 'helper'],
+    py_modules=['addonconnector', 'admission', 'batch', 'cache', 'calltable', 'dispatcher', 'envelope', 'helper',
+                'localcall', 'metrics', 'outbox', 'registry', 'router', 'rpc', 'transport'],
     package_dir={'': 'lib'},
     zip_safe=False,
     platforms=['all'],
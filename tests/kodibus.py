@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2021, Stefano Gottardo (@CastagnaIT)
+# GNU Lesser General Public License v2.1 or later (see LICENSE.txt)
+"""
+Stand-in for the Kodi notification bus, to run the add-ons in separate processes like Kodi does
+(each Python interpreter of Kodi has its own thread that delivers the notifications to the Monitor instances).
+The bus runs in its own process, and delivers each notification to all the connected processes
+with a configurable latency and jitter. On top of it there is a load test of the RPC calls between the processes.
+"""
+# pylint: disable=missing-docstring
+
+import heapq
+import multiprocessing
+import random
+import socket
+import threading
+import time
+from itertools import count
+from multiprocessing.connection import Client, Listener
+
+AUTHKEY = b'kodibus'
+SERVICE_ADDON_ID = 'service.loadtest.id'
+CALLER_ADDON_ID = 'plugin.loadtest.id'
+MAX_CALLER_PROCESSES = 4  # The concurrent callers are threads distributed on these processes
+
+
+class _DeliveryQueue:
+    """Send the notifications to a connected process, each one at its own delivery time"""
+    def __init__(self, conn):
+        self._conn = conn
+        self._heap = []
+        self._seq = count()
+        self._cond = threading.Condition()
+        self.is_closed = False
+        threading.Thread(target=self._deliver, daemon=True).start()
+
+    def put(self, delay, notification):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), notification))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.is_closed = True
+            self._cond.notify()
+
+    def _deliver(self):
+        while True:
+            with self._cond:
+                while not self.is_closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self.is_closed:
+                    return
+                _, _, notification = heapq.heappop(self._heap)
+            try:
+                self._conn.send(notification)
+            except (OSError, ValueError):  # The process has been disconnected
+                return
+
+
+def _run_bus(address_conn, latency, jitter, loss_rate):
+    """The process of the bus, accept the connections of the processes and forward the notifications to all of them"""
+    # The Unix domain sockets do not add the delay of the Nagle algorithm to the small messages, like Kodi does not
+    if hasattr(socket, 'AF_UNIX'):
+        listener = Listener(family='AF_UNIX', authkey=AUTHKEY)
+    else:
+        listener = Listener(('127.0.0.1', 0), authkey=AUTHKEY)
+    address_conn.send(listener.address)
+    queues = {}
+    lock = threading.Lock()
+
+    def read_notifications(conn):
+        while True:
+            try:
+                notification = conn.recv()
+            except (EOFError, OSError):
+                with lock:
+                    queues.pop(conn).close()
+                return
+            with lock:
+                targets = list(queues.values())
+            for queue in targets:
+                if loss_rate and random.random() < loss_rate:
+                    continue
+                queue.put(max(0, latency + random.uniform(-jitter, jitter)), notification)
+
+    while True:
+        conn = listener.accept()
+        with lock:
+            queues[conn] = _DeliveryQueue(conn)
+        threading.Thread(target=read_notifications, args=(conn,), daemon=True).start()
+
+
+class NotificationBus:
+    """Run the notification bus in a separate process"""
+    def __init__(self, latency=0.0, jitter=0.0, loss_rate=0.0):
+        """
+        :param latency: seconds of delay of the delivery of each notification
+        :param jitter: maximum seconds of random variation of the latency (the notifications can be reordered)
+        :param loss_rate: probability that a notification is not delivered to a process
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.loss_rate = loss_rate
+        self.address = None
+        self._process = None
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        parent_conn, child_conn = context.Pipe()
+        self._process = context.Process(target=_run_bus, args=(child_conn, self.latency, self.jitter,
+                                                               self.loss_rate), daemon=True)
+        self._process.start()
+        self.address = parent_conn.recv()
+        return self
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class BusClient:
+    """
+    Connect the process to the notification bus, the notifications are delivered to the Monitor instances
+    of the process by the Monitor thread of the client
+    """
+    def __init__(self, address):
+        self._conn = Client(address, authkey=AUTHKEY)
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._deliver, name='MonitorThread', daemon=True).start()
+
+    def send(self, sender, method, data):
+        with self._send_lock:
+            self._conn.send((sender, method, data))
+
+    def close(self):
+        self._conn.close()
+
+    def _deliver(self):
+        from xbmc import Monitor, log, LOGERROR
+        while True:
+            try:
+                sender, method, data = self._conn.recv()
+            except (EOFError, OSError):
+                return
+            for obj in Monitor.getinstances():
+                try:
+                    obj.onNotification(sender=sender, method=method, data=data)
+                except Exception:  # pylint: disable=broad-except
+                    from traceback import format_exc
+                    log(format_exc(), LOGERROR)
+
+
+def connect_bus(address, addon_id):
+    """Simulate an add-on in the current process, connected to the notification bus"""
+    import xbmc
+    import xbmcaddon
+    xbmcaddon.ADDON_ID = addon_id
+    client = BusClient(address)
+    xbmc.set_notification_bus(client)
+    return client
+
+
+def callback_echo(value):
+    next(callback_echo.executed)
+    return value
+
+
+callback_echo.executed = count()  # The next value is the number of the executed calls
+
+
+def run_echo_service(address, ready_event, stop_event, results_queue):
+    """The process of an add-on service that answer to the calls with the same value received"""
+    connect_bus(address, SERVICE_ADDON_ID)
+    import addonconnector
+    addonconnector.use_multithread(True, max_workers=16, max_queue_size=1000)
+    addonconnector.register_callback(callback_echo)
+    ready_event.set()
+    stop_event.wait()
+    results_queue.put(('service', next(callback_echo.executed)))
+
+
+def run_callers(address, callers_count, calls_count, timeout_secs, results_queue):
+    """The process of an add-on that make the calls to the service from more threads at same time"""
+    connect_bus(address, CALLER_ADDON_ID)
+    import addonconnector
+    call_cfg = addonconnector.CallConfig('callback_echo', SERVICE_ADDON_ID, timeout_secs=timeout_secs)
+    latencies = []
+    counters = {'timeouts': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def make_calls(caller_idx):
+        for idx in range(calls_count):
+            value = (caller_idx, idx)
+            start_time = time.perf_counter()
+            try:
+                is_valid = addonconnector.make_call(call_cfg, value) == value
+                counter = None if is_valid else 'errors'
+            except addonconnector.WaitTimeoutError:
+                counter = 'timeouts'
+            except addonconnector.AddonConnectorException:
+                counter = 'errors'
+            with lock:
+                if counter is None:
+                    latencies.append(time.perf_counter() - start_time)
+                else:
+                    counters[counter] += 1
+
+    threads = [threading.Thread(target=make_calls, args=(idx,)) for idx in range(callers_count)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results_queue.put(('callers', start_time, time.time(), latencies, counters))
+
+
+def run_load_test(callers_count, calls_count, latency=0.0, jitter=0.0, loss_rate=0.0, timeout_secs=10):
+    """
+    Make the calls from more concurrent callers to an add-on service, through the notification bus
+    :param callers_count: number of concurrent callers (threads distributed on more processes)
+    :param calls_count: number of calls made by each caller one after the other
+    :return: dict with the number of calls ('calls'), the calls completed ('completed'), the calls in timeout
+             ('timeouts'), the calls failed or with wrong results ('errors'), the calls never received by
+             the service ('lost_calls'), the calls executed without the result received by the caller
+             ('lost_returns'), and the statistics of the latencies of the completed calls
+    """
+    context = multiprocessing.get_context('spawn')
+    results_queue = context.Queue()
+    ready_event = context.Event()
+    stop_event = context.Event()
+    with NotificationBus(latency, jitter, loss_rate) as bus:
+        service = context.Process(target=run_echo_service, args=(bus.address, ready_event, stop_event, results_queue))
+        service.start()
+        ready_event.wait(30)
+        processes_count = min(callers_count, MAX_CALLER_PROCESSES)
+        # The callers are distributed on the processes, the first processes run one more caller of the remainder
+        processes = []
+        for idx in range(processes_count):
+            process_callers_count = callers_count // processes_count + (1 if idx < callers_count % processes_count else 0)
+            processes.append(context.Process(target=run_callers, args=(bus.address, process_callers_count, calls_count,
+                                                                       timeout_secs, results_queue)))
+        for process in processes:
+            process.start()
+        results = [results_queue.get() for _ in processes]
+        stop_event.set()
+        results.append(results_queue.get())
+        for process in processes + [service]:
+            process.join()
+    executed_count = next(result[1] for result in results if result[0] == 'service')
+    callers_results = [result for result in results if result[0] == 'callers']
+    latencies = sorted(latency for result in callers_results for latency in result[3])
+    wall_time = max(result[2] for result in callers_results) - min(result[1] for result in callers_results)
+    calls = callers_count * calls_count
+    stats = {
+        'callers': callers_count,
+        'calls': calls,
+        'completed': len(latencies),
+        'timeouts': sum(result[4]['timeouts'] for result in callers_results),
+        'errors': sum(result[4]['errors'] for result in callers_results),
+        'lost_calls': calls - executed_count,
+        'lost_returns': max(0, executed_count - len(latencies)),
+        'throughput_per_sec': len(latencies) / wall_time if wall_time else None
+    }
+    if latencies:
+        stats.update({
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p90_ms': _percentile(latencies, 90) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000
+        })
+    return stats
+
+
+def _percentile(values, perc):
+    """Return the percentile (nearest-rank method) of a sorted list"""
+    return values[max(0, int(round(perc / 100 * len(values))) - 1)]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2021, Stefano Gottardo (@CastagnaIT)
+# GNU Lesser General Public License v2.1 or later (see LICENSE.txt)
+
+# pylint: disable=missing-docstring
+
+import time
+import unittest
+
+from admission import AdmissionLimit
+from helper import ADMISSION_DROP_OLDEST, ADMISSION_QUEUE, ADMISSION_REJECT
+
+
+class Calls:
+    """Record the calls executed and rejected"""
+    def __init__(self, state):
+        self.state = state
+        self.executed = []
+        self.rejected = []
+
+    def submit(self, value):
+        self.state.submit(lambda is_queued: self.executed.append(value), lambda: self.rejected.append(value))
+
+
+class TestAdmission(unittest.TestCase):
+    """Unit test for the admission control of the calls"""
+
+    def test_max_inflight_reject(self):
+        """Test the calls rejected when the maximum number of in-flight calls is reached"""
+        calls = Calls(AdmissionLimit(None, None, 2, ADMISSION_REJECT, 10).get_state('caller'))
+        for value in range(3):
+            calls.submit(value)
+        self.assertEqual((calls.executed, calls.rejected), ([0, 1], [2]))
+        calls.state.release()
+        calls.submit(3)
+        self.assertEqual((calls.executed, calls.rejected), ([0, 1, 3], [2]))
+
+    def test_max_inflight_queue(self):
+        """Test the calls queued when the maximum number of in-flight calls is reached"""
+        calls = Calls(AdmissionLimit(None, None, 1, ADMISSION_QUEUE, 2).get_state('caller'))
+        for value in range(4):
+            calls.submit(value)
+        self.assertEqual((calls.executed, calls.rejected), ([0], [3]))
+        calls.state.release()
+        self.assertEqual(calls.executed, [0, 1])
+        calls.state.release()
+        self.assertEqual(calls.executed, [0, 1, 2])
+
+    def test_drop_oldest(self):
+        """Test the oldest queued calls rejected when the queue is full"""
+        calls = Calls(AdmissionLimit(None, None, 1, ADMISSION_DROP_OLDEST, 2).get_state('caller'))
+        for value in range(5):
+            calls.submit(value)
+        self.assertEqual((calls.executed, calls.rejected), ([0], [1, 2]))
+        calls.state.release()
+        calls.state.release()
+        self.assertEqual(calls.executed, [0, 3, 4])
+
+    def test_rate_limit(self):
+        """Test the calls over the rate limit, queued until a token is available"""
+        limit = AdmissionLimit(20, 2, None, ADMISSION_QUEUE, 10)
+        calls = Calls(limit.get_state('caller'))
+        for value in range(3):
+            calls.submit(value)
+        self.assertEqual(calls.executed, [0, 1])
+        time.sleep(0.1)
+        self.assertEqual(calls.executed, [0, 1, 2])
+        # Each sender add-on has its own limits
+        other_calls = Calls(limit.get_state('other.caller'))
+        other_calls.submit(0)
+        self.assertEqual(other_calls.executed, [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
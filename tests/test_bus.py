@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2021, Stefano Gottardo (@CastagnaIT)
+# GNU Lesser General Public License v2.1 or later (see LICENSE.txt)
+
+# pylint: disable=missing-docstring
+
+import unittest
+
+from kodibus import run_load_test
+
+
+class TestNotificationBus(unittest.TestCase):
+    """Unit test for the RPC calls between add-ons running in separate processes"""
+
+    def test_concurrent_callers(self):
+        """Test the calls of concurrent callers on more processes, with the latency and jitter of the delivery"""
+        stats = run_load_test(callers_count=6, calls_count=5, latency=0.005, jitter=0.004)
+        self.assertEqual(stats['calls'], 30)
+        self.assertEqual(stats['completed'], 30)
+        self.assertEqual(stats['timeouts'], 0)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(stats['lost_calls'], 0)
+        self.assertEqual(stats['lost_returns'], 0)
+
+    def test_lost_notifications(self):
+        """Test that the notifications lost by the bus are reported as timeouts"""
+        stats = run_load_test(callers_count=2, calls_count=10, loss_rate=0.3, timeout_secs=0.5)
+        self.assertEqual(stats['completed'] + stats['timeouts'], 20)
+        self.assertGreater(stats['timeouts'], 0)
+        self.assertEqual(stats['lost_calls'] + stats['lost_returns'], stats['timeouts'])
+
+
+if __name__ == '__main__':
+    unittest.main()
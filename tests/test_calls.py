@@ -4,7 +4,13 @@
 
 # pylint: disable=missing-docstring,invalid-name,reimported
 
+import asyncio
+import json
+import os
+import random
 import sys
+import threading
+import time
 import unittest
 
 import lib.addonconnector as ac_sender
@@ -42,6 +48,11 @@ def callback_string(data):
     return 'Föóbàr ԜՕȐŁǷ'
 
 
+def callback_bytes(data):
+    callback_bytes.data = data
+    return memoryview(data)[::-1]
+
+
 def callback_bogus_sender(data):
     # xbmc.log('Received RPC callback: {}'.format(data), 3)  # Warning
     callback_bogus_sender.data = data
@@ -60,14 +71,75 @@ def callback_send_multiple(idx):
     return dict(idx=idx)
 
 
+def callback_threaded(value):
+    # xbmc.log('Received RPC callback: {}'.format(value), 3)  # Warning
+    time.sleep(0.05)
+    callback_threaded.data = value
+    return value * 2
+
+
+def callback_concurrent(value):
+    # xbmc.log('Received RPC callback: {}'.format(value), 3)  # Warning
+    time.sleep(random.uniform(0.01, 0.05))
+    return value
+
+
+def callback_raise_exception(message):
+    raise ValueError(message)
+
+
+def callback_signal(value):
+    # xbmc.log('Received RPC signal: {}'.format(value), 3)  # Warning
+    callback_signal.data.append(value)
+
+
+callback_signal.data = []
+
+
+def callback_counter(value):
+    callback_counter.count += 1
+    return value, callback_counter.count
+
+
+callback_counter.count = 0
+
+
+def callback_slow_counter(value):
+    time.sleep(0.1)
+    callback_slow_counter.count += 1
+    if value is None:
+        raise ValueError('Test exception')
+    return value, callback_slow_counter.count
+
+
+callback_slow_counter.count = 0
+
+
+def callback_generator(count):
+    for value in range(count):
+        if value == 7:
+            raise ValueError('Test exception')
+        yield value
+
+
 class TestCalls(unittest.TestCase):
     """Unit test for RPC make_call cases and RPC return callback"""
     ac_service.register_callback(callback_call_pickle)
     ac_service.register_callback(callback_call_json)
     ac_service.register_callback(callback_string)
+    ac_service.register_callback(callback_bytes)
     ac_service.register_callback(callback_bogus_sender)
     ac_service.register_callback(callback_args_kwargs)
     ac_service.register_callback(callback_send_multiple)
+    ac_service.use_multithread(True)
+    ac_service.register_callback(callback_threaded)
+    ac_service.register_callback(callback_concurrent)
+    ac_service.use_multithread(False)
+    ac_service.register_callback(callback_raise_exception)
+    ac_service.register_callback(callback_signal)
+    ac_service.register_callback(callback_counter)
+    ac_service.register_callback(callback_generator, chunk_size=3)
+    ac_service.register_callback(callback_slow_counter)
 
     def test_call_pickle(self):
         """Test with pickle serialization (callback with two arguments)"""
@@ -98,6 +170,15 @@ class TestCalls(unittest.TestCase):
         self.assertEqual(data, callback_string.data)
         self.assertEqual(ret, 'Föóbàr ԜՕȐŁǷ')
 
+    def test_call_bytes(self):
+        """Test with binary data (no serialization)"""
+        call_cfg = ac_sender.CallConfig('callback_bytes',
+                                        ser_type=ac_sender.SER_TYPE_BYTES, ser_type_return=ac_sender.SER_TYPE_BYTES)
+        data = bytearray(range(256))
+        ret = ac_sender.make_call(call_cfg, data)
+        self.assertEqual(callback_bytes.data, data)
+        self.assertEqual(ret, bytes(reversed(data)))
+
     def test_bogus_sender(self):
         """Test with a bogus add-on ID target"""
         call_cfg = ac_sender.CallConfig('callback_bogus_sender', addon_id='bogus.sender.id', timeout_secs=1)
@@ -105,6 +186,26 @@ class TestCalls(unittest.TestCase):
             ac_sender.make_call(call_cfg, dict(bogus='data'))
         self.assertTrue(isinstance(cm.exception, ac_sender.WaitTimeoutError))
 
+    def test_message_template(self):
+        """Test the prebuilt message of the calls, and the validation of the names that would break the message"""
+        call_cfg = ac_sender.CallConfig('callback_call_json', addon_id='plugin.other-addon_2.id',
+                                        ser_type=ac_sender.SER_TYPE_JSON)
+        self.assertEqual(call_cfg.message_template.build('abc1-123', 'e30='),
+                         ac_sender.JSONRPC_NOTIFYALL_STR.format(callback_name='callback_call_json', ser_type='json',
+                                                                ser_type_return='json', call_id='abc1-123',
+                                                                sender_id='plugin.other-addon_2.id/plugin.example.id',
+                                                                sender_id_suffix='.ADDONCONNECTOR', data='e30='))
+        json.loads(call_cfg.message_template.build('abc1-123', 'e30='))
+        # The template is updated when the configuration is changed
+        call_cfg.ser_type = ac_sender.SER_TYPE_PICKLE
+        self.assertIn('callback_call_json.pickle.json.', call_cfg.message_template.build('', ''))
+        for callback_name in ['callback"name', 'callback.name', 'callback\\name', '']:
+            with self.assertRaises(ac_sender.AddonConnectorException):
+                ac_sender.CallConfig(callback_name)
+        for addon_id in ['plugin"example', 'plugin/example']:
+            with self.assertRaises(ac_sender.AddonConnectorException):
+                ac_sender.CallConfig('callback_call_json', addon_id=addon_id)
+
     def test_call_pickle_args_kwargs(self):
         """Test with pickle and multiple args and kwargs"""
         call_cfg = ac_sender.CallConfig('callback_args_kwargs')
@@ -123,3 +224,591 @@ class TestCalls(unittest.TestCase):
             ret = ac_sender.make_call(call_cfg, idx=idx)
             self.assertEqual(idx, callback_send_multiple.data)
             self.assertEqual(ret, dict(idx=idx))
+
+    def test_call_threaded(self):
+        """Test the wait of the return call from a callback executed in a thread"""
+        call_cfg = ac_sender.CallConfig('callback_threaded', timeout_secs=2)
+        start_time = time.perf_counter()
+        ret = ac_sender.make_call(call_cfg, 21)
+        self.assertEqual(ret, 42)
+        self.assertEqual(callback_threaded.data, 21)
+        self.assertLess(time.perf_counter() - start_time, 1)
+
+    def test_concurrent_calls(self):
+        """Test concurrent calls from multiple threads to the same callback"""
+        from concurrent.futures import ThreadPoolExecutor
+        call_cfg = ac_sender.CallConfig('callback_concurrent', timeout_secs=2)
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(lambda value: ac_sender.make_call(call_cfg, value), range(20)))
+        self.assertEqual(results, list(range(20)))
+
+    def test_exception_forwarding(self):
+        """Test the forwarding of an exception raised by the callback"""
+        call_cfg = ac_sender.CallConfig('callback_raise_exception', timeout_secs=2)
+        with self.assertRaises(ValueError) as cm:
+            ac_sender.make_call(call_cfg, 'Test exception')
+        self.assertEqual(str(cm.exception), 'Test exception')
+
+    def test_batch_call(self):
+        """Test multiple calls packed in a batch call"""
+        results = ac_sender.make_batch_call([
+            (ac_sender.CallConfig('callback_args_kwargs'), ('one', 'two'), dict(third=1, fourth=2)),
+            (ac_sender.CallConfig('callback_call_json', ser_type=ac_sender.SER_TYPE_JSON), ({'test': 1},), {}),
+            (ac_sender.CallConfig('callback_send_multiple'), (), dict(idx=5))
+        ])
+        self.assertEqual(results, [3, dict(value='return_call', data={'test': 1}), dict(idx=5)])
+
+    def test_batch_call_exceptions(self):
+        """Test the exceptions raised by the callbacks of a batch call"""
+        calls = [
+            (ac_sender.CallConfig('callback_send_multiple'), (), dict(idx=1)),
+            (ac_sender.CallConfig('callback_raise_exception'), ('Test exception',), {}),
+            (ac_sender.CallConfig('callback_not_registered'), (), {})
+        ]
+        with self.assertRaises(ValueError):
+            ac_sender.make_batch_call(calls)
+        results = ac_sender.make_batch_call(calls, return_exceptions=True)
+        self.assertEqual(results[0], dict(idx=1))
+        self.assertTrue(isinstance(results[1], ValueError))
+        self.assertTrue(isinstance(results[2], ac_sender.AddonConnectorException))
+
+    def test_batch_call_timeout(self):
+        """Test that the pending calls of a batch call are removed when a batch call times out"""
+        receiver = ac_sender._receiver()  # pylint: disable=protected-access
+        pending_calls = set(receiver.calls.pending_calls)
+        with self.assertRaises(ac_sender.WaitTimeoutError):
+            ac_sender.make_batch_call([
+                (ac_sender.CallConfig('callback_bogus_sender', addon_id='bogus.sender.id', timeout_secs=0.5),
+                 ({},), {}),
+                (ac_sender.CallConfig('callback_send_multiple'), (), dict(idx=1))
+            ])
+        self.assertEqual(set(receiver.calls.pending_calls), pending_calls)
+
+    def test_signal_batcher(self):
+        """Test the signals sent in batch when the max batch size is reached"""
+        del callback_signal.data[:]
+        call_cfg = ac_sender.CallConfig('callback_signal')
+        batcher = ac_sender.SignalBatcher(flush_interval=10, max_batch_size=3)
+        batcher.make_signal_call(call_cfg, 1)
+        batcher.make_signal_call(call_cfg, 2)
+        self.assertEqual(callback_signal.data, [])
+        batcher.make_signal_call(call_cfg, 3)
+        self.assertEqual(callback_signal.data, [1, 2, 3])
+        batcher.make_signal_call(call_cfg, 4)
+        batcher.flush()
+        self.assertEqual(callback_signal.data, [1, 2, 3, 4])
+
+    def test_signal_batcher_latest_wins(self):
+        """Test the signals sent in batch with the deduplication of the signals"""
+        del callback_signal.data[:]
+        call_cfg = ac_sender.CallConfig('callback_signal')
+        with ac_sender.SignalBatcher(flush_interval=0.05, latest_wins=True) as batcher:
+            for value in range(5):
+                batcher.make_signal_call(call_cfg, value)
+            batcher.make_signal_call(call_cfg.change_name('callback_send_multiple'), idx=9)
+        self.assertEqual(callback_signal.data, [4])
+        self.assertEqual(callback_send_multiple.data, 9)
+
+    def test_call_rejected(self):
+        """Test the exception received when the receiver rejects the call"""
+        dispatcher = ac_service._receiver().lanes.dispatcher  # pylint: disable=protected-access
+        max_queue_size = dispatcher.max_queue_size
+        dispatcher.max_queue_size = 0
+        try:
+            call_cfg = ac_sender.CallConfig('callback_threaded', timeout_secs=2)
+            with self.assertRaises(ac_sender.CallRejectedError):
+                ac_sender.make_call(call_cfg, 1)
+        finally:
+            dispatcher.max_queue_size = max_queue_size
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'POSIX permissions not supported')
+    def test_private_temp_dir(self):
+        """Test that the files of the large payloads are saved to a folder accessible only by the current user"""
+        import stat
+        import tempfile
+        import helper
+        self.assertEqual(stat.S_IMODE(os.stat(helper.get_temp_dir()).st_mode), 0o700)
+        with tempfile.TemporaryDirectory() as path:
+            # The permissions are restricted
+            os.chmod(path, 0o777)
+            helper._check_private_dir(path)  # pylint: disable=protected-access
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+            # A symbolic link could point to a folder of another user
+            os.symlink(path, path + '.link')
+            try:
+                with self.assertRaises(ac_sender.AddonConnectorException):
+                    helper._check_private_dir(path + '.link')  # pylint: disable=protected-access
+            finally:
+                os.remove(path + '.link')
+
+    def test_call_large_payload(self):
+        """Test the data transferred with a temporary file"""
+        import helper
+        ac_sender.set_large_payload_threshold(1000)
+        try:
+            payload_dir = helper.get_temp_dir()
+            files_count = len(os.listdir(payload_dir))
+            call_cfg = ac_sender.CallConfig('callback_call_pickle')
+            data = [TestClass(idx) for idx in range(1000)], 'Föóbàr' * 1000
+            ret = ac_sender.make_call(call_cfg, data[0], data[1])
+            self.assertEqual([obj.value for obj in ret[0]], list(range(1000)))
+            self.assertEqual(ret[1], data[1])
+            call_cfg = ac_sender.CallConfig('callback_string', ser_type=ac_sender.SER_TYPE_STRING,
+                                            ser_type_return=ac_sender.SER_TYPE_JSON)
+            ac_sender.make_call(call_cfg, data[1])
+            self.assertEqual(callback_string.data, data[1])
+            self.assertEqual(len(os.listdir(payload_dir)), files_count)
+        finally:
+            ac_sender.set_large_payload_threshold()
+
+    def test_call_large_payload_dropped(self):
+        """Test that the files of the large payloads are deleted also when the data are not delivered to a callback"""
+        import helper
+        import rpc
+        ac_sender.set_large_payload_threshold(1000)
+        try:
+            payload_dir = helper.get_temp_dir()
+            files_count = len(os.listdir(payload_dir))
+            data = 'Föóbàr' * 1000
+            results = ac_sender.make_batch_call([(ac_sender.CallConfig('callback_signal'), (data,), {})])
+            self.assertEqual(results, [None])
+            self.assertEqual(len(os.listdir(payload_dir)), files_count)
+            # A call received when the caller is no longer waiting for the result
+            del callback_signal.data[:]
+            rpc.send_rpc_call('callback_signal', ((data,), {}), call_id=helper.pack_call_id('1', 0))
+            self.assertEqual(callback_signal.data, [])
+            self.assertEqual(len(os.listdir(payload_dir)), files_count)
+            # A call to a callback not registered
+            rpc.send_rpc_call('callback_not_registered', ((data,), {}))
+            self.assertEqual(len(os.listdir(payload_dir)), files_count)
+            # A return call received after that the call has been cancelled
+            ac_sender._receiver().calls.add_cancelled_call('2')
+            rpc.send_rpc_call(helper.RETURN_CALL_PREFIX + 'callback_signal', data, call_id='2')
+            self.assertEqual(len(os.listdir(payload_dir)), files_count)
+        finally:
+            ac_sender.set_large_payload_threshold()
+
+    def test_call_cached(self):
+        """Test the results answered from the cache, and the invalidation of the cache"""
+        call_cfg = ac_sender.CallConfig('callback_counter', cache_ttl=60, cache_max_entries=2)
+        count = callback_counter.count
+        self.assertEqual(ac_sender.make_call(call_cfg, 'a'), ('a', count + 1))
+        self.assertEqual(ac_sender.make_call(call_cfg, 'a'), ('a', count + 1))
+        self.assertEqual(ac_sender.make_call(call_cfg, 'b'), ('b', count + 2))
+        self.assertEqual(ac_sender.make_call(call_cfg, 'c'), ('c', count + 3))
+        # The least recently used result ('a') has been discarded
+        self.assertEqual(ac_sender.make_call(call_cfg, 'a'), ('a', count + 4))
+        self.assertEqual((call_cfg.result_cache.hits, call_cfg.result_cache.misses), (1, 4))
+        ac_service.invalidate_cache('callback_counter')
+        self.assertEqual(len(call_cfg.result_cache), 0)
+        self.assertEqual(ac_sender.make_call(call_cfg, 'a'), ('a', count + 5))
+
+    def test_call_cached_copy(self):
+        """Test that the changes made to a cached result are not seen by the next calls"""
+        call_cfg = ac_sender.CallConfig('callback_call_json', cache_ttl=60)
+        ret = ac_sender.make_call(call_cfg, {'test': 1})
+        ret['data']['test'] = 2
+        ret = ac_sender.make_call(call_cfg, {'test': 1})
+        self.assertEqual(ret, dict(value='return_call', data={'test': 1}))
+        ret['value'] = 'changed'
+        self.assertEqual(ac_sender.make_call(call_cfg, {'test': 1}), dict(value='return_call', data={'test': 1}))
+        self.assertEqual(call_cfg.result_cache.hits, 2)
+
+    def test_call_streamed(self):
+        """Test the items of a generator streamed in chunks"""
+        call_cfg = ac_sender.CallConfig('callback_generator', ser_type_return=ac_sender.SER_TYPE_JSON)
+        self.assertEqual(list(ac_sender.make_call_iter(call_cfg, 5)), [0, 1, 2, 3, 4])
+        self.assertEqual(list(ac_sender.make_call_iter(call_cfg, 0)), [])
+        self.assertEqual(ac_sender.make_call(call_cfg, 6), [0, 1, 2, 3, 4, 5])
+        items = []
+        with self.assertRaises(ValueError):
+            for item in ac_sender.make_call_iter(call_cfg, 10):
+                items.append(item)
+        self.assertEqual(items, [0, 1, 2, 3, 4, 5])
+        # A result that is not a generator is iterated once received
+        call_cfg = ac_sender.CallConfig('callback_call_pickle')
+        self.assertEqual(list(ac_sender.make_call_iter(call_cfg, 1, 2)), [1, 2])
+
+    def test_call_streamed_long(self):
+        """Test a stream that lasts longer than the timeout, that is applied to the waiting of each chunk"""
+        def callback_slow_generator(count):
+            for value in range(count):
+                time.sleep(0.15)
+                yield value
+
+        ac_service.register_callback(callback_slow_generator, chunk_size=1)
+        try:
+            call_cfg = ac_sender.CallConfig('callback_slow_generator', timeout_secs=0.5)
+            self.assertEqual(list(ac_sender.make_call_iter(call_cfg, 6)), [0, 1, 2, 3, 4, 5])
+        finally:
+            ac_service.unregister_callback('callback_slow_generator')
+
+    def test_instrumentation(self):
+        """Test the hooks and the metrics recorded with the instrumentation enabled"""
+        events = []
+
+        def hook(event, stage, callback_name, timestamp, size):  # pylint: disable=unused-argument
+            events.append((event, stage, callback_name))
+
+        ac_sender.dump_metrics(reset=True)
+        ac_sender.add_instrumentation_hook(hook)
+        ac_sender.use_instrumentation(True)
+        try:
+            ac_sender.make_call(ac_sender.CallConfig('callback_send_multiple'), idx=1)
+        finally:
+            ac_sender.use_instrumentation(False)
+            ac_sender.remove_instrumentation_hook(hook)
+        self.assertEqual(events[0], ('start', 'call', 'callback_send_multiple'))
+        self.assertEqual(events[-1], ('end', 'call', 'callback_send_multiple'))
+        metrics = ac_sender.dump_metrics()
+        self.assertEqual(set(metrics['callback_send_multiple']), {'call', 'serialize', 'send', 'receive', 'execute'})
+        self.assertEqual(metrics['callback_send_multiple']['call']['count'], 1)
+        self.assertTrue(metrics['callback_send_multiple']['serialize']['total_bytes'] > 0)
+        ac_sender.make_call(ac_sender.CallConfig('callback_send_multiple'), idx=1)
+        self.assertEqual(ac_sender.dump_metrics()['callback_send_multiple']['call']['count'], 1)
+
+    def test_call_single_flight(self):
+        """Test the concurrent calls with same arguments that share a single RPC call"""
+        call_cfg = ac_sender.CallConfig('callback_slow_counter', single_flight=True)
+
+        def make_call(value, results):
+            try:
+                results.append(ac_sender.make_call(call_cfg, value))
+            except ValueError as exc:
+                results.append(exc)
+
+        for value in ['a', None]:
+            count = callback_slow_counter.count
+            results = []
+            threads = [threading.Thread(target=make_call, args=(value, results)) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(callback_slow_counter.count, count + 1)
+            self.assertEqual(len(results), 5)
+            if value is None:
+                self.assertTrue(all(isinstance(result, ValueError) for result in results))
+            else:
+                self.assertEqual(results, [('a', count + 1)] * 5)
+
+    def test_call_local(self):
+        """Test the calls to a callback registered in the same interpreter, executed without RPC calls"""
+        def callback_local(data):
+            data.append('local')
+            if len(data) > 2:
+                raise ValueError('Test exception')
+            return data
+
+        ac_sender.register_callback(callback_local)
+        try:
+            data = []
+            ret = ac_sender.make_call(ac_sender.CallConfig('callback_local'), data)
+            self.assertIs(ret, data)
+            self.assertEqual(data, ['local'])
+            ret = ac_sender.make_call(ac_sender.CallConfig('callback_local', copy_args=True), data)
+            self.assertEqual(ret, ['local', 'local'])
+            self.assertEqual(data, ['local'])
+            with self.assertRaises(ValueError):
+                ac_sender.make_call(ac_sender.CallConfig('callback_local'), ['a', 'b'])
+        finally:
+            ac_sender.unregister_callback('callback_local')
+
+    def test_call_local_semantics(self):
+        """Test that the local calls keep the timeout, cancellation and admission control of the RPC calls"""
+        def callback_local_slow(delay):
+            cancel_tokens.append(ac_sender.get_cancel_token())
+            time.sleep(delay)
+            return delay
+
+        cancel_tokens = []
+        ac_sender.register_callback(callback_local_slow)
+        try:
+            call_cfg = ac_sender.CallConfig('callback_local_slow', timeout_secs=0.2)
+            self.assertEqual(ac_sender.make_call(call_cfg, 0), 0)
+            self.assertFalse(cancel_tokens[0].is_cancelled)
+            # The result returned too late is discarded
+            with self.assertRaises(ac_sender.WaitTimeoutError):
+                ac_sender.make_call(call_cfg, 0.3)
+            self.assertTrue(cancel_tokens[1].is_cancelled)
+            self.assertFalse(ac_sender.get_cancel_token().is_cancelled)
+            # The calls with an admission limit are rejected as the RPC calls
+            ac_sender.set_admission_limit('callback_local_slow', rate=1, burst=1)
+            ac_sender.make_call(call_cfg, 0)
+            with self.assertRaises(ac_sender.CallThrottledError):
+                ac_sender.make_call(call_cfg, 0)
+        finally:
+            ac_sender.remove_admission_limits()
+            ac_sender.unregister_callback('callback_local_slow')
+
+    def test_call_lanes(self):
+        """Test the calls of a lane not delayed by the calls queued in another lane"""
+        release = threading.Event()
+
+        def callback_bulk():
+            release.wait(2)
+
+        ac_service.use_lane('bulk', max_workers=1)
+        ac_service.register_callback(callback_bulk, lane='bulk')
+        ac_service.register_callback(callback_concurrent, 'callback_high', lane='high')
+        try:
+            call_cfg = ac_sender.CallConfig('callback_bulk')
+            for _ in range(3):
+                ac_sender.make_signal_call(call_cfg)
+            # The call is executed while the calls of the bulk lane are blocked
+            self.assertEqual(ac_sender.make_call(ac_sender.CallConfig('callback_high', timeout_secs=1), 5), 5)
+            stats = ac_service.get_lanes_stats()
+            self.assertGreaterEqual(stats['bulk']['queued'], 2)
+            self.assertEqual(stats['high']['executed'], 1)
+        finally:
+            release.set()
+            ac_service.unregister_callback('callback_bulk')
+            ac_service.unregister_callback('callback_high')
+
+    def test_call_cancelled(self):
+        """Test the cancellation of the calls when the caller is no longer waiting for the result"""
+        release = threading.Event()
+        cancelled = threading.Event()
+        executed = []
+
+        def callback_cancellable(value):
+            executed.append(value)
+            cancel_token = ac_service.get_cancel_token()
+            while not cancel_token.is_cancelled:
+                time.sleep(0.01)
+            cancelled.set()
+            release.wait(2)
+
+        ac_service.use_lane('cancellable', max_workers=1)
+        ac_service.register_callback(callback_cancellable, lane='cancellable')
+        try:
+            call_cfg = ac_sender.CallConfig('callback_cancellable', timeout_secs=0.2)
+            with self.assertRaises(ac_sender.WaitTimeoutError):
+                ac_sender.make_call(call_cfg, 1)
+            self.assertTrue(cancelled.wait(1))
+            # The worker of the lane is busy, so the next call wait in the queue until its deadline
+            with self.assertRaises(ac_sender.WaitTimeoutError):
+                ac_sender.make_call(call_cfg, 2)
+            release.set()
+            time.sleep(0.1)
+            self.assertEqual(executed, [1])
+            self.assertEqual(ac_service._receiver().calls._cancel_tokens, {})  # pylint: disable=protected-access
+        finally:
+            release.set()
+            ac_service.unregister_callback('callback_cancellable')
+
+    def test_call_throttled(self):
+        """Test the calls rejected by the admission control of the receiver"""
+        ac_service.set_admission_limit('callback_counter', rate=1, burst=2)
+        try:
+            call_cfg = ac_sender.CallConfig('callback_counter', timeout_secs=1)
+            ac_sender.make_call(call_cfg, 1)
+            ac_sender.make_call(call_cfg, 2)
+            with self.assertRaises(ac_sender.CallThrottledError):
+                ac_sender.make_call(call_cfg, 3)
+            # The limit is not applied to the other callbacks
+            ac_sender.make_call(ac_sender.CallConfig('callback_send_multiple'), idx=1)
+        finally:
+            ac_service.remove_admission_limits()
+        ac_sender.make_call(call_cfg, 4)
+
+    def test_batch_call_throttled(self):
+        """Test the calls of a batch call rejected by the admission control of the receiver"""
+        ac_service.set_admission_limit('callback_counter', rate=1, burst=2)
+        try:
+            call_cfg = ac_sender.CallConfig('callback_counter', timeout_secs=1)
+            calls = [(call_cfg, (value,), {}) for value in [1, 2, 3]]
+            calls.append((ac_sender.CallConfig('callback_send_multiple'), (), dict(idx=1)))
+            results = ac_sender.make_batch_call(calls, return_exceptions=True)
+            self.assertNotIsInstance(results[1], Exception)
+            self.assertIsInstance(results[2], ac_sender.CallThrottledError)
+            self.assertNotIsInstance(results[3], Exception)
+        finally:
+            ac_service.remove_admission_limits()
+
+    def test_signal_outbox(self):
+        """Test the signals queued in the outbox when the service is not running, and delivered when ready"""
+        del callback_signal.data[:]
+        ac_service.notify_stopped()
+        call_cfg = ac_sender.CallConfig('callback_signal', outbox_ttl=60)
+        for value in [1, 2, 1]:
+            ac_sender.make_signal_call(call_cfg, value)
+        ac_sender.make_signal_call(ac_sender.CallConfig('callback_signal', outbox_ttl=-1), 'expired')
+        self.assertEqual(callback_signal.data, [])
+        ac_service.notify_ready()
+        try:
+            # The duplicated signal is delivered once, at the position of the latest one
+            self.assertEqual(callback_signal.data, [2, 1])
+            ac_sender.make_signal_call(call_cfg, 3)
+            self.assertEqual(callback_signal.data, [2, 1, 3])
+        finally:
+            ac_service.notify_stopped()
+
+    def test_outbox_replays(self):
+        """Test the signals appended to the outbox after a replay, by the same writer"""
+        import outbox
+        writer = outbox.get_outbox_writer('plugin.outbox.id')
+        writer.append(time.time() + 60, 'callback_signal', 'str', 'key1', 'ZDE=')
+        self.assertEqual(outbox.take_outbox_signals('plugin.outbox.id'), [('callback_signal', 'str', 'ZDE=')])
+        writer.append(time.time() + 60, 'callback_signal', 'str', 'key2', 'ZDI=')
+        self.assertEqual(outbox.take_outbox_signals('plugin.outbox.id'), [('callback_signal', 'str', 'ZDI=')])
+        self.assertEqual(outbox.take_outbox_signals('plugin.outbox.id'), [])
+
+    def test_ready_marker(self):
+        """Test that the callbacks of the readiness marker are read again when the marker is written"""
+        import outbox
+        try:
+            outbox.write_ready_marker('plugin.marker.id', ['callback_a'])
+            self.assertEqual(outbox.read_ready_marker('plugin.marker.id'), ('callback_a',))
+            self.assertEqual(outbox.read_ready_marker('plugin.marker.id'), ('callback_a',))
+            outbox.write_ready_marker('plugin.marker.id', ['callback_a', 'callback_b'])
+            self.assertEqual(outbox.read_ready_marker('plugin.marker.id'), ('callback_a', 'callback_b'))
+        finally:
+            outbox.remove_ready_marker('plugin.marker.id')
+        self.assertIsNone(outbox.read_ready_marker('plugin.marker.id'))
+
+    def test_fail_fast(self):
+        """Test the calls that fail without wait the timeout, from the callbacks announced by the add-ons"""
+        call_cfg = ac_sender.CallConfig('callback_bogus_sender', addon_id='bogus.sender.id', timeout_secs=5,
+                                        fail_fast=True)
+        with self.assertRaises(ac_sender.ServiceNotReadyError):
+            ac_sender.make_call(call_cfg, dict(bogus='data'))
+        # The service announces its callbacks when it is ready
+        ac_service.notify_ready()
+        try:
+            call_cfg = ac_sender.CallConfig('callback_not_registered', timeout_secs=5, fail_fast=True)
+            with self.assertRaises(ac_sender.CallbackNotFoundError):
+                ac_sender.make_call(call_cfg)
+            call_cfg = ac_sender.CallConfig('callback_args_kwargs', fail_fast=True)
+            self.assertEqual(ac_sender.make_call(call_cfg, 1, 2, third=1, fourth=2), 3)
+            self.assertIn('callback_args_kwargs', ac_sender.get_services()['plugin.example.id'])
+            # The callbacks unregistered are announced
+            ac_service.unregister_callback('callback_args_kwargs')
+            ac_service._announcer().flush()  # pylint: disable=protected-access
+            with self.assertRaises(ac_sender.CallbackNotFoundError):
+                ac_sender.make_call(call_cfg, 1, 2, third=1, fourth=2)
+            ac_service.register_callback(callback_args_kwargs)
+            ac_service._announcer().flush()  # pylint: disable=protected-access
+            self.assertEqual(ac_sender.make_call(call_cfg, 1, 2, third=1, fourth=2), 3)
+        finally:
+            ac_service.notify_stopped()
+        with self.assertRaises(ac_sender.ServiceNotReadyError):
+            ac_sender.make_call(call_cfg, 1, 2, third=1, fourth=2)
+
+    def test_announce_delayed(self):
+        """Test that the callbacks registered at same time are announced once, after the announce delay"""
+        import helper
+        registry = ac_sender._receiver().registry  # pylint: disable=protected-access
+        updates = []
+        registry_update = registry.update
+        registry.update = lambda addon_id, instance_id, callback_names: updates.append(callback_names)
+        try:
+            ac_service.register_callbacks([(callback_counter, 'callback_announce_{}'.format(idx)) for idx in range(5)])
+            ac_service.unregister_callback('callback_announce_4')
+            self.assertEqual(updates, [])
+            time.sleep(helper.ANNOUNCE_DELAY + 0.2)
+            self.assertEqual(len(updates), 1)
+            self.assertIn('callback_announce_3', updates[0])
+            self.assertNotIn('callback_announce_4', updates[0])
+        finally:
+            registry.update = registry_update
+            for idx in range(4):
+                ac_service.unregister_callback('callback_announce_{}'.format(idx))
+            ac_service._announcer().flush()  # pylint: disable=protected-access
+
+
+async def callback_coroutine(value):
+    await asyncio.sleep(0.01)
+    if value is None:
+        raise ValueError('Test exception')
+    return value * 2
+
+
+class TestAsyncCalls(unittest.TestCase):
+    """Unit test for RPC calls with asyncio"""
+
+    @classmethod
+    def setUpClass(cls):
+        # The service executes the coroutine callbacks on its event loop, running on a separate thread
+        cls.service_loop = asyncio.new_event_loop()
+        threading.Thread(target=cls.service_loop.run_forever, daemon=True).start()
+        ac_service.use_event_loop(cls.service_loop)
+        ac_service.register_callback(callback_coroutine)
+
+    @classmethod
+    def tearDownClass(cls):
+        ac_service.unregister_callback('callback_coroutine')
+        ac_service.use_event_loop(None)
+        cls.service_loop.call_soon_threadsafe(cls.service_loop.stop)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_call_coroutine_callback(self):
+        """Test a blocking call to a coroutine callback"""
+        call_cfg = ac_sender.CallConfig('callback_coroutine', timeout_secs=2)
+        self.assertEqual(ac_sender.make_call(call_cfg, 21), 42)
+        with self.assertRaises(ValueError):
+            ac_sender.make_call(call_cfg, None)
+
+    def test_call_async(self):
+        """Test multiple async calls awaited at same time"""
+        async def make_calls():
+            call_cfg = ac_sender.CallConfig('callback_coroutine', timeout_secs=2)
+            futures = [ac_sender.make_call_async(call_cfg, value) for value in range(10)]
+            futures.append(ac_sender.make_call_async(ac_sender.CallConfig('callback_call_json',
+                                                                          ser_type=ac_sender.SER_TYPE_JSON), 'sync'))
+            return await asyncio.gather(*futures)
+
+        results = self.loop.run_until_complete(make_calls())
+        self.assertEqual(results[:-1], [value * 2 for value in range(10)])
+        self.assertEqual(results[-1], dict(value='return_call', data='sync'))
+
+    def test_call_async_exceptions(self):
+        """Test the exceptions raised by the future"""
+        async def make_calls():
+            with self.assertRaises(ValueError):
+                await ac_sender.make_call_async(ac_sender.CallConfig('callback_coroutine'), None)
+            call_cfg = ac_sender.CallConfig('callback_bogus_sender', addon_id='bogus.sender.id', timeout_secs=0.2)
+            with self.assertRaises(ac_sender.WaitTimeoutError):
+                await ac_sender.make_call_async(call_cfg)
+
+        self.loop.run_until_complete(make_calls())
+
+    def test_call_coroutine_max_inflight(self):
+        """Test that a coroutine callback counts as in execution until the coroutine is done"""
+        async def make_calls():
+            call_cfg = ac_sender.CallConfig('callback_coroutine', timeout_secs=2)
+            return await asyncio.gather(ac_sender.make_call_async(call_cfg, 1), ac_sender.make_call_async(call_cfg, 2),
+                                        return_exceptions=True)
+
+        ac_service.set_admission_limit('callback_coroutine', max_inflight=1)
+        try:
+            results = self.loop.run_until_complete(make_calls())
+            self.assertEqual(results[0], 2)
+            self.assertIsInstance(results[1], ac_sender.CallThrottledError)
+            # The admission is released when the coroutine is done
+            self.assertEqual(ac_sender.make_call(ac_sender.CallConfig('callback_coroutine', timeout_secs=2), 3), 6)
+        finally:
+            ac_service.remove_admission_limits()
+
+    def test_signal_call_async(self):
+        """Test an async signal call"""
+        del callback_signal.data[:]
+        call_cfg = ac_sender.CallConfig('callback_signal')
+
+        async def make_call():
+            await ac_sender.make_signal_call_async(call_cfg, 'async')
+
+        self.loop.run_until_complete(make_call())
+        self.assertEqual(callback_signal.data, ['async'])
+        # The async calls must be made from the running event loop
+        with self.assertRaises(RuntimeError):
+            ac_sender.make_signal_call_async(call_cfg, 'async')
+        with self.assertRaises(RuntimeError):
+            ac_sender.make_call_async(call_cfg, 'async')
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2021, Stefano Gottardo (@CastagnaIT)
+# GNU Lesser General Public License v2.1 or later (see LICENSE.txt)
+
+# pylint: disable=missing-docstring
+
+import threading
+import time
+import unittest
+
+from dispatcher import CallDispatcher
+from helper import CallRejectedError
+
+
+class TestDispatcher(unittest.TestCase):
+    """Unit test for the dispatcher of the threaded callbacks"""
+
+    def test_ordered_calls(self):
+        """Test the calls executed in the same order in which they are submitted"""
+        dispatcher = CallDispatcher(max_workers=4, max_queue_size=100)
+        results = []
+        done = threading.Event()
+
+        def func(value):
+            time.sleep(0.001)
+            results.append(value)
+            if value == 19:
+                done.set()
+
+        for value in range(20):
+            dispatcher.submit('ordered', 1, func, (value,))
+        self.assertTrue(done.wait(2))
+        self.assertEqual(results, list(range(20)))
+
+    def test_burst_of_calls(self):
+        """Test that a burst of calls is executed in parallel also when there is an idle worker"""
+        dispatcher = CallDispatcher(max_workers=4, max_queue_size=100)
+        warmed_up = threading.Event()
+        dispatcher.submit('warmup', None, warmed_up.set)
+        self.assertTrue(warmed_up.wait(2))
+        time.sleep(0.05)  # The worker is now idle
+        done = threading.Barrier(5)
+        start_time = time.perf_counter()
+        for _ in range(4):
+            dispatcher.submit('burst', None, lambda: (time.sleep(0.2), done.wait(2)))
+        done.wait(2)
+        self.assertLess(time.perf_counter() - start_time, 0.5)
+
+    def test_max_concurrency(self):
+        """Test the maximum number of calls executed at same time for a slot"""
+        dispatcher = CallDispatcher(max_workers=8, max_queue_size=100)
+        lock = threading.Lock()
+        state = dict(running=0, max_running=0, done=0)
+        done = threading.Event()
+
+        def func():
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+                state['done'] += 1
+                if state['done'] == 12:
+                    done.set()
+
+        for _ in range(12):
+            dispatcher.submit('limited', 2, func)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(state['max_running'], 2)
+
+    def test_rejected_calls(self):
+        """Test the calls rejected when the queue is full"""
+        dispatcher = CallDispatcher(max_workers=1, max_queue_size=2)
+        release = threading.Event()
+        dispatcher.submit('slot', None, release.wait)
+        time.sleep(0.05)  # Wait that the worker take the first call
+        dispatcher.submit('slot', None, release.wait)
+        dispatcher.submit('slot', None, release.wait)
+        with self.assertRaises(CallRejectedError):
+            dispatcher.submit('slot', None, release.wait)
+        release.set()
+
+    def test_stats(self):
+        """Test the statistics of the queue depth and the wait time"""
+        dispatcher = CallDispatcher(max_workers=1, max_queue_size=10)
+        release = threading.Event()
+        done = threading.Event()
+        dispatcher.submit('slot', None, release.wait)
+        time.sleep(0.05)  # Wait that the worker take the first call
+        dispatcher.submit('slot', None, done.set)
+        self.assertEqual(dispatcher.get_stats()['queued'], 1)
+        time.sleep(0.02)
+        release.set()
+        self.assertTrue(done.wait(2))
+        stats = dispatcher.get_stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['executed'], 2)
+        self.assertGreaterEqual(stats['max_wait_ms'], 20)
@@ -4,22 +4,97 @@
 
 # pylint: disable=missing-docstring
 
-# import unittest
-# import lib.addonconnector
-
-# xbmc = __import__('xbmc')
-# xbmcaddon = __import__('xbmcaddon')
-
-
-# class TestEncoding(unittest.TestCase):
-#
-#     def test_addon_signals(self):
-#         data = 'Fòöbàr'
-#         base64_encoded_data = 'IkZcdTAwZjJcdTAwZjZiXHUwMGUwciI='
-#         base64_encoded_json = '["%s"]' % base64_encoded_data
-#
-#         encoded_data = AddonSignals._encode_data(data)  # pylint: disable=protected-access
-#         self.assertEqual(encoded_data, base64_encoded_data)
-#
-#         decoded_data = AddonSignals._decode_data(base64_encoded_json)  # pylint: disable=protected-access
-#         self.assertEqual(decoded_data, data)
+import json
+import pickle
+import struct
+import unittest
+from array import array
+
+import helper
+
+
+class ReversedStringCodec(helper.Codec):
+    """A custom codec for the tests"""
+
+    def encode(self, data):
+        return data[::-1].encode('utf-8')
+
+    def decode(self, data):
+        return str(data, 'utf-8')[::-1]
+
+
+class TestEncoding(unittest.TestCase):
+    """Unit test for the serialization of the data"""
+
+    def assert_round_trip(self, ser_type, data):
+        serialized = helper.serialize_data(ser_type, data)
+        # The data are received from the Kodi notification as JSON string
+        received = json.dumps(json.loads(json.dumps(serialized)))
+        self.assertEqual(helper.deserialize_data(ser_type, received), data)
+        return serialized
+
+    def test_ser_types(self):
+        data = dict(test='Föóbàr', values=list(range(10)))
+        for ser_type in [helper.SER_TYPE_PICKLE, helper.SER_TYPE_PICKLE_COMPACT, helper.SER_TYPE_JSON]:
+            self.assert_round_trip(ser_type, data)
+        self.assert_round_trip(helper.SER_TYPE_STRING, 'Föóbàr')
+        self.assertEqual(helper.serialize_data(helper.SER_TYPE_NONE, data), '')
+        self.assertEqual(helper.deserialize_data(helper.SER_TYPE_NONE, '""'), None)
+
+    def test_compact_compressed(self):
+        data = ['Föóbàr ԜՕȐŁǷ'] * 10000
+        serialized = self.assert_round_trip(helper.SER_TYPE_PICKLE_COMPACT, data)
+        self.assertTrue(serialized.startswith(helper.COMPRESSED_DATA_MARKER))
+        self.assertLess(len(serialized), len(helper.serialize_data(helper.SER_TYPE_PICKLE, data)) / 10)
+        # The data can be put in a JSON string without escaping
+        self.assertEqual(json.dumps(serialized), '"' + serialized + '"')
+        # The small data are not compressed
+        self.assertEqual(helper.serialize_data(helper.SER_TYPE_PICKLE_COMPACT, data[:10]),
+                         helper.serialize_data(helper.SER_TYPE_PICKLE, data[:10]))
+
+    def test_custom_codec(self):
+        helper.register_codec('reversed', ReversedStringCodec())
+        try:
+            serialized = self.assert_round_trip('reversed', 'Föóbàr')
+            self.assertEqual(serialized, helper.CODECS['reversed'].to_text('ràbóöF'.encode('utf-8')))
+        finally:
+            del helper.CODECS['reversed']
+        with self.assertRaises(helper.AddonConnectorException):
+            helper.serialize_data('reversed', 'Föóbàr')
+        with self.assertRaises(helper.AddonConnectorException):
+            helper.register_codec('bad.name', ReversedStringCodec())
+
+    def test_bytes(self):
+        data = bytes(range(256)) * 4
+        self.assert_round_trip(helper.SER_TYPE_BYTES, data)
+        # Any object that support the buffer protocol is encoded from a view, without copy the data
+        array_data = array('i', range(256))
+        self.assertEqual(helper.deserialize_data(helper.SER_TYPE_BYTES,
+                                                 helper.serialize_data(helper.SER_TYPE_BYTES, array_data)),
+                         array_data.tobytes())
+        self.assertIsInstance(helper.encode_data(helper.SER_TYPE_BYTES, ((bytearray(data),), {})), memoryview)
+        self.assertEqual(helper.decode_data(helper.SER_TYPE_BYTES, bytearray(data)), data)
+        with self.assertRaises(helper.AddonConnectorException):
+            helper.serialize_data(helper.SER_TYPE_BYTES, 'Föóbàr')
+
+    @unittest.skipIf(pickle.HIGHEST_PROTOCOL < 5, 'Pickle protocol 5 not supported')
+    def test_pickle_out_of_band(self):
+        thumbnail = bytes(range(256)) * 100
+        data = dict(name='Föóbàr', thumbnail=pickle.PickleBuffer(thumbnail), values=[1, 2, 3])
+        encoded = helper.encode_data(helper.SER_TYPE_PICKLE_OOB, data)
+        # The buffer is sent as out-of-band buffer, not within the pickle data
+        self.assertEqual(struct.unpack_from('>IQ', encoded), (1, len(thumbnail)))
+        decoded = helper.decode_data(helper.SER_TYPE_PICKLE_OOB, encoded)
+        self.assertEqual(bytes(decoded.pop('thumbnail')), thumbnail)
+        self.assertEqual(decoded, dict(name='Föóbàr', values=[1, 2, 3]))
+        # With the large payloads the data are decoded from the memory-mapped file
+        helper.set_large_payload_threshold(1024)
+        try:
+            serialized = helper.serialize_data(helper.SER_TYPE_PICKLE_OOB, data)
+            self.assertTrue(serialized.startswith(helper.LARGE_PAYLOAD_MARKER))
+            self.assertEqual(bytes(helper.deserialize_data(helper.SER_TYPE_PICKLE_OOB, serialized)['thumbnail']),
+                             thumbnail)
+            serialized = self.assert_round_trip(helper.SER_TYPE_BYTES, thumbnail)
+            self.assertTrue(serialized.startswith(helper.LARGE_PAYLOAD_MARKER))
+        finally:
+            helper.set_large_payload_threshold()
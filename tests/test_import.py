@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2021, Stefano Gottardo (@CastagnaIT)
+# GNU Lesser General Public License v2.1 or later (see LICENSE.txt)
+
+# pylint: disable=missing-docstring
+
+import os
+import subprocess
+import sys
+import unittest
+
+# Maximum cumulative time in microseconds to import the addonconnector module (from the compiled bytecode)
+IMPORT_TIME_BUDGET_US = 20000
+# Modules that must be imported only when they are used
+LAZY_MODULES = ('asyncio', 'base64', 'inspect', 'json', 'pickle', 'queue', 'socket', 'threading', 'typing', 'uuid',
+                'zlib')
+
+IMPORT_SCRIPT = '''
+import sys
+import xbmc
+import xbmcaddon
+modules = set(sys.modules)
+import addonconnector
+print(' '.join(sorted(set(sys.modules) - modules)))
+'''
+
+
+def run_import(*options):
+    """Import the addonconnector module in a new interpreter, return the stdout and the stderr"""
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.join(root_dir, 'lib'), os.path.join(root_dir, 'tests')])
+    # The bytecode is written, so the next import will measure the import of the compiled modules
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    process = subprocess.run([sys.executable] + list(options) + ['-c', IMPORT_SCRIPT], env=env, check=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    return process.stdout, process.stderr
+
+
+class TestImport(unittest.TestCase):
+    """Unit test for the import footprint of the module"""
+
+    def test_lazy_imports(self):
+        """Test that the modules not needed at import time are not imported"""
+        stdout, _ = run_import()
+        imported_modules = stdout.split()
+        self.assertIn('addonconnector', imported_modules)
+        for module_name in LAZY_MODULES:
+            self.assertNotIn(module_name, imported_modules)
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'The option -X importtime requires Python 3.7 or later')
+    def test_import_time(self):
+        """Test the import time of the module measured with 'python -X importtime'"""
+        run_import()
+        _, stderr = run_import('-X', 'importtime')
+        # Each line has the format 'import time: self [us] | cumulative | imported package'
+        cumulative_time = None
+        for line in stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            _, cumulative, module_name = line.split('|')
+            if module_name.strip() == 'addonconnector':
+                cumulative_time = int(cumulative)
+        self.assertIsNotNone(cumulative_time)
+        self.assertLess(cumulative_time, IMPORT_TIME_BUDGET_US)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2021, Stefano Gottardo (@CastagnaIT)
+# GNU Lesser General Public License v2.1 or later (see LICENSE.txt)
+
+# pylint: disable=missing-docstring
+
+import os
+import subprocess
+import sys
+import unittest
+from contextlib import ExitStack
+
+import addonconnector
+import transport
+
+# The add-on service is executed in a separate process, so the calls can be received only through the socket
+SERVICE_SCRIPT = '''
+import sys
+import xbmcaddon
+xbmcaddon.ADDON_ID = 'plugin.transport.id'
+import addonconnector
+
+
+def callback_echo(*args, **kwargs):
+    return args, kwargs
+
+
+def callback_raise_exception(message):
+    raise ValueError(message)
+
+
+def callback_not_threaded():
+    return True
+
+
+def callback_limited():
+    return True
+
+
+addonconnector.use_socket_transport(True, listen=True)
+# The callbacks not threaded are executed on the Monitor thread, so they are not received through the socket
+addonconnector.register_callback(callback_not_threaded)
+addonconnector.use_multithread(True)
+addonconnector.register_callback(callback_echo)
+addonconnector.register_callback(callback_raise_exception)
+addonconnector.register_callback(callback_limited)
+addonconnector.set_admission_limit('callback_limited', rate=1, burst=1)
+print('ready', flush=True)
+sys.stdin.read()
+'''
+
+
+@unittest.skipUnless(transport.is_supported(), 'Unix domain sockets not supported')
+class TestTransport(unittest.TestCase):
+    """Unit test for RPC calls made through Unix domain sockets between two processes"""
+
+    @classmethod
+    def setUpClass(cls):
+        with ExitStack() as exit_stack:
+            cls.service = exit_stack.enter_context(
+                subprocess.Popen([sys.executable, '-c', SERVICE_SCRIPT], env=os.environ,
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True))
+            # On exit the service is terminated (if still running) and waited, then its pipes are closed
+            exit_stack.callback(cls.service.terminate)
+            assert cls.service.stdout.readline().strip() == 'ready'
+            cls.service_exit_stack = exit_stack.pop_all()
+        addonconnector.use_socket_transport(True)
+
+    @classmethod
+    def tearDownClass(cls):
+        addonconnector.use_socket_transport(False)
+        # The service exits when its stdin is closed
+        cls.service.stdin.close()
+        try:
+            cls.service.wait(5)
+        finally:
+            cls.service_exit_stack.close()
+
+    def test_socket_call(self):
+        """Test multiple calls, on the same pooled connection"""
+        call_cfg = addonconnector.CallConfig('callback_echo', addon_id='plugin.transport.id', timeout_secs=5)
+        for idx in range(3):
+            ret = addonconnector.make_call(call_cfg, 'Föóbàr', idx=idx)
+            self.assertEqual(ret, (('Föóbàr',), dict(idx=idx)))
+
+    def test_socket_call_large_data(self):
+        """Test a call with data larger than the socket buffers"""
+        call_cfg = addonconnector.CallConfig('callback_echo', addon_id='plugin.transport.id', timeout_secs=5)
+        data = list(range(500000))
+        ret = addonconnector.make_call(call_cfg, data)
+        self.assertEqual(ret, ((data,), {}))
+
+    def test_socket_exception_forwarding(self):
+        """Test the forwarding of an exception raised by the callback"""
+        call_cfg = addonconnector.CallConfig('callback_raise_exception', addon_id='plugin.transport.id',
+                                             timeout_secs=5)
+        with self.assertRaises(ValueError) as cm:
+            addonconnector.make_call(call_cfg, 'Test exception')
+        self.assertEqual(str(cm.exception), 'Test exception')
+
+    def test_socket_fallback(self):
+        """Test a call to a callback not registered, that fall back to Kodi JSON-RPC"""
+        call_cfg = addonconnector.CallConfig('callback_not_registered', addon_id='plugin.transport.id',
+                                             timeout_secs=1)
+        with self.assertRaises(addonconnector.WaitTimeoutError):
+            addonconnector.make_call(call_cfg)
+
+    def test_socket_fallback_not_threaded(self):
+        """Test a call to a callback not threaded, that fall back to Kodi JSON-RPC"""
+        call_cfg = addonconnector.CallConfig('callback_not_threaded', addon_id='plugin.transport.id',
+                                             timeout_secs=1)
+        with self.assertRaises(addonconnector.WaitTimeoutError):
+            addonconnector.make_call(call_cfg)
+
+    def test_socket_admission_limit(self):
+        """Test that the admission limits are applied to the calls received through the socket"""
+        call_cfg = addonconnector.CallConfig('callback_limited', addon_id='plugin.transport.id', timeout_secs=5)
+        self.assertTrue(addonconnector.make_call(call_cfg))
+        with self.assertRaises(addonconnector.CallThrottledError):
+            addonconnector.make_call(call_cfg)
+
+    def test_socket_connection_lost(self):
+        """Test a connection closed after the call has been sent, the call must not be sent again"""
+        import socket
+        import threading
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(transport.get_socket_path('plugin.lost.id'))
+        server.listen()
+
+        def close_after_receive():
+            conn, _ = server.accept()
+            # The whole call is received, otherwise the sender fails to send it and falls back to Kodi JSON-RPC
+            transport._recv_frame(conn)  # pylint: disable=protected-access
+            conn.close()
+
+        thread = threading.Thread(target=close_after_receive)
+        thread.start()
+        try:
+            with self.assertRaises(addonconnector.AddonConnectorException):
+                transport.make_socket_call('plugin.lost.id', 'callback_echo', 'pickle', 'pickle', b'data', 5,
+                                           lambda: False)
+        finally:
+            thread.join()
+            server.close()
+            os.remove(transport.get_socket_path('plugin.lost.id'))
+
+    def test_socket_stale_connection(self):
+        """Test that the pooled connections closed by the socket server are discarded"""
+        import socket
+        pool = transport.ConnectionPool()
+        sock, server_sock = socket.socketpair(socket.AF_UNIX)
+        pool.release('plugin.stale.id', sock)
+        server_sock.close()
+        self.assertIsNone(pool.get('plugin.stale.id'))
@@ -58,20 +58,35 @@ class Monitor:
         cls._instances -= dead
 
 
+# When set, the notifications are sent through a notification bus (see kodibus.py) instead of being delivered
+# synchronously to the Monitor instances of this process
+_notification_bus = None
+
+
+def set_notification_bus(bus):
+    """Set the notification bus used to send the notifications, None to deliver them synchronously"""
+    global _notification_bus  # pylint: disable=global-statement
+    _notification_bus = bus
+
+
 def executeJSONRPC(jsonrpccommand):
     """A reimplementation of the xbmc executeJSONRPC() function"""
     command = json.loads(jsonrpccommand)
 
     ret = dict(id=command.get('id'), jsonrpc='2.0', result='OK')
-    if command.get('method') == 'JSONRPC.NotifyAll':
+    if command.get('method') == 'JSONRPC.NotifyAll' and _notification_bus is not None:
+        _notification_bus.send(sender=command.get('params').get('sender'),
+                               method='Other.' + command.get('params').get('message'),
+                               data=json.dumps(command.get('params').get('data')))
+    elif command.get('method') == 'JSONRPC.NotifyAll':
         # Send a notification to all instances of subclasses
-        for sub in Monitor.__subclasses__():
-            for obj in sub.getinstances():
-                obj.onNotification(
-                    sender=command.get('params').get('sender'),
-                    method='Other.' + command.get('params').get('message'),
-                    data=json.dumps(command.get('params').get('data')),
-                )
+        # (the instances of all subclasses are tracked in the same set, then each instance must be notified once)
+        for obj in Monitor.getinstances():
+            obj.onNotification(
+                sender=command.get('params').get('sender'),
+                method='Other.' + command.get('params').get('message'),
+                data=json.dumps(command.get('params').get('data')),
+            )
     else:
         log("executeJSONRPC does not implement method '{method}'".format(**command), LOGERROR)
         return json.dumps(dict(error=dict(code=-1, message='Not implemented'), id=command.get('id'), jsonrpc='2.0'))
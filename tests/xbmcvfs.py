@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2021, Stefano Gottardo (@CastagnaIT)
+# GNU Lesser General Public License v2.1 or later (see LICENSE.txt)
+"""This file implements the Kodi xbmcvfs module, either using stubs or alternative functionality"""
+
+# pylint: disable=invalid-name
+import os
+import tempfile
+
+# The Kodi special paths are translated to a temporary folder
+SPECIAL_PATHS = {
+    'special://profile/': os.path.join(tempfile.gettempdir(), 'addonconnector_tests', 'userdata') + os.sep,
+    'special://temp/': os.path.join(tempfile.gettempdir(), 'addonconnector_tests', 'temp') + os.sep
+}
+
+
+def translatePath(path):
+    """A reimplementation of the xbmcvfs translatePath() function"""
+    for special_path, real_path in SPECIAL_PATHS.items():
+        if path.startswith(special_path):
+            return os.path.join(real_path, *path[len(special_path):].split('/'))
+    return path